@@ -1,48 +1,108 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, Response, current_app, render_template, request, jsonify, redirect, url_for, session, stream_with_context
 import sqlite3
+import itertools
+import json
 import os
-import subprocess
 import urllib.parse
 from werkzeug.utils import secure_filename
-from tests.test_runner import run_all_tests
-app = Flask(__name__)
-app.secret_key = os.urandom(24)  
-app.config['UPLOAD_FOLDER'] = 'static/images'
+import assets
+import db
+import cache
+import images
+import ingredients
+import live_index
+import passwords
+import profiling
+import fragments
+import recommender
+import restrictions
+import sessions
+import streaming
+import suggest
+import writes
+from cache import add_cache_tags, cached, conditional, get_cache, invalidate
+from db import close_db, get_db
+from fragments import CARD_FIELDS, render_cards
+from ingredients import MAX_QUERY_INGREDIENTS, get_ingredient_index, normalize_ingredient, parse_ingredients
+from migrations import upgrade_schema
+from passwords import get_password_hasher
+from restrictions import ALL_TAGS, get_restriction_index, tags_to_mask, user_mask
+from search import index_recipe, iter_search_recipes
+from sessions import auth_context, invalidate_auth_context, is_admin
+from ratings import check_rating_stats, rebuild_rating_stats
+from pagination import DEFAULT_LIMIT, LIST_FIELDS, SEARCH_FIELDS, decode_cursor, paginate, parse_fields, parse_limit, project, select_columns
+from streaming import stream_format, stream_rows
+from writes import submit_write
 DATABASE = 'database.db'
-ALL_TAGS = ['Vegetarian', 'Vegan', 'Gluten-Free', 'Dairy-Free']
+# Subsystems set up by create_app, in order. The test runner (jobs.py) is not
+# among them: it is imported by its routes the first time one is called.
+EXTENSIONS = (db, writes, sessions, passwords, cache, images, assets, profiling, recommender, live_index, restrictions, ingredients, suggest, streaming, fragments)
+# (rule, view, options) for every @route below, registered on each app create_app builds
+ROUTES = []
+# 'personal' ranks by the collaborative-filtering model and uses this column when a user has no model yet
+RECOMMENDED_SORTS = {'rating': 'avg_rating', 'score': 'weighted_score', 'personal': 'weighted_score'}
+# Routes address recipes by name; contains is keyed by recipe_id
+IN_COOKBOOK_QUERY = '''
+    SELECT fr.recipe_id FROM contains fr
+    JOIN recipe r ON r.recipe_id = fr.recipe_id
+    WHERE fr.CookBook_ID = ? AND r.recipe_name = ?
+'''
+ADD_TO_COOKBOOK_QUERY = 'INSERT INTO contains (CookBook_ID, recipe_id) VALUES (?, (SELECT recipe_id FROM recipe WHERE recipe_name = ?))'
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif'}
 
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+def route(rule, **options):
+    """Like ``app.route``, for the apps create_app builds later."""
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
 
-def init_db():
-    with app.app_context():
-        db = get_db_connection()
-        with open('setup.sql', 'r') as f:
-            db.cursor().executescript(f.read())
-        db.commit()
-        db.close()
 
-@app.route('/')
+def create_app(config=None):
+    """Build an app: settings from ``config`` over the defaults, extensions, then routes.
+
+    The database is left alone; init_db() (``flask init-db``) brings its schema up to date.
+    """
+    application = Flask(__name__)
+    application.config['UPLOAD_FOLDER'] = 'static/images'
+    # Test runs started from the dashboard point their child process at a scratch database
+    application.config['DATABASE'] = os.environ.get('TASTELY_DATABASE', DATABASE)
+    application.config.update(config or {})
+    for extension in EXTENSIONS:
+        extension.init_app(application)
+    for rule, view, options in ROUTES:
+        application.add_url_rule(rule, view_func=view, **options)
+    application.cli.command('init-db')(init_db_command)
+    application.cli.command('rebuild-rating-stats')(rebuild_rating_stats_command)
+    return application
+
+
+def init_db(application=None):
+    """Bring the app's database up to setup.sql; a no-op when its stored schema version is current."""
+    with (application or app).app_context():
+        upgrade_schema(get_db())
+
+@route('/')
 def index():
     return render_template('login.html')
 
-@app.route('/signup', methods=['GET', 'POST'])
+@route('/signup', methods=['GET', 'POST'])
 def signup():
     if request.method == 'POST':
         data = request.get_json()
         username = data['username']
         password = data['password']
         email = data['email']
-        conn = get_db_connection()
+        # Hashed before a pooled connection is checked out, so the KDF never holds one
+        password_hash = get_password_hasher().hash(password)
+        conn = get_db()
         try:
-            conn.execute('INSERT INTO account (username, email, password) VALUES (?, ?, ?)', (username, email, password))
+            conn.execute('INSERT INTO account (username, email, password) VALUES (?, ?, ?)',
+                         (username, email, password_hash))
             conn.commit()
 
             # Get the account ID of the newly created account
@@ -54,120 +114,177 @@ def signup():
 
         except sqlite3.IntegrityError:
             return jsonify({'success': False, 'message': 'Username or email already exists'}), 409
-        finally:
-            conn.close()
         return jsonify({'success': True, 'message': 'User created successfully'})
     return render_template('signup.html')
 
-@app.route('/login', methods=['POST'])
+@route('/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data['username']
     password = data['password']
-    conn = get_db_connection()
-    try:
-        user = conn.execute('SELECT * FROM account WHERE username = ? AND password = ?', (username, password)).fetchone()
-        if user:
-            session['user_id'] = user['id']
-            # Check if the user is an admin
-            admin_check = conn.execute('SELECT * FROM admin WHERE Account_ID = ?', (user['id'],)).fetchone()
-            session['is_admin'] = bool(admin_check)
-            return jsonify({'message': 'Login successful', 'redirect': url_for('dashboard')}), 200
-        else:
-            return jsonify({'message': 'Login failed'}), 401
-    finally:
-        conn.close()
+    user = get_db().execute('SELECT id, password FROM account WHERE username = ?', (username,)).fetchone()
+    # Back to the pool before the KDF runs, so slow logins cannot starve other requests of connections
+    close_db()
+    matched, new_hash = get_password_hasher().verify(user['password'] if user else None, password)
+    if matched:
+        if new_hash:
+            # Plaintext or an older cost; skipped if a concurrent login already replaced it
+            submit_write(lambda conn: conn.execute('UPDATE account SET password = ? WHERE id = ? AND password = ?',
+                                                   (new_hash, user['id'], user['password'])))
+        # A new session id at login, so one planted before it is worthless
+        session.regenerate()
+        session['user_id'] = user['id']
+        return jsonify({'message': 'Login successful', 'redirect': url_for('dashboard')}), 200
+    else:
+        return jsonify({'message': 'Login failed'}), 401
 
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.clear()
     return redirect(url_for('index'))
 
-@app.route('/api/recipes')
-def get_recipes():
-    search_query = request.args.get('search', '')
-    conn = get_db_connection()
-    try:
-        if search_query:
-            recipes = conn.execute('''
-                SELECT r.*, COALESCE(AVG(rates.user_rating), 0) as avg_rating
-                FROM recipe r
-                LEFT JOIN rates ON rates.recipe_name = r.recipe_name
-                WHERE r.recipe_name LIKE ?
-                GROUP BY r.recipe_name
-            ''', ('%' + search_query + '%',)).fetchall()
-        else:
-            recipes = conn.execute('''
-                SELECT r.*, COALESCE(AVG(rates.user_rating), 0) as avg_rating
-                FROM recipe r
-                LEFT JOIN rates ON rates.recipe_name = r.recipe_name
-                GROUP BY r.recipe_name
-            ''').fetchall()
-        recipes = [dict(recipe) for recipe in recipes]
-        return jsonify({'recipes': recipes})
-    finally:
-        conn.close()
+def query_string_key(*args, **kwargs):
+    return request.query_string.decode()
+
+
+def members_key(*args, **kwargs):
+    """Cache key for pages every logged-in user sees alike; one entry serves all of them."""
+    if 'user_id' not in session:
+        return None
+    return request.query_string.decode()
+
+
+def logged_in_key(*args, **kwargs):
+    """Cache key for pages that only depend on who is logged in."""
+    if 'user_id' not in session:
+        return None
+    return f"{session['user_id']}:{request.query_string.decode()}"
+
 
+def user_restrictions_for(user_id):
+    """The user's restrictions, from their cached auth context."""
+    return auth_context(user_id).restrictions
 
 
-@app.route('/dashboard', methods=['GET'])
+def listing_limit(stream):
+    """The ``limit=`` of a recipe listing, optional and uncapped when it is streamed."""
+    if stream:
+        return parse_limit(request.args.get('limit'), default=None, maximum=None)
+    return parse_limit(request.args.get('limit'))
+
+
+@route('/api/recipes')
+@conditional(lambda: (['recipes', 'ratings'], request.query_string))
+@cached(key=query_string_key, tags=['recipes'])
+def get_recipes():
+    search_query = request.args.get('search', '')
+    try:
+        fields = parse_fields(request.args.get('fields'), SEARCH_FIELDS if search_query else LIST_FIELDS)
+        stream = stream_format()
+        limit = listing_limit(stream)
+        after = decode_cursor(request.args.get('cursor'), 2 if search_query else 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # A stream reads to the end (LIMIT -1) unless limited; a page reads one extra row
+    fetch = (limit or -1) if stream else limit + 1
+    recipes, key = recipe_rows(get_db(), search_query, select_columns(fields), fetch, after)
+    if stream:
+        return stream_rows(recipes, fields, stream)
+    page, next_cursor = paginate(list(recipes), limit, key)
+    for recipe in page:
+        add_cache_tags('recipe:' + recipe['recipe_name'], 'ratings:' + recipe['recipe_name'])
+    return jsonify({'recipes': [project(recipe, fields) for recipe in page], 'next_cursor': next_cursor})
+
+
+def recipe_rows(conn, search_query, columns, fetch, after):
+    """Recipes after the cursor ``after``, at most ``fetch`` of them (-1 for all), and their cursor key.
+
+    With a search query they are ranked full-text matches over names,
+    descriptions, instructions and ingredients; otherwise every recipe in
+    recipe_id order.
+    """
+    if search_query:
+        rows = iter_search_recipes(conn, search_query, limit=fetch, after=after, columns=columns)
+        return rows, lambda row: (row['rank'], row['recipe_id'])
+    rows = conn.execute(f'''
+        SELECT {columns}, COALESCE(s.avg_rating, 0) as avg_rating
+        FROM recipe r
+        LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id
+        WHERE r.recipe_id > ?
+        ORDER BY r.recipe_id
+        LIMIT ?
+    ''', (after[0] if after else 0, fetch))
+    return rows, lambda row: (row['recipe_id'],)
+
+
+def card_page(template, recipes, next_cursor):
+    """``template`` with the first page of recipe cards, or with ``?partial=1`` just the cards for "Load more"."""
+    for recipe in recipes:
+        add_cache_tags('recipe:' + recipe['recipe_name'], 'ratings:' + recipe['recipe_name'])
+    cards = render_cards(recipes)
+    if request.args.get('partial'):
+        return render_template('_recipe_cards.html', cards=cards, next_cursor=next_cursor)
+    return render_template(template, cards=cards, next_cursor=next_cursor)
+
+
+
+@route('/dashboard', methods=['GET'])
+@cached(key=members_key, tags=['recipes'])
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('index'))  # Redirect to login page if user is not logged in
 
     search_query = request.args.get('search', '')
-    conn = get_db_connection()
     try:
-        if search_query:
-            # Use SQL LIKE to filter recipes by name
-            recipes = conn.execute('SELECT * FROM recipe WHERE recipe_name LIKE ?', ('%' + search_query + '%',)).fetchall()
-        else:
-            recipes = conn.execute('SELECT * FROM recipe').fetchall()
-        return render_template('dashboard.html', recipes=recipes)
-    finally:
-        conn.close()
+        after = decode_cursor(request.args.get('cursor'), 2 if search_query else 1)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # The first page of cards is rendered here; dashboard.js fetches later ones as HTML
+    recipes, key = recipe_rows(get_db(), search_query, select_columns(CARD_FIELDS), DEFAULT_LIMIT + 1, after)
+    page, next_cursor = paginate(list(recipes), DEFAULT_LIMIT, key)
+    return card_page('dashboard.html', page, next_cursor)
 
 
-@app.route('/settings')
+@route('/settings')
 def settings():
     if 'user_id' not in session:
         return redirect(url_for('index'))
     return render_template('settings.html')
 
 
-@app.route('/change_username', methods=['POST'])
+@route('/change_username', methods=['POST'])
 def change_username():
     new_username = request.form['username']
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'message': 'User not logged in'}), 403
     
-    conn = get_db_connection()
-    try:
+    def rename(conn):
+        # admin.admin_name references account.username with no ON UPDATE action, so an
+        # admin's row is taken out while the name changes and put back under the new one
+        was_admin = conn.execute('DELETE FROM admin WHERE Account_ID = ?', (user_id,)).rowcount
+
         # Update account table
         conn.execute('UPDATE account SET username = ? WHERE id = ?', (new_username, user_id))
-        conn.commit()
-        
-        # Check if the user is an admin and update the admin table
-        if conn.execute('SELECT Account_ID FROM admin WHERE Account_ID = ?', (user_id,)).fetchone():
-            conn.execute('UPDATE admin SET admin_name = ? WHERE Account_ID = ?', (new_username, user_id))
-            conn.commit()
 
+        if was_admin:
+            conn.execute('INSERT INTO admin (Account_ID, admin_name) VALUES (?, ?)', (user_id, new_username))
+
+    try:
+        submit_write(rename)
         response = {'message': 'Username successfully updated'}
         status_code = 200
-    except Exception as e:
-        conn.rollback()
+    except sqlite3.Error as e:
         response = {'message': 'Failed to update username', 'error': str(e)}
         status_code = 500
-    finally:
-        conn.close()
 
     return jsonify(response), status_code
 
 
 
-@app.route('/change_password', methods=['POST'])
+@route('/change_password', methods=['POST'])
 def change_password():
     current_password = request.form['current_password']
     new_password = request.form['new_password']
@@ -175,87 +292,77 @@ def change_password():
     if not user_id:
         return jsonify({'message': 'User not logged in'}), 403
 
-    conn = get_db_connection()
     try:
-        user = conn.execute('SELECT * FROM account WHERE id = ? AND password = ?', (user_id, current_password)).fetchone()
-        if user:
-            conn.execute('UPDATE account SET password = ? WHERE id = ?', (new_password, user_id))
-            conn.commit()
+        user = get_db().execute('SELECT password FROM account WHERE id = ?', (user_id,)).fetchone()
+        close_db()
+        if user and get_password_hasher().verify(user['password'], current_password)[0]:
+            new_hash = get_password_hasher().hash(new_password)
+            submit_write(lambda conn: conn.execute('UPDATE account SET password = ? WHERE id = ?', (new_hash, user_id)))
             response = {'message': 'Password successfully updated'}
             status_code = 200
         else:
             response = {'message': 'Current password is incorrect'}
             status_code = 401
-    except Exception as e:
-        conn.rollback()
+    except sqlite3.Error as e:
         response = {'message': 'Failed to update password', 'error': str(e)}
         status_code = 500
-    finally:
-        conn.close()
 
     return jsonify(response), status_code
 
-@app.route('/change_email', methods=['POST'])
+@route('/change_email', methods=['POST'])
 def change_email():
     email = request.form['email']
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'message': 'User not logged in'}), 403
 
-    conn = get_db_connection()
     try:
-        conn.execute('UPDATE account SET email = ? WHERE id = ?', (email, user_id))
-        conn.commit()
+        submit_write(lambda conn: conn.execute('UPDATE account SET email = ? WHERE id = ?', (email, user_id)))
         response = {'message': 'Email successfully updated'}
         status_code = 200
-    except Exception as e:
-        conn.rollback()
+    except sqlite3.Error as e:
         response = {'message': 'Failed to update email', 'error': str(e)}
         status_code = 500
-    finally:
-        conn.close()
 
     return jsonify(response), status_code
 
-@app.route('/update_security_key', methods=['POST'])
+@route('/update_security_key', methods=['POST'])
 def update_security_key():
     security_key = request.form['security_key']
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'message': 'User not logged in'}), 403
 
+    def grant_admin(conn):
+        # First check if the user is already an admin
+        if conn.execute('SELECT Account_ID FROM admin WHERE Account_ID = ?', (user_id,)).fetchone():
+            return 'admin'
+        # Fetch username from the account table
+        user_info = conn.execute('SELECT username FROM account WHERE id = ?', (user_id,)).fetchone()
+        if not user_info:
+            return None
+        # Insert into admin table including username
+        conn.execute('INSERT INTO admin (Account_ID, admin_name) VALUES (?, ?)', (user_id, user_info['username']))
+        # Remove the account from the users table
+        conn.execute('DELETE FROM users WHERE Account_ID = ?', (user_id,))
+        return 'granted'
+
     if security_key == 'admin':
-        conn = get_db_connection()
         try:
-            # First check if the user is already an admin
-            admin_check = conn.execute('SELECT Account_ID FROM admin WHERE Account_ID = ?', (user_id,)).fetchone()
-            if not admin_check:
-                # Fetch username from the account table
-                user_info = conn.execute('SELECT username FROM account WHERE id = ?', (user_id,)).fetchone()
-                if user_info:
-                    username = user_info['username']
-                    # Insert into admin table including username
-                    conn.execute('INSERT INTO admin (Account_ID, admin_name) VALUES (?, ?)', (user_id, username))
-                    conn.commit()
-
-                    # Remove the account from the users table
-                    conn.execute('DELETE FROM users WHERE Account_ID = ?', (user_id,))
-                    conn.commit()
-
-                    response = {'message': 'User granted admin privileges. Sign in to view changes.'}
-                else:
-                    response = {'message': 'User not found'}
-                    status_code = 404
-                    return jsonify(response), status_code
+            outcome = submit_write(grant_admin)
+            if outcome is None:
+                response = {'message': 'User not found'}
+                status_code = 404
+                return jsonify(response), status_code
+            if outcome == 'granted':
+                invalidate_auth_context(user_id)
+                response = {'message': 'User granted admin privileges.'}
             else:
                 response = {'message': 'User already has admin privileges'}
             status_code = 200
-        except Exception as e:
-            conn.rollback()
+        except sqlite3.Error as e:
             response = {'message': 'Failed to grant admin privileges', 'error': str(e)}
             status_code = 500
-        finally:
-            conn.close()
     else:
         response = {'message': 'Invalid security key'}
         status_code = 400
@@ -263,65 +370,70 @@ def update_security_key():
     return jsonify(response), status_code
 
 
-@app.route('/update_diet_restrictions', methods=['POST'])
+@route('/update_diet_restrictions', methods=['POST'])
 def update_diet_restrictions():
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'message': 'User not logged in'}), 403
 
     restrictions = request.form.getlist('diet[]')  # This captures all checked boxes
-    conn = get_db_connection()
-    try:
+
+    def replace_restrictions(conn):
         # Clear existing restrictions for simplicity, or check and update
         conn.execute('DELETE FROM user_restrictions WHERE User_ID = ?', (user_id,))
-        for restriction in restrictions:
-            conn.execute('INSERT INTO user_restrictions (User_ID, UserRestriction) VALUES (?, ?)', (user_id, restriction))
-        conn.commit()
+        conn.executemany('INSERT INTO user_restrictions (User_ID, UserRestriction) VALUES (?, ?)',
+                         [(user_id, restriction) for restriction in restrictions])
+
+    try:
+        submit_write(replace_restrictions)
+        invalidate_auth_context(user_id)
+        invalidate(f'user:{user_id}')
         response = {'message': 'Dietary restrictions updated successfully'}
         status_code = 200
-    except Exception as e:
-        conn.rollback()
+    except sqlite3.Error as e:
         response = {'message': 'Failed to update dietary restrictions', 'error': str(e)}
         status_code = 500
-    finally:
-        conn.close()
 
     return jsonify(response), status_code
 
-@app.route('/delete_account', methods=['POST'])
+@route('/delete_account', methods=['POST'])
 def delete_account():
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'message': 'User not logged in'}), 403
 
-    conn = get_db_connection()
-    try:
+    def delete(conn):
         # Delete account from admin table (if it exists)
         conn.execute('DELETE FROM admin WHERE Account_ID = ?', (user_id,))
-        
+
         # Delete account from users table
         conn.execute('DELETE FROM users WHERE Account_ID = ?', (user_id,))
-        
+
         # Delete corresponding rows from user_restrictions table
         conn.execute('DELETE FROM user_restrictions WHERE User_ID = ?', (user_id,))
-        
+
         #Delete Cookbook
         conn.execute('DELETE FROM cookbook WHERE CookBook_ID = ?', (user_id,))
 
+        # Keep the user's recipes, and everyone's ratings and cookbook entries for them. Databases
+        # created before setup.sql said ON DELETE SET NULL would cascade the account delete to them.
+        conn.execute('UPDATE recipe SET UserID = NULL WHERE UserID = ?', (user_id,))
+
         # Delete account from account table
         conn.execute('DELETE FROM account WHERE id = ?', (user_id,))
 
-        
-        conn.commit()
+    try:
+        submit_write(delete)
+        # The user's recipes no longer have an author
+        invalidate(f'user:{user_id}', 'recipes')
+        invalidate_auth_context(user_id)
+        session.clear()
         
         response = {'message': 'Account deleted successfully'}
         status_code = 200
-    except Exception as e:
-        conn.rollback()
+    except sqlite3.Error as e:
         response = {'message': 'Failed to delete account', 'error': str(e)}
         status_code = 500
-    finally:
-        conn.close()
 
     return jsonify(response), status_code
 
@@ -329,12 +441,13 @@ def delete_account():
 def slugify(text):
     """Create a URL slug from the recipe name."""
     return urllib.parse.quote_plus(text.lower().replace(" ", "-"))
-@app.route('/create-recipe', methods=['GET', 'POST'])
+@route('/create-recipe', methods=['GET', 'POST'])
 def create_recipe():
     if 'user_id' not in session:
         return redirect(url_for('index'))
 
-    conn = get_db_connection()
+    conn = get_db()
+    image = None
     try:
         if request.method == 'POST':
             recipe_name = request.form['recipe_name']
@@ -350,31 +463,32 @@ def create_recipe():
             file = request.files['recipe_image']
             filename = secure_filename(file.filename) if file else None
             if filename and allowed_file(filename):
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-            else:
-                file_path = None  
+                image = images.store_upload(file, current_app.config['UPLOAD_FOLDER'])
+            file_path = image.path if image else None
+            image_key = image.key if image and image.ready else None
 
+            # One transaction. The full-text row is taken out while the ingredients
+            # go in, so ingredients_fts_insert has nothing to rewrite per ingredient,
+            # and is written once they are all there.
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO recipe (recipe_name, recipe_description, Cuisine_ID, UserID, prep_time, cook_time, recipe_image, instructions)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (recipe_name, description, cuisine_type, user_id, prep_time, cook_time, file_path, instructions))
-
-            ingredient_list = ingredients.split(',')
-            for ingredient in ingredient_list:
-                cursor.execute('''
-                    INSERT INTO ingredients (recipe_name, ingredient_name)
-                    VALUES (?, ?)
-                ''', (recipe_name, ingredient.strip()))
-
-            for tag in tags:
-                cursor.execute('''
-                    INSERT INTO recipe_restrictions (recipe_name, RecRestriction)
-                    VALUES (?, ?)
-                ''', (recipe_name, tag))
+            recipe_id = cursor.execute('''
+                INSERT INTO recipe (recipe_name, recipe_description, Cuisine_ID, UserID, prep_time, cook_time, recipe_image, image_key, instructions, restriction_mask)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (recipe_name, description, cuisine_type, user_id, prep_time, cook_time, file_path, image_key, instructions, tags_to_mask(tags))).lastrowid
+            cursor.execute('DELETE FROM recipe_fts WHERE rowid = ?', (recipe_id,))
+            cursor.executemany('''
+                INSERT INTO ingredients (recipe_id, ingredient_name, ingredient_key)
+                VALUES (?, ?, ?)
+            ''', [(recipe_id, name, key) for name, key in parse_ingredients(ingredients)])
+            cursor.executemany('''
+                INSERT INTO recipe_restrictions (recipe_id, RecRestriction)
+                VALUES (?, ?)
+            ''', [(recipe_id, tag) for tag in dict.fromkeys(tags)])
+            index_recipe(conn, recipe_id)
 
             conn.commit()
+            invalidate('recipes')
+            images.schedule(current_app._get_current_object(), image)
             return redirect(url_for('view_recipe', slug=recipe_name))  # Redirect to the view recipe page
         else:
             # Fetch all available cuisines to populate the dropdown
@@ -382,102 +496,100 @@ def create_recipe():
             return render_template('create_recipe.html', cuisines=cuisines)
     except sqlite3.IntegrityError as e:
         conn.rollback()
+        images.discard(image)
         return jsonify({'error': 'Failed to insert recipe into database', 'details': str(e)}), 500
-    finally:
-        conn.close()
-@app.route('/recipe/<slug>')
+def recipe_validators(slug):
+    name = slug.replace("-", " ")
+    return ['recipe:' + name, 'ratings:' + name], (session.get('user_id'), is_admin())
+
+
+@route('/recipe/<slug>')
+@conditional(recipe_validators)
+@cached(key=lambda slug: f"{slug}:{session.get('user_id')}:{is_admin()}",
+        tags=lambda slug: ['recipe:' + slug.replace("-", " "), 'ratings:' + slug.replace("-", " ")])
 def view_recipe(slug):
-    conn = get_db_connection()
-    try:
-        recipe_title = slug.replace("-", " ")
-        recipe = conn.execute('SELECT * FROM recipe WHERE recipe_name = ?', (recipe_title,)).fetchone()
-        ingredients = conn.execute('SELECT ingredient_name FROM ingredients WHERE recipe_name = ?', (recipe_title,)).fetchall()
-        tags = conn.execute('SELECT RecRestriction FROM recipe_restrictions WHERE recipe_name = ?', (recipe_title,)).fetchall()
-
-        # Fetch average rating and count of ratings, ensuring avg_rating is treated as a float
-        rating_result = conn.execute('SELECT AVG(user_rating) AS avg_rating, COUNT(*) AS rating_count FROM rates WHERE recipe_name = ?', (recipe_title,)).fetchone()
-        avg_rating = float(rating_result['avg_rating']) if rating_result['avg_rating'] is not None else 0
-        rating_count = rating_result['rating_count']
-
-        if recipe:
-            return render_template('recipe.html', recipe=recipe, ingredients=ingredients, tags=tags, avg_rating=avg_rating, rating_count=rating_count)
-        else:
-            return 'Recipe not found', 404
-    finally:
-        conn.close()
+    conn = get_db()
+    recipe_title = slug.replace("-", " ")
+    recipe = conn.execute('SELECT * FROM recipe WHERE recipe_name = ?', (recipe_title,)).fetchone()
+    if not recipe:
+        return 'Recipe not found', 404
+    ingredients = conn.execute('SELECT ingredient_name FROM ingredients WHERE recipe_id = ?', (recipe['recipe_id'],)).fetchall()
+    tags = conn.execute('SELECT RecRestriction FROM recipe_restrictions WHERE recipe_id = ?', (recipe['recipe_id'],)).fetchall()
+
+    # Average rating and count of ratings come from the running totals in recipe_rating_stats
+    rating_result = conn.execute('SELECT avg_rating, rating_count FROM recipe_rating_stats WHERE recipe_id = ?',
+                                 (recipe['recipe_id'],)).fetchone()
+    avg_rating = rating_result['avg_rating'] if rating_result else 0
+    rating_count = rating_result['rating_count'] if rating_result else 0
+
+    return render_template('recipe.html', recipe=recipe, ingredients=ingredients, tags=tags, avg_rating=avg_rating, rating_count=rating_count)
 
 
-@app.route('/delete-recipe/<recipe_name>', methods=['DELETE'])
+@route('/delete-recipe/<recipe_name>', methods=['DELETE'])
 def delete_recipe(recipe_name):
     if 'user_id' not in session:
         return jsonify({'message': 'User not logged in'}), 403
 
-    conn = get_db_connection()
+    conn = get_db()
     recipe = conn.execute('SELECT * FROM recipe WHERE recipe_name = ?', (recipe_name,)).fetchone()
+    if recipe is None:
+        return jsonify({'message': 'Recipe not found'}), 404
 
     # Check if the user is the recipe creator or an admin
-    if session['user_id'] == recipe['UserID'] or session.get('is_admin'):
+    if session['user_id'] == recipe['UserID'] or is_admin():
         try:
+            # Ingredients, restrictions, ratings and cookbook entries cascade
             conn.execute('DELETE FROM recipe WHERE recipe_name = ?', (recipe_name,))
             conn.commit()
-            conn.execute('DELETE FROM recipe_restrictions WHERE recipe_name = ?', (recipe_name,))
-            conn.commit()
-
-            conn.execute('DELETE FROM rates WHERE recipe_name = ?', (recipe_name,))
-            conn.commit()
-            conn.execute('DELETE FROM contains WHERE recipe_name = ?', (recipe_name,))
-            conn.commit()
-            conn.execute('DELETE FROM ingredients WHERE recipe_name = ?', (recipe_name,))
-            conn.commit()
-            conn.execute('DELETE FROM rates WHERE recipe_name = ?', (recipe_name,))
-            conn.commit()
+            invalidate('recipe:' + recipe_name, 'ratings:' + recipe_name, 'recipes')
             response = {'message': 'Recipe deleted successfully'}
             status_code = 200
         except Exception as e:
             conn.rollback()
             response = {'message': 'Failed to delete recipe', 'error': str(e)}
             status_code = 500
-        finally:
-            conn.close()
         return jsonify(response), status_code
     else:
-        conn.close()
         return jsonify({'message': 'Unauthorized'}), 401
 
-@app.route('/edit-recipe/<slug>', methods=['GET', 'POST'])
+@route('/edit-recipe/<slug>', methods=['GET', 'POST'])
 def edit_recipe(slug):
-    conn = get_db_connection()
-    try:
-        recipe = conn.execute('SELECT * FROM recipe WHERE recipe_name = ?', (slug.replace("-", " "),)).fetchone()
-        if not recipe:
-            return 'Recipe not found', 404
-
-        # Fetch all cuisines and tags
-        cuisines = conn.execute('SELECT * FROM cuisine').fetchall()
-        recipe_tags = conn.execute('SELECT RecRestriction FROM recipe_restrictions WHERE recipe_name = ?', (slug.replace("-", " "),)).fetchall()
-        recipe_tags = [tag['RecRestriction'] for tag in recipe_tags]
+    conn = get_db()
+    recipe = conn.execute('SELECT * FROM recipe WHERE recipe_name = ?', (slug.replace("-", " "),)).fetchone()
+    if not recipe:
+        return 'Recipe not found', 404
 
-        if 'user_id' not in session or (session['user_id'] != recipe['UserID'] and not session.get('is_admin')):
-            return redirect(url_for('index'))
+    # Fetch all cuisines and tags
+    cuisines = conn.execute('SELECT * FROM cuisine').fetchall()
+    recipe_tags = conn.execute('SELECT RecRestriction FROM recipe_restrictions WHERE recipe_id = ?', (recipe['recipe_id'],)).fetchall()
+    recipe_tags = [tag['RecRestriction'] for tag in recipe_tags]
 
-        if request.method == 'POST':
-            # Gather form data including the selected cuisine from dropdown
-            description = request.form['description']
-            prep_time = request.form['prep_time']
-            cook_time = request.form['cook_time']
-            ingredients = request.form['ingredients']
-            instructions = request.form['instructions']
-            cuisine_type = request.form['cuisine_type']
-            tags = request.form.getlist('tags[]')
-
-            file = request.files['recipe_image']
-            filename = secure_filename(file.filename) if file else None
-            file_path = recipe['recipe_image']
-            if filename and allowed_file(filename):
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
+    if 'user_id' not in session or (session['user_id'] != recipe['UserID'] and not is_admin()):
+        return redirect(url_for('index'))
 
-            # Update the database
+    if request.method == 'POST':
+        # Gather form data including the selected cuisine from dropdown
+        description = request.form['description']
+        prep_time = request.form['prep_time']
+        cook_time = request.form['cook_time']
+        ingredients = request.form['ingredients']
+        instructions = request.form['instructions']
+        cuisine_type = request.form['cuisine_type']
+        tags = request.form.getlist('tags[]')
+
+        file = request.files['recipe_image']
+        filename = secure_filename(file.filename) if file else None
+        file_path = recipe['recipe_image']
+        image_key = recipe['image_key']
+        image = None
+        if filename and allowed_file(filename):
+            image = images.store_upload(file, current_app.config['UPLOAD_FOLDER'])
+        if image:
+            file_path = image.path
+            image_key = image.key if image.ready else None
+
+        # Update the database
+        try:
             conn.execute('''
                 UPDATE recipe SET
                 recipe_description = ?,
@@ -485,73 +597,74 @@ def edit_recipe(slug):
                 prep_time = ?,
                 cook_time = ?,
                 recipe_image = ?,
-                instructions = ?
+                image_key = ?,
+                instructions = ?,
+                restriction_mask = ?
                 WHERE recipe_name = ?
-            ''', (description, cuisine_type, prep_time, cook_time, file_path, instructions, slug.replace("-", " ")))
+            ''', (description, cuisine_type, prep_time, cook_time, file_path, image_key, instructions, tags_to_mask(tags), slug.replace("-", " ")))
 
-            conn.execute('DELETE FROM recipe_restrictions WHERE recipe_name = ?', (slug.replace("-", " "),))
-            for tag in tags:
-                conn.execute('INSERT INTO recipe_restrictions (recipe_name, RecRestriction) VALUES (?, ?)', (slug.replace("-", " "), tag))
+            conn.execute('DELETE FROM recipe_restrictions WHERE recipe_id = ?', (recipe['recipe_id'],))
+            conn.executemany('INSERT INTO recipe_restrictions (recipe_id, RecRestriction) VALUES (?, ?)',
+                             [(recipe['recipe_id'], tag) for tag in dict.fromkeys(tags)])
 
             conn.commit()
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            images.discard(image)
+            return jsonify({'error': 'Failed to update recipe in database', 'details': str(e)}), 500
+        invalidate('recipe:' + slug.replace("-", " "), 'recipes')
+        images.schedule(current_app._get_current_object(), image)
 
-            # Redirect to the view recipe page
-            return redirect(url_for('view_recipe', slug=slug.replace(" ", "-")))
-        else:
-            ingredients = [ingredient['ingredient_name'] for ingredient in conn.execute('SELECT ingredient_name FROM ingredients WHERE recipe_name = ?', (slug.replace("-", " "),)).fetchall()]
-            return render_template('edit_recipe.html', recipe=recipe, ingredients=ingredients, cuisines=cuisines, all_tags=ALL_TAGS, recipe_tags=recipe_tags)
-    finally:
-        conn.close()
+        # Redirect to the view recipe page
+        return redirect(url_for('view_recipe', slug=slug.replace(" ", "-")))
+    else:
+        ingredients = [ingredient['ingredient_name'] for ingredient in conn.execute('SELECT ingredient_name FROM ingredients WHERE recipe_id = ?', (recipe['recipe_id'],)).fetchall()]
+        return render_template('edit_recipe.html', recipe=recipe, ingredients=ingredients, cuisines=cuisines, all_tags=ALL_TAGS, recipe_tags=recipe_tags)
 
 
-@app.route('/save-to-cookbook/<recipe_name>', methods=['POST'])
+@route('/save-to-cookbook/<recipe_name>', methods=['POST'])
 def save_to_cookbook(recipe_name):
     if 'user_id' not in session:
         return jsonify({'message': 'You must be logged in to save recipes.'}), 401
 
     user_id = session['user_id']
-    conn = get_db_connection()
-    try:
-        # Check if the user already has a cookbook entry
-        cookbook_id = conn.execute('SELECT CookBook_ID FROM cookbook WHERE CookBook_ID = ?', (user_id,)).fetchone()
-        if not cookbook_id:
-            # Create a cookbook entry if it does not exist
-            conn.execute('INSERT INTO cookbook (CookBook_ID) VALUES (?)', (user_id,))
+
+    def save(conn):
+        # Ensure the user has a cookbook entry
+        conn.execute('INSERT OR IGNORE INTO cookbook (CookBook_ID) VALUES (?)', (user_id,))
 
         # Check if the recipe is already saved
-        exists = conn.execute('SELECT 1 FROM contains WHERE CookBook_ID = ? AND recipe_name = ?', (user_id, recipe_name)).fetchone()
-        if exists:
-            return jsonify({'message': 'Recipe already in cookbook.'}), 409
+        if conn.execute(IN_COOKBOOK_QUERY, (user_id, recipe_name)).fetchone():
+            return False
 
         # Save the recipe into the contains table
-        conn.execute('INSERT INTO contains (CookBook_ID, recipe_name) VALUES (?, ?)', (user_id, recipe_name))
-        conn.commit()
+        conn.execute(ADD_TO_COOKBOOK_QUERY, (user_id, recipe_name))
+        return True
+
+    try:
+        if not submit_write(save):
+            return jsonify({'message': 'Recipe already in cookbook.'}), 409
+        invalidate(f'user:{user_id}')
         return jsonify({'message': 'Recipe saved to your cookbook!'}), 200
     except sqlite3.IntegrityError as e:
-        conn.rollback()
         return jsonify({'message': 'Failed to save recipe.', 'error': str(e)}), 500
-    finally:
-        conn.close()
 
-@app.route('/cookbook')
+@route('/cookbook')
+@cached(key=logged_in_key, tags=lambda: [f"user:{session['user_id']}", 'recipes'])
 def cookbook():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
     user_id = session['user_id']
-    conn = get_db_connection()
-    try:
-        recipes = conn.execute('''
-            SELECT r.* FROM recipe r
-            WHERE r.UserID = ? 
-            UNION
-            SELECT r.* FROM recipe r
-            JOIN contains fr ON REPLACE(fr.recipe_name, '-', ' ') = r.recipe_name
-            JOIN cookbook c ON fr.CookBook_ID = c.CookBook_ID
-            WHERE c.CookBook_ID = ?
-        ''', (user_id, user_id)).fetchall()
-    finally:
-        conn.close()
+    conn = get_db()
+    recipes = conn.execute('''
+        SELECT r.* FROM recipe r
+        WHERE r.UserID = ? 
+        UNION
+        SELECT r.* FROM recipe r
+        JOIN contains fr ON fr.recipe_id = r.recipe_id
+        WHERE fr.CookBook_ID = ?
+    ''', (user_id, user_id)).fetchall()
 
     return render_template('cookbook.html', recipes=recipes)
 
@@ -559,49 +672,54 @@ def cookbook():
 
 
 
-@app.route('/toggle-cookbook/<recipe_name>', methods=['POST'])
+@route('/toggle-cookbook/<recipe_name>', methods=['POST'])
 def toggle_cookbook(recipe_name):
     if 'user_id' not in session:
         return jsonify({'message': 'You must be logged in to manage recipes.'}), 401
 
     user_id = session['user_id']
-    conn = get_db_connection()
-    try:
+
+    def toggle(conn):
         # Ensure the user has a cookbook entry
         conn.execute('INSERT OR IGNORE INTO cookbook (CookBook_ID) VALUES (?)', (user_id,))
 
         # Check if the recipe is already saved
-        exists = conn.execute('SELECT 1 FROM contains WHERE CookBook_ID = ? AND recipe_name = ?', (user_id, recipe_name)).fetchone()
+        exists = conn.execute(IN_COOKBOOK_QUERY, (user_id, recipe_name)).fetchone()
         if exists:
             # Delete the recipe from the cookbook
-            conn.execute('DELETE FROM contains WHERE CookBook_ID = ? AND recipe_name = ?', (user_id, recipe_name))
-            message = 'Recipe removed from your cookbook.'
-        else:
-            # Save the recipe into the cookbook
-            conn.execute('INSERT INTO contains (CookBook_ID, recipe_name) VALUES (?, ?)', (user_id, recipe_name))
-            message = 'Recipe saved to your cookbook!'
+            conn.execute('DELETE FROM contains WHERE CookBook_ID = ? AND recipe_id = ?', (user_id, exists['recipe_id']))
+            return 'Recipe removed from your cookbook.'
+        # Save the recipe into the cookbook
+        conn.execute(ADD_TO_COOKBOOK_QUERY, (user_id, recipe_name))
+        return 'Recipe saved to your cookbook!'
 
-        conn.commit()
+    try:
+        message = submit_write(toggle)
+        invalidate(f'user:{user_id}')
         return jsonify({'message': message}), 200
     except sqlite3.IntegrityError as e:
-        conn.rollback()
         return jsonify({'message': 'Failed to update cookbook.', 'error': str(e)}), 500
-    finally:
-        conn.close()
 
-@app.route('/check-cookbook/<recipe_name>')
+def cookbook_check_validators(recipe_name):
+    if 'user_id' not in session:
+        return None
+    user_id = session['user_id']
+    return [f'user:{user_id}', 'recipe:' + recipe_name], user_id
+
+
+@route('/check-cookbook/<recipe_name>')
+@conditional(cookbook_check_validators)
 def check_cookbook(recipe_name):
     if 'user_id' not in session:
         return jsonify({'in_cookbook': False}), 200
 
     user_id = session['user_id']
-    conn = get_db_connection()
-    exists = conn.execute('SELECT 1 FROM contains WHERE CookBook_ID = ? AND recipe_name = ?', (user_id, recipe_name)).fetchone()
-    conn.close()
+    conn = get_db()
+    exists = conn.execute(IN_COOKBOOK_QUERY, (user_id, recipe_name)).fetchone()
     return jsonify({'in_cookbook': bool(exists)}), 200
 
 
-@app.route('/rate-recipe', methods=['POST'])
+@route('/rate-recipe', methods=['POST'])
 def rate_recipe():
     if 'user_id' not in session:
         return jsonify({'error': 'You must be logged in to rate recipes.'}), 401
@@ -609,94 +727,341 @@ def rate_recipe():
     data = request.get_json()
     recipe_name = data['recipe_name']
     rating = data['rating']
-    
+    user_id = session['user_id']
+
+    def rate(conn):
+        # Upsert as an UPDATE so the rating stats triggers swap the old rating for the new one
+        conn.execute('''
+            INSERT INTO rates (User_ID, recipe_id, user_rating)
+            VALUES (?, (SELECT recipe_id FROM recipe WHERE recipe_name = ?), ?)
+            ON CONFLICT (User_ID, recipe_id) DO UPDATE SET user_rating = excluded.user_rating
+        ''', (user_id, recipe_name, rating))
+
     try:
-        conn = get_db_connection()
-        conn.execute('INSERT OR REPLACE INTO rates (User_ID, recipe_name, user_rating) VALUES (?, ?, ?)', 
-                     (session['user_id'], recipe_name, rating))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
+        submit_write(rate)
+        invalidate('ratings:' + recipe_name, 'ratings')
+        recommender.get_recommender().rating_changed(user_id)
+    except sqlite3.Error as e:
         return jsonify({'error': 'Failed to rate recipe', 'details': str(e)}), 500
-    finally:
-        conn.close()
     return jsonify({'message': 'Rating updated successfully'}), 200
 
 
-@app.route('/api/recommended')
+def recommended_key():
+    """Users with the same restrictions share recommendation pages, unless they are personal."""
+    if 'user_id' not in session:
+        return None
+    if request.args.get('sort') == 'personal':
+        return f"user:{session['user_id']}:{request.query_string.decode()}"
+    restrictions = sorted(user_restrictions_for(session['user_id']))
+    return f"{','.join(restrictions)}:{request.query_string.decode()}"
+
+
+def recommended_validators():
+    if 'user_id' not in session:
+        return None
+    user_id = session['user_id']
+    return ['recipes', 'ratings', 'recommendations', f'user:{user_id}'], (user_id, request.query_string)
+
+
+def recommended_tags():
+    if request.args.get('sort') == 'personal':
+        return ['recipes', 'ratings', 'recommendations', f"user:{session.get('user_id')}"]
+    return ['recipes', 'ratings']
+
+
+@route('/api/recommended')
+@conditional(recommended_validators)
+@cached(key=recommended_key, tags=recommended_tags)
 def recommended_recipes():
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'You must be logged in to view recommendations.'}), 401
 
-    conn = get_db_connection()
+    sort = request.args.get('sort', 'rating')
+    if sort not in RECOMMENDED_SORTS:
+        return jsonify({'error': 'sort must be one of: ' + ', '.join(RECOMMENDED_SORTS)}), 400
+    size, cursor_key = recommended_cursor(sort)
     try:
-        user_restrictions = conn.execute('SELECT UserRestriction FROM user_restrictions WHERE User_ID = ?', (user_id,)).fetchall()
-        user_restrictions = [row['UserRestriction'] for row in user_restrictions]
-
-        if 'None' in user_restrictions:
-            # If 'None' is among user restrictions, return all recipes
-            recipes = conn.execute('''
-                SELECT r.*, COALESCE(AVG(ra.user_rating), 0) as avg_rating
-                FROM recipe r
-                LEFT JOIN rates ra ON ra.recipe_name = r.recipe_name
-                GROUP BY r.recipe_name
-                ORDER BY avg_rating DESC
-            ''').fetchall()
-        elif user_restrictions:
-            placeholders = ','.join('?' for _ in user_restrictions)
-            query = f'''
-                SELECT DISTINCT r.*, COALESCE(AVG(ra.user_rating), 0) as avg_rating
-                FROM recipe r
-                JOIN recipe_restrictions rr ON r.recipe_name = rr.recipe_name
-                LEFT JOIN rates ra ON ra.recipe_name = r.recipe_name
-                WHERE rr.RecRestriction IN ({placeholders})
-                AND r.recipe_name IN (
-                    SELECT r2.recipe_name
-                    FROM recipe r2
-                    JOIN recipe_restrictions rr2 ON r2.recipe_name = rr2.recipe_name
-                    WHERE rr2.RecRestriction IN ({placeholders})
-                    GROUP BY r2.recipe_name
-                    HAVING COUNT(*) = {len(user_restrictions)}
-                )
-                GROUP BY r.recipe_name
-                ORDER BY avg_rating DESC
-            '''
-            recipes = conn.execute(query, user_restrictions + user_restrictions).fetchall()
-        else:
-            recipes = conn.execute('''
-                SELECT r.*, COALESCE(AVG(ra.user_rating), 0) as avg_rating
-                FROM recipe r
-                LEFT JOIN rates ra ON ra.recipe_name = r.recipe_name
-                GROUP BY r.recipe_name
-                ORDER BY avg_rating DESC
-            ''').fetchall()
+        fields = parse_fields(request.args.get('fields'))
+        stream = stream_format()
+        limit = listing_limit(stream)
+        after = decode_cursor(request.args.get('cursor'), size)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    recipes = recommended_rows(get_db(), user_id, sort, fields, (limit or -1) if stream else limit + 1, after)
+    if stream:
+        return stream_rows(recipes, fields, stream)
+    page, next_cursor = paginate(list(recipes), limit, cursor_key)
+    return jsonify({'recipes': [project(recipe, fields) for recipe in page], 'next_cursor': next_cursor})
+
+
+def recommended_cursor(sort):
+    """Size and key function of the cursor for ``sort``.
+
+    'personal' lists the model's picks and then every other recipe, so its
+    cursor also records which of the two parts the row came from.
+    """
+    if sort == 'personal':
+        return 3, lambda row: (row['phase'], row['sort_key'], row['recipe_id'])
+    return 2, lambda row: (row['sort_key'], row['recipe_id'])
+
+
+def recommended_rows(conn, user_id, sort, fields, fetch, after):
+    """The user's recommendations after the cursor ``after``, best first, at most ``fetch`` of them (-1 for all).
+
+    Rows carry ``sort_key``, the score their cursor is built from. With
+    'personal' the recipes the model scored for the user come first
+    (``phase`` 0), then every other recipe that passes the restrictions by
+    weighted score (``phase`` 1), so the listing is as complete as the others.
+    """
+    sort_column = RECOMMENDED_SORTS[sort]
+    user_restrictions = user_restrictions_for(user_id)
+
+    # If 'None' is among user restrictions, or there are none, return all recipes
+    wanted = user_mask(user_restrictions)
+    conditions, params = [], []
+    if wanted:
+        # Only recipes tagged with every one of the user's restrictions
+        conditions.append('(r.restriction_mask & ?) = ?')
+        params += [wanted, wanted]
+    elif wanted is None:
+        # Restrictions outside ALL_TAGS have no bit, so match them against the tag rows.
+        # The unary + stops SQLite from scanning the whole table in recipe_id order
+        # to group; the tag index finds the rows and a temp B-tree groups them.
+        placeholders = ','.join('?' for _ in user_restrictions)
+        conditions.append(f'''r.recipe_id IN (
+                SELECT recipe_id
+                FROM recipe_restrictions
+                WHERE RecRestriction IN ({placeholders})
+                GROUP BY +recipe_id
+                HAVING COUNT(*) = {len(user_restrictions)}
+            )''')
+        params += user_restrictions
+    picks = []
+    if sort == 'personal':
+        engine = recommender.get_recommender()
+        engine.maybe_refresh()
+        ranked = engine.for_user(user_id)
+        if wanted:
+            # Drop the picks the in-memory masks rule out, so neither query carries their ids;
+            # the SQL conditions still decide for the rest
+            index = get_restriction_index().get(conn)
+            ranked = [(recipe_id, score) for recipe_id, score in ranked if index.qualifies(recipe_id, wanted)]
+        phase, after = (after[0], after[1:]) if after else (0, None)
+        if phase == 0 and ranked:
+            picks = personal_recommendations(conn, ranked, fields, fetch, after, conditions, params)
+            if 0 <= fetch <= len(picks):
+                return picks
+            after = None
+            fetch = fetch - len(picks) if fetch >= 0 else -1
+        if ranked:
+            conditions.append(f"r.recipe_id NOT IN ({','.join('?' for _ in ranked)})")
+            params += [recipe_id for recipe_id, _ in ranked]
+    if after:
+        conditions.append(f's.{sort_column} < ? OR (s.{sort_column} = ? AND s.recipe_id > ?)')
+        params += [after[0], after[0], after[1]]
+
+    # Walks the (score DESC, recipe_id) index on recipe_rating_stats, so no sort or aggregate is needed
+    where = ('WHERE ' + ' AND '.join(f'({condition})' for condition in conditions)) if conditions else ''
+    query = f'''
+        SELECT {select_columns(fields)}, s.avg_rating, s.{sort_column} AS sort_key
+        FROM recipe_rating_stats s
+        JOIN recipe r ON r.recipe_id = s.recipe_id
+        {where}
+        ORDER BY s.{sort_column} DESC, s.recipe_id
+        LIMIT ?
+    '''
+    rows = conn.execute(query, params + [fetch])
+    if sort != 'personal':
+        return rows
+    return itertools.chain(picks, (dict(row, phase=1) for row in rows))
+
+
+def personal_recommendations(conn, ranked, fields, fetch, after, conditions, params):
+    """The model's ranking for this user after ``after``, keeping only recipes that pass ``conditions``.
+
+    The ranking is the model's top-N for the user, so it is read in one
+    query and sorted here.
+    """
+    if after:
+        ranked = [(recipe_id, score) for recipe_id, score in ranked if (-score, recipe_id) > (-after[0], after[1])]
+    scores = dict(ranked)
+    placeholders = ','.join('?' for _ in ranked)
+    where = ''.join(f' AND ({condition})' for condition in conditions)
+    rows = conn.execute(f'''
+        SELECT {select_columns(fields)}, COALESCE(s.avg_rating, 0) AS avg_rating
+        FROM recipe r
+        LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id
+        WHERE r.recipe_id IN ({placeholders}){where}
+    ''', [recipe_id for recipe_id, _ in ranked] + params).fetchall()
+    recipes = sorted((dict(row, sort_key=scores[row['recipe_id']], phase=0) for row in rows),
+                     key=lambda row: (-row['sort_key'], row['recipe_id']))
+    return recipes if fetch < 0 else recipes[:fetch]
+
+
+@route('/api/recipes/<recipe_name>/similar')
+@cached(key=lambda recipe_name: f'{recipe_name}:{request.query_string.decode()}',
+        tags=lambda recipe_name: ['recipes', 'recommendations', 'recipe:' + recipe_name])
+def similar_recipes(recipe_name):
+    engine = recommender.get_recommender()
+    if not engine.available:
+        return jsonify({'error': 'Similar recipes are unavailable.'}), 503
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        limit = parse_limit(request.args.get('limit'), default=12)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db()
+    recipe = conn.execute('SELECT recipe_id FROM recipe WHERE recipe_name = ?', (recipe_name,)).fetchone()
+    if recipe is None:
+        return jsonify({'error': 'Recipe not found.'}), 404
+    engine.maybe_refresh()
+    neighbors = engine.similar(recipe['recipe_id'], limit)
+    if not neighbors:
+        return jsonify({'recipes': []})
+
+    similarity = dict(neighbors)
+    placeholders = ','.join('?' for _ in neighbors)
+    rows = conn.execute(f'''
+        SELECT {select_columns(fields)}, COALESCE(s.avg_rating, 0) AS avg_rating
+        FROM recipe r
+        LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id
+        WHERE r.recipe_id IN ({placeholders})
+    ''', list(similarity)).fetchall()
+    rows = sorted(rows, key=lambda row: -similarity[row['recipe_id']])
+    for row in rows:
+        add_cache_tags('ratings:' + row['recipe_name'])
+    return jsonify({'recipes': [dict(project(row, fields), similarity=round(similarity[row['recipe_id']], 4))
+                                for row in rows]})
+
+
+@route('/api/recipes/cookable')
+@cached(key=query_string_key, tags=['recipes'])
+def cookable_recipes():
+    """Recipes that can be made from a comma separated list of ingredients on hand."""
+    have = [name for name in request.args.get('ingredients', '').split(',') if name.strip()]
+    if not have:
+        return jsonify({'error': 'ingredients is required.'}), 400
+    if len(have) > MAX_QUERY_INGREDIENTS:
+        return jsonify({'error': f'At most {MAX_QUERY_INGREDIENTS} ingredients can be given.'}), 400
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        limit = parse_limit(request.args.get('limit'), default=20)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db()
+    ranked = get_ingredient_index().get(conn).cookable(have, limit)
+    if not ranked:
+        return jsonify({'recipes': []})
+
+    placeholders = ','.join('?' for _ in ranked)
+    recipe_ids = [recipe_id for recipe_id, _, _ in ranked]
+    rows = {row['recipe_id']: row for row in conn.execute(f'''
+        SELECT {select_columns(fields)}, COALESCE(s.avg_rating, 0) AS avg_rating
+        FROM recipe r
+        LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id
+        WHERE r.recipe_id IN ({placeholders})
+    ''', recipe_ids)}
+    wanted = {normalize_ingredient(name) for name in have}
+    shopping = {}
+    for row in conn.execute(f'SELECT recipe_id, ingredient_name, ingredient_key FROM ingredients WHERE recipe_id IN ({placeholders})',
+                            recipe_ids):
+        if row['ingredient_key'] not in wanted:
+            shopping.setdefault(row['recipe_id'], []).append(row['ingredient_name'])
+    for row in rows.values():
+        add_cache_tags('ratings:' + row['recipe_name'])
+    return jsonify({'recipes': [dict(project(rows[recipe_id], fields), matched=matched, missing=missing,
+                                     missing_ingredients=shopping.get(recipe_id, []))
+                                for recipe_id, matched, missing in ranked if recipe_id in rows]})
+
+
+@route('/api/suggest')
+def suggestions():
+    """Search box completions over recipe names, cuisines and ingredients, most rated first."""
+    try:
+        limit = parse_limit(request.args.get('limit'), default=current_app.config['SUGGEST_MAX_RESULTS'],
+                            maximum=current_app.config['SUGGEST_MAX_RESULTS'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({'suggestions': []})
+    found = suggest.get_suggest_index().get(get_db()).suggest(query, limit)
+    return jsonify({'suggestions': [{'type': kind, 'text': text, 'popularity': popularity}
+                                    for kind, text, popularity in found]})
+
+
+@route('/recommended')
+@cached(key=logged_in_key, tags=lambda: ['recipes', 'ratings', 'recommendations', f"user:{session['user_id']}"])
+def recommended():
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('login'))
+    size, cursor_key = recommended_cursor('personal')
+    try:
+        after = decode_cursor(request.args.get('cursor'), size)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # The first page of personal recommendations is rendered here; recommended.js fetches later ones as HTML
+    recipes = recommended_rows(get_db(), user_id, 'personal', CARD_FIELDS, DEFAULT_LIMIT + 1, after)
+    page, next_cursor = paginate(list(recipes), DEFAULT_LIMIT, cursor_key)
+    return card_page('recommended.html', page, next_cursor)
 
-        recipes = [dict(recipe) for recipe in recipes]
-        return jsonify({'recipes': recipes})
-    finally:
-        conn.close()
 
+@route('/api/cache-stats')
+def cache_stats():
+    if not is_admin():
+        return jsonify({'error': 'Admin access required.'}), 403
+    return jsonify(get_cache().stats())
 
 
+def init_db_command():
+    """Create the database, or upgrade it to setup.sql; run before starting a WSGI server."""
+    ran = upgrade_schema(get_db())
+    print(f"{'Upgraded' if ran else 'Already current:'} {current_app.config['DATABASE']}")
 
 
-@app.route('/recommended')
-def recommended():
-    if 'user_id' not in session:
-        return redirect(url_for('login'))
-    return render_template('recommended.html')
+def rebuild_rating_stats_command():
+    """Recompute recipe_rating_stats from the rates table."""
+    conn = get_db()
+    drifted = check_rating_stats(conn)
+    rebuild_rating_stats(conn)
+    print(f'Rebuilt rating stats; {len(drifted)} recipe(s) had drifted: {drifted}')
 
 
-@app.route('/run-tests')
+@route('/run-tests', methods=['POST'])
 def run_tests():
-    code = run_all_tests()
-    return jsonify({
-        "status": "done",
-        "passed": code == 0,
-        "exit_code": code
-    })
+    """Start the test suite in the background; 409 with the running job if one is going."""
+    import jobs
+
+    job, started = jobs.get_job_runner().start()
+    body = dict(job.summary(), status_url=url_for('test_job_status', job_id=job.id))
+    return jsonify(body), 202 if started else 409
+
+
+@route('/run-tests/<job_id>')
+def test_job_status(job_id):
+    """A test job's results so far; ``?stream=1`` sends each test as NDJSON while it runs."""
+    import jobs
+
+    job = jobs.get_job_runner().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Test job not found.'}), 404
+    if not request.args.get('stream'):
+        return jsonify(job.snapshot())
+
+    def events():
+        for test in job.follow():
+            yield json.dumps(test) + '\n'
+        yield json.dumps(job.summary()) + '\n'
+    return Response(stream_with_context(events()), mimetype='application/x-ndjson')
+
+
+app = create_app()
 
 if __name__ == '__main__':
-    init_db()  
+    init_db()
     app.run(debug=True)
@@ -0,0 +1,209 @@
+"""ASGI entry point, for serving the app from an event loop.
+
+    uvicorn asgi:application
+
+Under a WSGI server a request holds a worker thread from the moment its
+headers arrive until the last byte of its response has gone out, so slow
+clients and long NDJSON streams count against the worker cap as much as the
+SQLite work does. Here the event loop owns the connections: it reads request
+bodies and writes responses, and only the Flask dispatch and the production
+of each chunk of a streamed body run on a thread. Any number of connections
+can wait on the network while the threads only query and render.
+
+Requests for READ_ENDPOINTS run on a bounded pool of ASGI_READ_WORKERS
+threads and borrow their connections from a pool of as many connections
+kept for them alone, next to the DB_POOL_SIZE the rest of the app shares.
+Uploads, logins and other requests holding every shared connection
+therefore never make a burst of listing and recipe page loads wait for one,
+and WAL lets those reads run alongside the writer. Every other request runs
+on ASGI_WORKERS threads, by default no more than there are shared
+connections.
+Each request keeps its Flask contexts in a contextvars.Context of its own,
+so the chunks of a streamed body may be produced on whichever thread of its
+pool is free. The WSGI app in app.py is untouched and served as before.
+"""
+import asyncio
+import contextvars
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+from app import app, create_app, init_db
+from db import POOL_ENVIRON_KEY, create_pool
+
+# The read-heavy views, dispatched to their own pool
+READ_ENDPOINTS = frozenset({'get_recipes', 'recommended_recipes', 'view_recipe', 'check_cookbook'})
+
+
+class AsgiAdapter:
+    """Serve ``flask_app`` to an ASGI server, running its views on bounded thread pools."""
+
+    def __init__(self, flask_app):
+        flask_app.config.setdefault('ASGI_READ_WORKERS', flask_app.config['DB_POOL_SIZE'])
+        flask_app.config.setdefault('ASGI_WORKERS', min(32, (os.cpu_count() or 1) + 4, flask_app.config['DB_POOL_SIZE']))
+        self.app = flask_app
+        self._executors = {
+            'read': ThreadPoolExecutor(flask_app.config['ASGI_READ_WORKERS'], thread_name_prefix='asgi-read'),
+            'default': ThreadPoolExecutor(flask_app.config['ASGI_WORKERS'], thread_name_prefix='asgi'),
+        }
+        self._read_pool = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'read': 0, 'default': 0, 'in_flight': 0, 'peak_in_flight': 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _track(self, pool, delta):
+        with self._lock:
+            if delta > 0:
+                self._stats['requests'] += 1
+                self._stats[pool] += 1
+            self._stats['in_flight'] += delta
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._stats['in_flight'])
+
+    def read_pool(self):
+        """The connections kept for READ_ENDPOINTS, one per read worker."""
+        pool = self._read_pool
+        if pool is None or pool.database != self.app.config['DATABASE']:
+            with self._lock:
+                pool = self._read_pool
+                if pool is None or pool.database != self.app.config['DATABASE']:
+                    if pool is not None:
+                        pool.close_all()
+                    pool = self._read_pool = create_pool(self.app, self.app.config['ASGI_READ_WORKERS'])
+        return pool
+
+    def pool_for(self, environ):
+        """'read' for a request to one of READ_ENDPOINTS, else 'default'."""
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return 'default'
+        return 'read' if endpoint in READ_ENDPOINTS else 'default'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        environ = wsgi_environ(scope, bytes(body))
+        pool = self.pool_for(environ)
+        if pool == 'read':
+            environ[POOL_ENVIRON_KEY] = self.read_pool()
+        executor = self._executors[pool]
+        loop = asyncio.get_running_loop()
+        # Holds this request's Flask contexts whichever thread runs its next step
+        context = contextvars.copy_context()
+
+        def run(function, *args):
+            return loop.run_in_executor(executor, context.run, function, *args)
+
+        self._track(pool, 1)
+        try:
+            started = []
+            chunks = await run(self._dispatch, environ, started)
+            try:
+                chunk = await run(next, chunks, None)
+                status, headers = started[-1]
+                await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                        for name, value in headers]})
+                while chunk is not None:
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    chunk = await run(next, chunks, None)
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(chunks, 'close'):
+                    await run(chunks.close)
+        finally:
+            self._track(pool, -1)
+
+    def _dispatch(self, environ, started):
+        def start_response(status, headers, exc_info=None):
+            started.append((status, headers))
+            return _no_write
+        return iter(self.app(environ, start_response))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # The server starting up, not the import, is what upgrades the schema
+                await asyncio.get_running_loop().run_in_executor(None, init_db, self.app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        if self._read_pool is not None:
+            self._read_pool.close_all()
+
+
+def _no_write(data):
+    raise RuntimeError('The write() callable of start_response is not supported; return an iterable')
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP ``scope`` whose request body is ``body``."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+def create_asgi_app(config=None):
+    """An AsgiAdapter around a new app from create_app(``config``)."""
+    return AsgiAdapter(create_app(config))
+
+
+application = AsgiAdapter(app)
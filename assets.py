@@ -0,0 +1,136 @@
+"""Fingerprinted URLs and long-lived caching for files under static/.
+
+At startup every static file is hashed and ``url_for('static', ...)`` is
+rewritten to ``name.<hash>.ext``. A hashed URL can never change content, so
+it is served with a year-long immutable Cache-Control; plain URLs keep
+Flask's defaults. ``flask build-assets`` writes ``.gz`` (and ``.br`` when
+the brotli package is installed) next to text assets, and those are sent to
+clients that accept the encoding.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; only gzip siblings are written then
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE = {'.js', '.css', '.svg', '.html', '.json', '.txt'}
+# Accept-Encoding token -> sibling suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Uploads in images/ are already named by their content hash, see images.py
+CONTENT_ADDRESSED = re.compile(r'^images/[0-9a-f]{32}[.-]')
+
+
+def fingerprint(path, length=10):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def hashed_name(filename, digest):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest}{ext}'
+
+
+def build_manifest(folder):
+    """Map each static file's relative path to its fingerprinted name."""
+    manifest = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, folder).replace(os.sep, '/')
+            if CONTENT_ADDRESSED.match(filename):
+                continue
+            manifest[filename] = hashed_name(filename, fingerprint(path))
+    return manifest
+
+
+def compress_assets(folder):
+    """Write precompressed siblings for text assets; returns the paths written."""
+    written = []
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if os.path.splitext(name)[1] not in COMPRESSIBLE:
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            siblings = [(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                siblings.append((path + '.br', brotli.compress(data)))
+            for sibling, compressed in siblings:
+                with open(sibling, 'wb') as f:
+                    f.write(compressed)
+                written.append(sibling)
+    return written
+
+
+def _precompressed(folder, filename):
+    """Best fresh sibling the client accepts, as (sibling name, encoding)."""
+    path = os.path.join(folder, filename)
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings.quality(encoding) <= 0:
+            continue
+        sibling = path + suffix
+        # A sibling older than its source was built from a previous version
+        if os.path.isfile(sibling) and os.path.getmtime(sibling) >= os.path.getmtime(path):
+            return filename + suffix, encoding
+    return None
+
+
+def send_static(filename):
+    """Replacement for Flask's static view that understands hashed names."""
+    app = current_app
+    folder = app.static_folder
+    original = app.extensions['asset_originals'].get(filename)
+    immutable = original is not None or CONTENT_ADDRESSED.match(filename)
+    filename = original or filename
+
+    sibling = _precompressed(folder, filename) if os.path.isfile(os.path.join(folder, filename)) else None
+    if sibling is None:
+        response = app.send_static_file(filename)
+    else:
+        response = send_from_directory(folder, sibling[0], mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['Content-Encoding'] = sibling[1]
+    if os.path.splitext(filename)[1] in COMPRESSIBLE:
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.expires = None
+    return response
+
+
+def refresh(app):
+    manifest = build_manifest(app.static_folder) if app.config['STATIC_FINGERPRINTS'] else {}
+    app.extensions['asset_manifest'] = manifest
+    app.extensions['asset_originals'] = {hashed: filename for filename, hashed in manifest.items()}
+
+
+def init_app(app):
+    app.config.setdefault('STATIC_FINGERPRINTS', True)
+    refresh(app)
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = app.extensions['asset_manifest'].get(values['filename'], values['filename'])
+
+    app.view_functions['static'] = send_static
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Precompress static text assets and report their fingerprints."""
+        written = compress_assets(app.static_folder)
+        refresh(app)
+        print(f'Wrote {len(written)} compressed file(s); {len(app.extensions["asset_manifest"])} asset(s) fingerprinted')
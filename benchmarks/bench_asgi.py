@@ -0,0 +1,166 @@
+"""Concurrency scaling of the WSGI and ASGI serving modes.
+
+Simulated clients load the read-heavy pages (recipe listings, recipe pages,
+cookbook checks and recommendations) in a loop, and each takes --latency ms
+to receive a response, as a client on a real network does. Under WSGI the
+app runs on --threads worker threads, as a threaded WSGI server runs it, and
+a worker stays busy while its response goes out. Under ASGI the same number
+of threads serve the read pool of asgi.AsgiAdapter and an event loop does
+the sending. For every --concurrency level the script reports requests per
+second and p50/p99 latency in each mode. WSGI stops scaling once every
+thread is busy, at about threads / latency requests per second; ASGI keeps
+scaling until the CPU is the limit.
+
+Run from the repository root:
+
+    python benchmarks/bench_asgi.py --threads 4 --latency 50 --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Only the apps built below are used; this keeps app.py's module-level one off database.db
+os.environ.setdefault('TASTELY_DATABASE', os.path.join(tempfile.mkdtemp(prefix='tastely-bench-'), 'unused.db'))
+
+from app import create_app, init_db  # noqa: E402
+from asgi import AsgiAdapter  # noqa: E402
+from db import get_db  # noqa: E402
+
+ACCOUNTS = 8
+
+
+def build_app(database, threads):
+    app = create_app({'DATABASE': database, 'TESTING': True, 'PROFILING_ENABLED': False,
+                      'DB_POOL_SIZE': threads + 2, 'ASGI_READ_WORKERS': threads, 'PASSWORD_SCRYPT_N': 2 ** 10})
+    init_db(app)
+    with app.app_context():
+        conn = get_db()
+        if not conn.execute('SELECT 1 FROM account').fetchone():
+            conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                             [(i, f'user{i}', f'user{i}@example.com', 'pw') for i in range(1, ACCOUNTS + 1)])
+            conn.executemany('INSERT INTO recipe (recipe_name, recipe_description, instructions) VALUES (?, ?, ?)',
+                             [(f'Recipe {i}', f'Stew {i}', 'stir') for i in range(200)])
+            conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (?, ?, ?)',
+                             [(user_id, recipe_id, (user_id + recipe_id) % 5 + 1)
+                              for user_id in range(1, ACCOUNTS + 1) for recipe_id in range(1, 201, 3)])
+            conn.commit()
+    return app
+
+
+def paths(client):
+    """The pages client number ``client`` loads, in order, forever."""
+    k = client
+    while True:
+        yield f'/api/recipes?limit=20&search=stew+{k % 200}'
+        yield f'/recipe/Recipe-{k % 200}'
+        yield f'/check-cookbook/Recipe%20{k % 200}'
+        yield '/api/recommended?limit=20'
+        k += 1
+
+
+def summarize(latencies, elapsed):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f'{len(latencies) / elapsed:8.1f} req/s   p50 {statistics.median(latencies):7.1f} ms   p99 {p99:7.1f} ms'
+
+
+def run_wsgi(app, concurrency, args):
+    workers = threading.BoundedSemaphore(args.threads)
+    cookies = []
+    for i in range(1, ACCOUNTS + 1):
+        client = app.test_client()
+        client.post('/login', json={'username': f'user{i}', 'password': 'pw'})
+        cookies.append(client.get_cookie('session').value)
+    latencies, lock = [], threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def client(number):
+        http = app.test_client()
+        http.set_cookie('session', cookies[number % ACCOUNTS])
+        for path in paths(number):
+            if time.perf_counter() >= deadline:
+                return
+            start = time.perf_counter()
+            with workers:
+                http.get(path).get_data()
+                time.sleep(args.latency / 1000)  # the worker writes the response to the socket
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def request(adapter, method, path, cookie=None, body=b'', latency=0):
+    path, _, query = path.partition('?')
+    headers = [(b'content-type', b'application/json')]
+    if cookie:
+        headers.append((b'cookie', cookie))
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(), 'headers': headers}
+    response = {}
+
+    async def receive():
+        return {'type': 'http.request', 'body': body}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response.update(message)
+        elif not message.get('more_body'):
+            await asyncio.sleep(latency)  # the event loop writes the response to the socket
+    await adapter(scope, receive, send)
+    return response
+
+
+async def run_asgi(adapter, concurrency, args):
+    cookies = []
+    for i in range(1, ACCOUNTS + 1):
+        response = await request(adapter, 'POST', '/login', body=f'{{"username": "user{i}", "password": "pw"}}'.encode())
+        cookies.append(dict(response['headers'])[b'set-cookie'].split(b';', 1)[0])
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+
+    async def client(number):
+        for path in paths(number):
+            if time.perf_counter() >= deadline:
+                return
+            start = time.perf_counter()
+            await request(adapter, 'GET', path, cookies[number % ACCOUNTS], latency=args.latency / 1000)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=50, help='ms each client takes to receive a response')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    print(f'{args.threads} threads, {args.latency:g} ms client latency')
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'), args.threads)
+        adapter = AsgiAdapter(app)
+        for concurrency in args.concurrency:
+            print(f'{concurrency:4} clients  wsgi {run_wsgi(app, concurrency, args)}')
+            print(f'{concurrency:4} clients  asgi {asyncio.run(run_asgi(adapter, concurrency, args))}')
+        adapter.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Login throughput per core with passwords hashed on the worker pool.
+
+Builds the app with create_app() on a scratch database holding --accounts
+accounts hashed at the configured cost, then has --clients threads log in
+through test clients for --seconds, once for each PASSWORD_HASH_WORKERS
+value from 1 up to the CPU count. Each line reports logins per second, that
+figure divided by the workers (the cores scrypt can use), p50 and p99 login
+latency and how many logins were shed with a 503 because the pool and its
+PASSWORD_HASH_QUEUE were full.
+
+Run from the repository root:
+
+    python benchmarks/bench_passwords.py --clients 16 --seconds 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Only the apps built below are used; this keeps app.py's module-level one off database.db
+os.environ.setdefault('TASTELY_DATABASE', os.path.join(tempfile.mkdtemp(prefix='tastely-bench-'), 'unused.db'))
+
+from app import create_app, init_db  # noqa: E402
+from db import get_db  # noqa: E402
+from passwords import get_password_hasher  # noqa: E402
+
+PASSWORD = 'password'
+
+
+def run(workers, args, tmp):
+    app = create_app({'DATABASE': os.path.join(tmp, f'bench-{workers}.db'), 'TESTING': True,
+                      'PASSWORD_SCRYPT_N': 2 ** args.log_n, 'PASSWORD_HASH_WORKERS': workers,
+                      'PASSWORD_HASH_QUEUE': args.queue, 'PASSWORD_HASH_WAIT': args.wait,
+                      'PROFILING_ENABLED': False})
+    init_db(app)
+    hasher = get_password_hasher(app)
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (username, email, password) VALUES (?, ?, ?)',
+                         [(f'user{i}', f'user{i}@example.com', hasher.hash(PASSWORD)) for i in range(args.accounts)])
+        conn.commit()
+
+    latencies, statuses, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def client(number):
+        with app.test_client() as http:
+            i = number
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                status = http.post('/login', json={'username': f'user{i % args.accounts}',
+                                                   'password': PASSWORD}).status_code
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    statuses.append(status)
+                i += args.clients
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    hasher.shutdown()
+
+    ok = statuses.count(200)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    return ok / elapsed, statistics.median(latencies) if latencies else 0, p99, statuses.count(503)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--log-n', type=int, default=14, help='scrypt cost as log2(N)')
+    parser.add_argument('--queue', type=int, default=16)
+    parser.add_argument('--wait', type=float, default=1.0)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f'{args.clients} clients, scrypt N=2**{args.log_n}, {cores} cores')
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in range(1, cores + 1):
+            rate, p50, p99, shed = run(workers, args, tmp)
+            print(f'workers {workers:2}  {rate:8.1f} logins/s  {rate / workers:8.1f} per core'
+                  f'   p50 {p50:7.1f} ms   p99 {p99:7.1f} ms   shed {shed}')
+
+
+if __name__ == '__main__':
+    main()
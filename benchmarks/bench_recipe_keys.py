@@ -0,0 +1,158 @@
+"""Join latency with child tables keyed by recipe_name TEXT versus recipe_id.
+
+Builds a synthetic database with the old name-keyed child tables, times the
+joins the routes used to run, migrates a copy with migrations.py and times
+the recipe_id versions of the same queries on it.
+
+Run from the repository root:
+
+    python benchmarks/bench_recipe_keys.py --recipes 20000 --users 2000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from migrations import RECIPE_ID_TABLES, RECIPE_NAME_TRIGGERS, migrate_recipe_id_keys  # noqa: E402
+
+LEGACY_TABLES = '''
+    CREATE TABLE recipe_restrictions (recipe_name VARCHAR(80), RecRestriction VARCHAR(30),
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (recipe_name, RecRestriction));
+    CREATE TABLE ingredients (recipe_name VARCHAR(80), ingredient_name VARCHAR(80),
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (recipe_name, ingredient_name));
+    CREATE TABLE contains (CookBook_ID INTEGER, recipe_name TEXT,
+        FOREIGN KEY(CookBook_ID) REFERENCES cookbook(CookBook_ID) ON DELETE CASCADE,
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (CookBook_ID, recipe_name));
+    CREATE TABLE rates (User_ID INTEGER NOT NULL, recipe_name VARCHAR(80) NOT NULL,
+        user_rating INTEGER CHECK (user_rating BETWEEN 0 AND 5),
+        FOREIGN KEY(User_ID) REFERENCES account(id) ON DELETE CASCADE,
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (User_ID, recipe_name));
+    CREATE INDEX idx_rates_recipe ON rates (recipe_name);
+'''
+TAGS = ['Vegetarian', 'Vegan', 'Gluten-Free', 'Dairy-Free', 'Keto']
+
+# name -> (legacy query, recipe_id query, parameter factory)
+QUERIES = {
+    'recipe ingredients': (
+        'SELECT ingredient_name FROM ingredients WHERE recipe_name = ?',
+        'SELECT ingredient_name FROM ingredients WHERE recipe_id = ?',
+        lambda rng, n, users: ('name', rng.randrange(1, n + 1)),
+    ),
+    'cookbook page': (
+        '''SELECT r.* FROM recipe r
+           JOIN contains fr ON REPLACE(fr.recipe_name, '-', ' ') = r.recipe_name
+           JOIN cookbook c ON fr.CookBook_ID = c.CookBook_ID
+           WHERE c.CookBook_ID = ?''',
+        '''SELECT r.* FROM recipe r
+           JOIN contains fr ON fr.recipe_id = r.recipe_id
+           WHERE fr.CookBook_ID = ?''',
+        lambda rng, n, users: ('user', rng.randrange(1, users + 1)),
+    ),
+    'rating totals': (
+        '''SELECT r.recipe_id, SUM(ra.user_rating), COUNT(ra.user_rating)
+           FROM recipe r LEFT JOIN rates ra ON ra.recipe_name = r.recipe_name GROUP BY r.recipe_id''',
+        '''SELECT r.recipe_id, SUM(ra.user_rating), COUNT(ra.user_rating)
+           FROM recipe r LEFT JOIN rates ra ON ra.recipe_id = r.recipe_id GROUP BY r.recipe_id''',
+        None,
+    ),
+    'restriction filter': (
+        '''SELECT recipe_name FROM recipe_restrictions WHERE RecRestriction IN ('Vegan', 'Keto')
+           GROUP BY recipe_name HAVING COUNT(*) = 2''',
+        '''SELECT recipe_id FROM recipe_restrictions WHERE RecRestriction IN ('Vegan', 'Keto')
+           GROUP BY recipe_id HAVING COUNT(*) = 2''',
+        None,
+    ),
+}
+
+
+def recipe_title(i):
+    return f'Synthetic recipe number {i:07d} with a realistic long title'
+
+
+def build_legacy(path, recipes, users, ingredients_per_recipe, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    with open('setup.sql') as f:
+        conn.executescript(f.read())
+    drops = ''.join(f'DROP TRIGGER IF EXISTS {trigger};' for trigger in RECIPE_NAME_TRIGGERS)
+    drops += ''.join(f'DROP TABLE {table};' for table in RECIPE_ID_TABLES)
+    conn.executescript('PRAGMA foreign_keys = OFF;' + drops + LEGACY_TABLES)
+
+    conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                     [(u, f'user{u}', f'user{u}@example.com', 'pw') for u in range(1, users + 1)])
+    conn.executemany('INSERT INTO cookbook (CookBook_ID) VALUES (?)', [(u,) for u in range(1, users + 1)])
+    conn.executemany('INSERT INTO recipe (recipe_id, recipe_name, UserID) VALUES (?, ?, ?)',
+                     [(i, recipe_title(i), rng.randrange(1, users + 1)) for i in range(1, recipes + 1)])
+    conn.executemany('INSERT INTO ingredients VALUES (?, ?)',
+                     [(recipe_title(i), f'ingredient {j}') for i in range(1, recipes + 1) for j in range(ingredients_per_recipe)])
+    conn.executemany('INSERT OR IGNORE INTO recipe_restrictions VALUES (?, ?)',
+                     [(recipe_title(i), rng.choice(TAGS)) for i in range(1, recipes + 1) for _ in range(2)])
+    conn.executemany('INSERT OR IGNORE INTO contains VALUES (?, ?)',
+                     [(u, recipe_title(rng.randrange(1, recipes + 1))) for u in range(1, users + 1) for _ in range(20)])
+    conn.executemany('INSERT OR IGNORE INTO rates VALUES (?, ?, ?)',
+                     [(u, recipe_title(rng.randrange(1, recipes + 1)), rng.randrange(1, 6)) for u in range(1, users + 1) for _ in range(50)])
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def time_query(conn, sql, params_for, repeat):
+    samples = []
+    for _ in range(repeat):
+        params = params_for() if params_for else ()
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--ingredients', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path, migrated_path = os.path.join(tmp, 'legacy.db'), os.path.join(tmp, 'migrated.db')
+        build_legacy(legacy_path, args.recipes, args.users, args.ingredients, args.seed)
+        shutil.copy(legacy_path, migrated_path)
+
+        migrated = sqlite3.connect(migrated_path)
+        migrated.execute('PRAGMA foreign_keys = ON')
+        start = time.perf_counter()
+        migrate_recipe_id_keys(migrated)
+        with open('setup.sql') as f:
+            migrated.executescript(f.read())
+        migrated.execute('ANALYZE')
+        print(f'Migrated {args.recipes} recipes in {time.perf_counter() - start:.2f} s')
+
+        legacy = sqlite3.connect(legacy_path)
+        print(f'{"query":20} {"recipe_name":>14} {"recipe_id":>14} {"speedup":>8}')
+        for label, (legacy_sql, id_sql, make_params) in QUERIES.items():
+            results = []
+            for conn, sql, by_name in ((legacy, legacy_sql, True), (migrated, id_sql, False)):
+                rng = random.Random(args.seed)
+                params_for = None
+                if make_params:
+                    def params_for(rng=rng, by_name=by_name):
+                        kind, value = make_params(rng, args.recipes, args.users)
+                        return (recipe_title(value) if kind == 'name' and by_name else value,)
+                repeat = args.repeat if make_params else max(3, args.repeat // 50)
+                results.append(time_query(conn, sql, params_for, repeat))
+            print(f'{label:20} {results[0]:11.3f} ms {results[1]:11.3f} ms {results[0] / results[1]:7.1f}x')
+        legacy.close()
+        migrated.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Per-operation latency of recipe create and delete, before and after batching.
+
+"before" is the write pattern the routes used to have: one execute per
+ingredient and tag after the recipe row, so the full-text row is rewritten
+for every ingredient, and a delete that cleared each child table by hand with
+a commit after every statement. "after" is the current one: the recipe goes
+in first, its full-text row is taken out while executemany adds the child
+rows and is written once at the end, and a single DELETE lets ON DELETE
+CASCADE clean up, each in one transaction.
+Both run against a fresh database built from setup.sql, under the app's
+PRAGMAs (WAL) and under SQLite's defaults (rollback journal,
+synchronous=FULL), where every extra commit is an extra fsync.
+
+Run from the repository root:
+
+    python benchmarks/bench_recipe_writes.py --recipes 200 --ingredients 60
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db import DEFAULT_PRAGMAS, ConnectionPool  # noqa: E402
+from search import index_recipe  # noqa: E402
+
+JOURNAL_MODES = {
+    'wal': DEFAULT_PRAGMAS,
+    'rollback': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'foreign_keys': 'ON'},
+}
+TAGS = ['Vegetarian', 'Gluten-Free']
+
+
+def create_before(conn, name, ingredients):
+    cursor = conn.cursor()
+    recipe_id = cursor.execute('INSERT INTO recipe (recipe_name, recipe_description, UserID, instructions) VALUES (?, ?, ?, ?)',
+                               (name, 'benchmark', 1, 'stir')).lastrowid
+    for ingredient in ingredients:
+        cursor.execute('INSERT INTO ingredients (recipe_id, ingredient_name) VALUES (?, ?)', (recipe_id, ingredient))
+    for tag in TAGS:
+        cursor.execute('INSERT INTO recipe_restrictions (recipe_id, RecRestriction) VALUES (?, ?)', (recipe_id, tag))
+    conn.commit()
+
+
+def create_after(conn, name, ingredients):
+    cursor = conn.cursor()
+    recipe_id = cursor.execute('INSERT INTO recipe (recipe_name, recipe_description, UserID, instructions) VALUES (?, ?, ?, ?)',
+                               (name, 'benchmark', 1, 'stir')).lastrowid
+    cursor.execute('DELETE FROM recipe_fts WHERE rowid = ?', (recipe_id,))
+    cursor.executemany('INSERT INTO ingredients (recipe_id, ingredient_name) VALUES (?, ?)',
+                       [(recipe_id, ingredient) for ingredient in ingredients])
+    cursor.executemany('INSERT INTO recipe_restrictions (recipe_id, RecRestriction) VALUES (?, ?)',
+                       [(recipe_id, tag) for tag in TAGS])
+    index_recipe(conn, recipe_id)
+    conn.commit()
+
+
+def delete_before(conn, name):
+    recipe_id = conn.execute('SELECT recipe_id FROM recipe WHERE recipe_name = ?', (name,)).fetchone()[0]
+    conn.execute('DELETE FROM recipe WHERE recipe_id = ?', (recipe_id,))
+    conn.commit()
+    for table in ('recipe_restrictions', 'rates', 'contains', 'ingredients', 'rates'):
+        conn.execute(f'DELETE FROM {table} WHERE recipe_id = ?', (recipe_id,))
+        conn.commit()
+
+
+def delete_after(conn, name):
+    conn.execute('DELETE FROM recipe WHERE recipe_name = ?', (name,))
+    conn.commit()
+
+
+def rate(conn, name, raters):
+    conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) '
+                     'VALUES (?, (SELECT recipe_id FROM recipe WHERE recipe_name = ?), ?)',
+                     [(user_id, name, user_id % 5 + 1) for user_id in raters])
+    conn.commit()
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(mode, variant, recipes, ingredient_count):
+    create, delete = {'before': (create_before, delete_before), 'after': (create_after, delete_after)}[variant]
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = ConnectionPool(os.path.join(tmp, 'bench.db'), pragmas=JOURNAL_MODES[mode]).connect()
+        with open('setup.sql') as f:
+            conn.executescript(f.read())
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'user{i}', f'user{i}@example.com', 'pw') for i in range(1, 6)])
+        conn.commit()
+
+        ingredients = [f'ingredient {i}' for i in range(ingredient_count)]
+        names = [f'{variant} recipe {i}' for i in range(recipes)]
+        create_ms = [timed(create, conn, name, ingredients) for name in names]
+        for name in names:
+            rate(conn, name, range(1, 6))
+        delete_ms = [timed(delete, conn, name) for name in names]
+        leftover = conn.execute('SELECT COUNT(*) FROM ingredients').fetchone()[0]
+        conn.close()
+    return create_ms, delete_ms, leftover
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f'median {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=200)
+    parser.add_argument('--ingredients', type=int, default=60)
+    parser.add_argument('--mode', choices=sorted(JOURNAL_MODES) + ['both'], default='both')
+    args = parser.parse_args()
+
+    modes = sorted(JOURNAL_MODES) if args.mode == 'both' else [args.mode]
+    print(f'{args.recipes} recipes x {args.ingredients} ingredients')
+    for mode in modes:
+        for variant in ('before', 'after'):
+            create_ms, delete_ms, leftover = run(mode, variant, args.recipes, args.ingredients)
+            print(f'[{mode:8}] {variant:6}  create: {summarize(create_ms)}   delete: {summarize(delete_ms)}'
+                  f'   orphaned ingredients: {leftover}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Build time, memory and lookup latency of the recommendation model.
+
+Reads the ratings from a database filled by generate_data.py, builds the
+item-item model once and times similar-recipe and per-user lookups, plus
+rescoring one user after a rating change.
+
+Run from the repository root:
+
+    python benchmarks/generate_data.py load.db --ratings 1000000
+    python benchmarks/bench_recommender.py load.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from recommender import build_model  # noqa: E402
+
+
+def time_calls(call, args, repeat):
+    samples = []
+    for arg in args[:repeat]:
+        start = time.perf_counter()
+        call(arg)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='database filled by generate_data.py')
+    parser.add_argument('--neighbors', type=int, default=20)
+    parser.add_argument('--top-n', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    start = time.perf_counter()
+    model = build_model(conn, args.neighbors, args.top_n)
+    built = time.perf_counter() - start
+    size = sum(array.nbytes for array in (model.recipe_ids, model.sim_indptr, model.sim_indices, model.sim_values,
+                                          model.user_ids, model.rec_indptr, model.rec_indices, model.rec_scores))
+    print(f'Built from {model.ratings} ratings in {built:.1f} s: {len(model.recipe_ids)} recipes, '
+          f'{len(model.user_ids)} users, {size / 1e6:.1f} MB')
+
+    rng = random.Random(args.seed)
+    recipes = [rng.choice(model.recipe_ids.tolist()) for _ in range(args.repeat)]
+    users = [rng.choice(model.user_ids.tolist()) for _ in range(args.repeat)]
+    for label, call, inputs, repeat in (
+        ('similar recipes', lambda recipe_id: model.similar(recipe_id, 24), recipes, args.repeat),
+        ('user recommendations', model.for_user, users, args.repeat),
+        ('rescore one user', lambda user_id: model.score_user(conn.execute(
+            'SELECT recipe_id, user_rating FROM rates WHERE User_ID = ?', (user_id,)).fetchall()), users, 200),
+    ):
+        median, p99 = time_calls(call, inputs, repeat)
+        print(f'{label:22} median {median:8.1f} us   p99 {p99:8.1f} us')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Cold start time of the app, checked against a startup budget.
+
+Imports app in a fresh interpreter under ``python -X importtime`` a few times,
+against a scratch database, and reports the median time the app adds on top
+of Flask itself (Flask is imported first, so it is left out of the figure),
+with the slowest modules of the last run. Importing app builds the app with
+create_app(), so the figure covers every init_app; the schema upgrade is the
+separate ``flask init-db`` step and is not part of it.
+
+The budget is STARTUP_BUDGET_MS, and none of HEAVY_MODULES may be loaded at
+startup: NumPy and SciPy load with the first recommendation, Pillow with
+the first upload, pytest and subprocess with the first test job and
+cProfile with the first sampled request. The script exits with status 1
+when either rule is broken.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+STARTUP_BUDGET_MS = 100
+HEAVY_MODULES = ('numpy', 'scipy', 'PIL', 'pytest', 'subprocess', 'cProfile')
+PROBE = f'import flask, sys; import app; print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+
+
+def import_times(stderr):
+    """Cumulative microseconds per module imported after Flask, from ``-X importtime`` output."""
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() == 'flask':
+            times = []  # a module's line follows those of its imports
+        else:
+            times.append((name.strip(), int(cumulative)))
+    return times
+
+
+def measure(database):
+    env = dict(os.environ, TASTELY_DATABASE=database)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=REPOSITORY, env=env,
+                            capture_output=True, text=True, check=True)
+    times = import_times(result.stderr)
+    app_ms = dict(times)['app'] / 1000
+    return app_ms, result.stdout.split(), times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest modules to list')
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_MS, help='milliseconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database = os.path.join(workdir, 'startup.db')
+        first, _, _ = measure(database)
+        runs = [measure(database) for _ in range(args.runs)]
+
+    median = statistics.median(app_ms for app_ms, _, _ in runs)
+    print(f'First launch: {first:.1f} ms')
+    print(f'Later launches: median {median:.1f} ms over {args.runs} runs, budget {args.budget:.0f} ms')
+    _, heavy, times = runs[-1]
+    print(f'\n{"module":40} {"cumulative ms":>14}')
+    for name, cumulative in sorted(times, key=lambda row: -row[1])[:args.top]:
+        print(f'{name:40} {cumulative / 1000:14.1f}')
+
+    failed = False
+    if median > args.budget:
+        print(f'\nOver budget by {median - args.budget:.1f} ms')
+        failed = True
+    if heavy:
+        print(f'\nLoaded at startup: {", ".join(heavy)}')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Concurrent rating writes, each thread committing its own vs through the writer queue.
+
+--threads threads each submit --ratings rating upserts, the statement
+rate_recipe runs, against a fresh database built from setup.sql. "before"
+is the old pattern: every thread commits its own transaction on a pool
+connection and gives up on "database is locked" once busy_timeout, here
+--busy-timeout ms, runs out. "after" sends every write to writes.Writer,
+which groups whatever is queued into one transaction. Each line reports
+writes per second, p50 and p99 latency, failed writes and, for "after", the
+mean and largest batch and the deepest the queue got.
+
+Run from the repository root:
+
+    python benchmarks/bench_writes.py --threads 32 --ratings 50
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Only the apps built below are used; this keeps app.py's module-level one off database.db
+os.environ.setdefault('TASTELY_DATABASE', os.path.join(tempfile.mkdtemp(prefix='tastely-bench-'), 'unused.db'))
+
+from app import create_app, init_db  # noqa: E402
+from db import DEFAULT_PRAGMAS, get_db, get_pool  # noqa: E402
+from writes import get_writer  # noqa: E402
+
+RATE = '''
+    INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (?, ?, ?)
+    ON CONFLICT (User_ID, recipe_id) DO UPDATE SET user_rating = excluded.user_rating
+'''
+
+
+def build_app(database, args):
+    pragmas = dict(DEFAULT_PRAGMAS, busy_timeout=args.busy_timeout)
+    app = create_app({'DATABASE': database, 'TESTING': True, 'PROFILING_ENABLED': False,
+                      'DB_POOL_SIZE': args.threads + 1, 'DB_PRAGMAS': pragmas})
+    init_db(app)
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'user{i}', f'user{i}@example.com', 'pw') for i in range(1, args.threads + 1)])
+        conn.executemany('INSERT INTO recipe (recipe_id, recipe_name) VALUES (?, ?)',
+                         [(i, f'Recipe {i}') for i in range(1, args.ratings + 1)])
+        conn.commit()
+    return app
+
+
+def write_before(app, user_id, recipe_id):
+    pool = get_pool(app)
+    conn = pool.acquire()
+    try:
+        conn.execute(RATE, (user_id, recipe_id, recipe_id % 5 + 1))
+        conn.commit()
+    finally:
+        pool.release(conn)
+
+
+def write_after(app, user_id, recipe_id):
+    get_writer(app).submit(lambda conn: conn.execute(RATE, (user_id, recipe_id, recipe_id % 5 + 1)))
+
+
+def run(variant, args):
+    write = {'before': write_before, 'after': write_after}[variant]
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'), args)
+        latencies, failures, lock = [], [], threading.Lock()
+
+        def rater(user_id):
+            for recipe_id in range(1, args.ratings + 1):
+                start = time.perf_counter()
+                try:
+                    write(app, user_id, recipe_id)
+                except sqlite3.OperationalError as e:
+                    with lock:
+                        failures.append(str(e))
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        threads = [threading.Thread(target=rater, args=(user_id,)) for user_id in range(1, args.threads + 1)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = get_writer(app).stats()
+        get_writer(app).shutdown()
+        get_pool(app).close_all()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+    line = (f'{variant:6}  {len(latencies) / elapsed:8.1f} writes/s   p50 {statistics.median(latencies or [0]):7.2f} ms'
+            f'   p99 {p99:7.2f} ms   failed {len(failures)}')
+    if variant == 'after':
+        line += f"   batch mean {stats['mean_batch']} max {stats['largest_batch']}   peak depth {stats['peak_depth']}"
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--ratings', type=int, default=50, help='ratings written by each thread')
+    parser.add_argument('--busy-timeout', type=int, default=100, help='SQLite busy_timeout in ms')
+    args = parser.parse_args()
+
+    print(f'{args.threads} threads x {args.ratings} ratings, busy_timeout {args.busy_timeout} ms')
+    for variant in ('before', 'after'):
+        print(run(variant, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Fill a database built from setup.sql with seeded synthetic data.
+
+Counts of accounts, recipes, ingredients, restrictions, ratings and cookbook
+entries are configurable up to millions of ratings. Recipe popularity follows
+a Zipf-like curve, so a few recipes collect most ratings and saves the way
+real traffic does. The same seed always produces the same database.
+
+Every account's password is ``password``, so the load-test driver can log in
+as any of them. It is stored in plaintext, as rows from before password
+hashing were, and replaced with a hash on each account's first login.
+
+Run from the repository root:
+
+    python benchmarks/generate_data.py load.db --accounts 20000 --recipes 50000 --ratings 1000000
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ingredients import normalize_ingredient  # noqa: E402
+from migrations import migrate_recipe_id_keys  # noqa: E402
+from restrictions import ALL_TAGS, tags_to_mask  # noqa: E402
+
+PASSWORD = 'password'
+CUISINES = ['American', 'Mexican', 'Indian', 'Italian', 'Greek', 'Chinese', 'Breakfast', 'Salad', 'Soup', 'Dessert']
+ADJECTIVES = ['Smoky', 'Crispy', 'Creamy', 'Spicy', 'Zesty', 'Hearty', 'Rustic', 'Golden', 'Herbed', 'Tangy',
+              'Roasted', 'Grilled', 'Braised', 'Charred', 'Sticky', 'Lemony', 'Garlicky', 'Sweet', 'Savory', 'Light']
+DISHES = ['Tacos', 'Curry', 'Risotto', 'Salad', 'Soup', 'Stew', 'Pancakes', 'Noodles', 'Burger', 'Pie',
+          'Flatbread', 'Skillet', 'Casserole', 'Bowl', 'Dumplings', 'Frittata', 'Chili', 'Pasta', 'Wraps', 'Tart']
+INGREDIENTS = [
+    'salt', 'pepper', 'olive oil', 'butter', 'garlic', 'onion', 'shallot', 'ginger', 'lemon', 'lime',
+    'cumin', 'paprika', 'turmeric', 'coriander', 'chili flakes', 'oregano', 'basil', 'thyme', 'rosemary', 'parsley',
+    'cilantro', 'mint', 'dill', 'bay leaf', 'cinnamon', 'nutmeg', 'sugar', 'honey', 'maple syrup', 'soy sauce',
+    'fish sauce', 'rice vinegar', 'balsamic vinegar', 'mustard', 'mayonnaise', 'yogurt', 'cream', 'milk', 'cheddar',
+    'parmesan', 'feta', 'mozzarella', 'egg', 'flour', 'cornstarch', 'baking powder', 'rice', 'pasta', 'noodles',
+    'bread', 'tortillas', 'potato', 'sweet potato', 'carrot', 'celery', 'bell pepper', 'tomato', 'spinach', 'kale',
+    'broccoli', 'cauliflower', 'zucchini', 'eggplant', 'mushroom', 'peas', 'corn', 'chickpeas', 'black beans',
+    'lentils', 'tofu', 'chicken thighs', 'chicken breast', 'ground beef', 'skirt steak', 'pork shoulder', 'bacon',
+    'shrimp', 'salmon', 'cod', 'tuna', 'avocado', 'cucumber', 'red onion', 'scallion', 'jalapeno', 'coconut milk',
+    'peanut butter', 'sesame oil', 'tahini', 'walnuts', 'almonds', 'raisins', 'apple', 'banana', 'blueberries',
+    'strawberries', 'chocolate', 'vanilla', 'oats', 'quinoa', 'couscous', 'stock', 'white wine', 'capers', 'olives',
+]
+WORDS = ['slow', 'quick', 'family', 'weeknight', 'classic', 'fresh', 'seasonal', 'simple', 'bright', 'comforting',
+         'crowd-pleasing', 'one-pan', 'make-ahead', 'tender', 'bold', 'mild', 'crunchy', 'silky', 'warm', 'chilled']
+
+
+def zipf_weights(n, s=1.0):
+    """Cumulative weights for a Zipf-like popularity curve over ``n`` items."""
+    return list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def chunks(rows, size=50000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def create_schema(conn):
+    migrate_recipe_id_keys(conn)
+    with open('setup.sql') as f:
+        conn.executescript(f.read())
+
+
+def generate(conn, accounts=1000, recipes=2000, ingredients=10, ratings=20000, cookbook_entries=10,
+             restricted_share=0.3, seed=1, log=print):
+    """Insert the synthetic rows into ``conn`` and return the counts written."""
+    rng = random.Random(seed)
+    create_schema(conn)
+    start_account = conn.execute('SELECT COALESCE(MAX(id), 0) FROM account').fetchone()[0] + 1
+    start_recipe = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'recipe'").fetchone()[0] + 1
+    account_ids = range(start_account, start_account + accounts)
+    recipe_ids = range(start_recipe, start_recipe + recipes)
+
+    # Bulk load: foreign keys are satisfied by construction and checked at the end
+    conn.execute('PRAGMA foreign_keys = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+
+    conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                     ((i, f'loaduser{i}', f'loaduser{i}@example.com', PASSWORD) for i in account_ids))
+    conn.executemany('INSERT INTO users (Account_ID) VALUES (?)', ((i,) for i in account_ids))
+    conn.executemany('INSERT INTO cookbook (CookBook_ID) VALUES (?)', ((i,) for i in account_ids))
+    conn.executemany('INSERT INTO user_restrictions (User_ID, UserRestriction) VALUES (?, ?)',
+                     ((i, tag) for i in account_ids if rng.random() < restricted_share
+                      for tag in rng.sample(ALL_TAGS, rng.randint(1, 2))))
+    conn.commit()
+    log(f'{accounts} accounts')
+
+    # Child rows go in ahead of their recipe so the full-text trigger indexes them in one pass
+    recipe_rows, ingredient_rows, restriction_rows = [], [], []
+    for recipe_id in recipe_ids:
+        tags = [tag for tag in ALL_TAGS if rng.random() < 0.25]
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(INGREDIENTS).title()} {rng.choice(DISHES)} {recipe_id}'
+        description = ' '.join(rng.choices(WORDS, k=6)).capitalize() + '.'
+        instructions = ' '.join(f'Step {n}: {rng.choice(WORDS)} {rng.choice(INGREDIENTS)}.' for n in range(1, 7))
+        recipe_rows.append((recipe_id, name, rng.choice(CUISINES), rng.choice(account_ids), description,
+                            rng.randint(5, 45), rng.randint(5, 120), instructions, tags_to_mask(tags)))
+        ingredient_rows.extend((recipe_id, ingredient, normalize_ingredient(ingredient))
+                               for ingredient in rng.sample(INGREDIENTS, min(ingredients, len(INGREDIENTS))))
+        restriction_rows.extend((recipe_id, tag) for tag in tags)
+    conn.executemany('INSERT INTO ingredients (recipe_id, ingredient_name, ingredient_key) VALUES (?, ?, ?)', ingredient_rows)
+    conn.executemany('INSERT INTO recipe_restrictions (recipe_id, RecRestriction) VALUES (?, ?)', restriction_rows)
+    conn.executemany('''
+        INSERT INTO recipe (recipe_id, recipe_name, Cuisine_ID, UserID, recipe_description,
+                            prep_time, cook_time, instructions, restriction_mask)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', recipe_rows)
+    conn.commit()
+    log(f'{recipes} recipes, {len(ingredient_rows)} ingredients, {len(restriction_rows)} restriction tags')
+
+    # Popular recipes get most of the traffic; rank order is shuffled so it is not just the oldest ones
+    popular = list(recipe_ids)
+    rng.shuffle(popular)
+    weights = zipf_weights(len(popular))
+
+    written = 0
+    ratings = min(ratings, accounts * recipes)
+    while written < ratings:
+        # Oversample, since a user rating a recipe twice only counts once
+        remaining = ratings - written
+        pairs = dict.fromkeys((rng.choice(account_ids), recipe_id)
+                              for recipe_id in rng.choices(popular, cum_weights=weights, k=min(100000, remaining * 2)))
+        batch = [(account_id, recipe_id, rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 3, 5, 4))[0])
+                 for account_id, recipe_id in itertools.islice(pairs, remaining)]
+        written += conn.executemany('INSERT OR IGNORE INTO rates (User_ID, recipe_id, user_rating) VALUES (?, ?, ?)',
+                                    batch).rowcount
+        conn.commit()
+    log(f'{written} ratings')
+
+    saved = 0
+    for batch in chunks(((account_id, recipe_id) for account_id in account_ids
+                         for recipe_id in rng.choices(popular, cum_weights=weights, k=cookbook_entries))):
+        saved += conn.executemany('INSERT OR IGNORE INTO contains (CookBook_ID, recipe_id) VALUES (?, ?)', batch).rowcount
+    conn.commit()
+    log(f'{saved} cookbook entries')
+
+    conn.execute('PRAGMA foreign_keys = ON')
+    violations = conn.execute('PRAGMA foreign_key_check').fetchall()
+    if violations:
+        raise RuntimeError(f'generated rows violate foreign keys: {violations[:5]}')
+    conn.execute('ANALYZE')
+    return {'accounts': accounts, 'recipes': recipes, 'ingredients': len(ingredient_rows),
+            'restrictions': len(restriction_rows), 'ratings': written, 'cookbook_entries': saved}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='SQLite file to create or extend')
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=2000)
+    parser.add_argument('--ingredients', type=int, default=10, help='ingredients per recipe')
+    parser.add_argument('--ratings', type=int, default=20000)
+    parser.add_argument('--cookbook-entries', type=int, default=10, help='saved recipes per account')
+    parser.add_argument('--restricted-share', type=float, default=0.3, help='share of accounts with diet restrictions')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(args.database)
+    conn.execute('PRAGMA journal_mode = WAL')
+    generate(conn, args.accounts, args.recipes, args.ingredients, args.ratings, args.cookbook_entries,
+             args.restricted_share, args.seed, log=lambda message: print(f'[{time.perf_counter() - start:7.1f}s] {message}'))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
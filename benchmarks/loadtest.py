@@ -0,0 +1,233 @@
+"""Replay a realistic traffic mix and report latency per endpoint.
+
+Each worker logs in as a random generated account and then issues weighted
+requests to the listing APIs, recipe pages, ratings and cookbook toggles.
+Recipes are picked by a Zipf-like popularity curve, so hot rows and cache
+entries get hit the way real traffic hits them. At the end the driver prints
+p50/p95/p99 latency and throughput for each endpoint.
+
+Requests go over HTTP to a running server with ``--url``. Without it they go
+through Flask's test client in this process, which leaves out the network and
+server workers but needs no setup. Build the database with generate_data.py,
+then run from the repository root:
+
+    python benchmarks/generate_data.py load.db --ratings 1000000
+    python benchmarks/loadtest.py load.db --workers 8 --duration 30
+    python benchmarks/loadtest.py load.db --url http://127.0.0.1:5000 --workers 16
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.generate_data import INGREDIENTS, PASSWORD, zipf_weights  # noqa: E402
+
+# Endpoint -> share of traffic
+MIX = {
+    'GET /api/recipes': 30,
+    'GET /api/recommended': 20,
+    'GET /recipe/<slug>': 35,
+    'POST /rate-recipe': 10,
+    'POST /toggle-cookbook': 5,
+}
+CARD_FIELDS = 'recipe_name,recipe_image,image_key,recipe_description,avg_rating'
+
+
+class InProcessTransport:
+    """Requests through Flask's test client, in this process."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+
+
+class HTTPTransport:
+    """Requests over a keep-alive HTTP connection, carrying the session cookie."""
+
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # The server closed the idle connection; retry once on a fresh one
+            self.connection.close()
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status, data
+
+
+class Workload:
+    """Picks requests for one worker; state such as the last cursor is per worker."""
+
+    def __init__(self, rng, recipes, weights):
+        self.rng = rng
+        self.recipes = recipes
+        self.weights = weights
+        self.endpoints = list(MIX)
+        self.shares = list(MIX.values())
+        self.next_cursor = None
+
+    def recipe(self):
+        return self.rng.choices(self.recipes, cum_weights=self.weights)[0]
+
+    def next_request(self):
+        endpoint = self.rng.choices(self.endpoints, weights=self.shares)[0]
+        if endpoint == 'GET /api/recipes':
+            params = {'fields': CARD_FIELDS}
+            roll = self.rng.random()
+            if roll < 0.2:
+                params['search'] = self.rng.choice(INGREDIENTS)
+            elif roll < 0.35 and self.next_cursor:
+                params['cursor'] = self.next_cursor
+            return endpoint, 'GET', '/api/recipes?' + urllib.parse.urlencode(params), None
+        if endpoint == 'GET /api/recommended':
+            return endpoint, 'GET', '/api/recommended?' + urllib.parse.urlencode({'fields': CARD_FIELDS}), None
+        if endpoint == 'GET /recipe/<slug>':
+            return endpoint, 'GET', '/recipe/' + urllib.parse.quote(self.recipe().replace(' ', '-')), None
+        if endpoint == 'POST /rate-recipe':
+            return endpoint, 'POST', '/rate-recipe', {'recipe_name': self.recipe(), 'rating': self.rng.randint(1, 5)}
+        return endpoint, 'POST', '/toggle-cookbook/' + urllib.parse.quote(self.recipe()), None
+
+    def observe(self, endpoint, path, data):
+        if endpoint == 'GET /api/recipes' and 'search=' not in path:
+            try:
+                self.next_cursor = json.loads(data).get('next_cursor')
+            except ValueError:
+                self.next_cursor = None
+
+
+def load_fixtures(database):
+    """Recipe names by popularity and the generated accounts to log in as."""
+    conn = sqlite3.connect(database)
+    recipes = [row[0] for row in conn.execute('''
+        SELECT r.recipe_name FROM recipe r
+        LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id
+        ORDER BY s.rating_count DESC, r.recipe_id
+    ''')]
+    # Generated accounts only; their rows are stored in plaintext until the first login hashes them
+    usernames = [row[0] for row in conn.execute("SELECT username FROM account WHERE email LIKE '%@example.com'")]
+    conn.close()
+    if not recipes or not usernames:
+        raise SystemExit(f'{database} has no generated data; run benchmarks/generate_data.py first')
+    return recipes, usernames
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of already sorted ``samples``."""
+    index = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+def run(make_transport, recipes, usernames, workers=4, duration=10.0, max_requests=None, seed=1):
+    """Drive the mix from ``workers`` threads; returns (latencies, errors, elapsed)."""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    issued = [0]
+    weights = zipf_weights(len(recipes))
+    deadline = time.perf_counter() + duration
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        transport = make_transport()
+        status, _ = transport.request('POST', '/login', {'username': rng.choice(usernames), 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'login failed with HTTP {status}')
+        workload = Workload(rng, recipes, weights)
+        local, local_errors = defaultdict(list), defaultdict(int)
+        while time.perf_counter() < deadline:
+            if max_requests is not None:
+                with lock:
+                    if issued[0] >= max_requests:
+                        break
+                    issued[0] += 1
+            endpoint, method, path, body = workload.next_request()
+            start = time.perf_counter()
+            status, data = transport.request(method, path, body)
+            local[endpoint].append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                local_errors[endpoint] += 1
+            workload.observe(endpoint, path, data)
+        with lock:
+            for endpoint, samples in local.items():
+                latencies[endpoint].extend(samples)
+            for endpoint, count in local_errors.items():
+                errors[endpoint] += count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def report(latencies, errors, elapsed):
+    lines = [f'{"endpoint":24} {"requests":>9} {"errors":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"req/s":>9}']
+    rows = sorted(latencies.items()) + [('all', [s for samples in latencies.values() for s in samples])]
+    for endpoint, samples in rows:
+        samples = sorted(samples)
+        if not samples:
+            continue
+        failed = sum(errors.values()) if endpoint == 'all' else errors.get(endpoint, 0)
+        lines.append(f'{endpoint:24} {len(samples):9d} {failed:7d} {percentile(samples, 50):9.2f} '
+                     f'{percentile(samples, 95):9.2f} {percentile(samples, 99):9.2f} {len(samples) / elapsed:9.1f}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='database filled by generate_data.py')
+    parser.add_argument('--url', help='base URL of a running server; defaults to the in-process test client')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--requests', type=int, help='stop after this many requests instead')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    recipes, usernames = load_fixtures(args.database)
+    if args.url:
+        make_transport = lambda: HTTPTransport(args.url)  # noqa: E731
+    else:
+        os.environ['TASTELY_DATABASE'] = args.database
+        from app import app, init_db
+        init_db()
+        make_transport = lambda: InProcessTransport(app)  # noqa: E731
+
+    duration = float('inf') if args.requests and not args.duration else args.duration
+    latencies, errors, elapsed = run(make_transport, recipes, usernames, args.workers, duration, args.requests, args.seed)
+    print(f'{sum(map(len, latencies.values()))} requests from {args.workers} workers in {elapsed:.1f} s')
+    print(report(latencies, errors, elapsed))
+
+
+if __name__ == '__main__':
+    main()
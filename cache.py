@@ -0,0 +1,310 @@
+"""Response cache for read endpoints with tag-based invalidation.
+
+Views decorated with ``@cached`` store their rendered body under a key built
+from the request. Each entry carries dependency tags such as
+``recipe:<name>``, ``ratings:<name>`` or ``user:<id>``; write routes call
+``invalidate(...)`` with the tags they touched and every entry carrying one
+of them is dropped.
+
+The same tags drive conditional GETs: every invalidation bumps a version
+counter per tag, and ``@conditional`` derives ETag and Last-Modified from the
+versions a view depends on, answering 304 before the view runs.
+"""
+import functools
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, g, make_response, request, session
+
+
+class CacheBackend:
+    """Interface every cache backend implements."""
+
+    def get(self, key):
+        """Return the stored value, or None on a miss."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl, tags=()):
+        raise NotImplementedError
+
+    def invalidate(self, tags):
+        """Drop every entry that carries any of ``tags``."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """In-process cache bounded by entry count, with per-entry TTL."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at, tags)
+        self._tag_keys = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_keys[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[1] <= time.monotonic():
+                self._drop(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def set(self, key, value, ttl, tags=()):
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, time.monotonic() + ttl, tags)
+            for tag in tags:
+                self._tag_keys.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tag_keys.get(tag, ())):
+                    self._drop(key)
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tag_keys.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+class KeyValueCache(CacheBackend):
+    """Adapter for an external key-value store shared between workers.
+
+    ``client`` needs ``get(key)``, ``set(key, value, ex=seconds)`` and
+    ``incr(key)``, which redis-py and most memcached clients provide.
+    Tags are version counters in the store: an entry remembers the tag
+    versions it was written under and is stale once any of them moves on,
+    so invalidation is one ``incr`` per tag no matter how many entries
+    carry it. Entry keys likewise carry a generation counter, which
+    ``clear`` moves on to orphan every entry at once; the store expires
+    them by their TTL.
+    """
+
+    def __init__(self, client, prefix='tastely:', serializer=pickle):
+        self.client = client
+        self.prefix = prefix
+        self.serializer = serializer
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def _bump(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _entry_key(self, key):
+        return f"{self.prefix}{int(self.client.get(self.prefix + 'generation') or 0)}:{key}"
+
+    def _tag_versions(self, tags):
+        return {tag: int(self.client.get(self.prefix + 'tag:' + tag) or 0) for tag in tags}
+
+    def get(self, key):
+        raw = self.client.get(self._entry_key(key))
+        if raw is None:
+            self._bump('misses')
+            return None
+        value, versions = self.serializer.loads(raw)
+        if self._tag_versions(versions) != versions:
+            self._bump('misses')
+            return None
+        self._bump('hits')
+        return value
+
+    def set(self, key, value, ttl, tags=()):
+        payload = self.serializer.dumps((value, self._tag_versions(tags)))
+        self.client.set(self._entry_key(key), payload, ex=max(1, int(ttl)))
+
+    def invalidate(self, tags):
+        for tag in tags:
+            self.client.incr(self.prefix + 'tag:' + tag)
+        self._bump('invalidations', len(tags))
+
+    def clear(self):
+        self.client.incr(self.prefix + 'generation')
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class VersionStore:
+    """Version counter and last-change time for each invalidation tag.
+
+    Counters live in this process unless ``client`` (same interface as for
+    KeyValueCache) is given, which every worker must share for their ETags
+    to agree. In-process counters restart at zero, so a random epoch goes
+    into every ETag to keep ones issued by an earlier process from matching.
+    """
+
+    def __init__(self, client=None, prefix='tastely:version:'):
+        self.client = client
+        self.prefix = prefix
+        self.epoch = '' if client else uuid.uuid4().hex
+        self.started = time.time()
+        self._versions = {}  # tag -> (version, modified_at)
+        self._lock = threading.Lock()
+
+    def bump(self, tags):
+        now = time.time()
+        if self.client:
+            for tag in tags:
+                self.client.incr(self.prefix + tag)
+                self.client.set(self.prefix + tag + ':at', repr(now))
+            return
+        with self._lock:
+            for tag in tags:
+                version, _ = self._versions.get(tag, (0, None))
+                self._versions[tag] = (version + 1, now)
+
+    def lookup(self, tags):
+        if self.client:
+            return [(int(self.client.get(self.prefix + tag) or 0), float(self.client.get(self.prefix + tag + ':at') or 0) or None)
+                    for tag in tags]
+        with self._lock:
+            return [self._versions.get(tag, (0, None)) for tag in tags]
+
+    def validators(self, tags, variant=''):
+        """Strong ETag and Last-Modified time for a response built from ``tags``."""
+        versions = self.lookup(tags)
+        digest = hashlib.sha1(repr((self.epoch, sorted(zip(tags, versions)), variant)).encode()).hexdigest()
+        modified = [modified_at for _, modified_at in versions if modified_at is not None]
+        return digest[:24], max(modified, default=self.started)
+
+
+def get_cache(app=None):
+    app = app or current_app
+    return app.extensions['response_cache']
+
+
+def get_versions(app=None):
+    app = app or current_app
+    return app.extensions['content_versions']
+
+
+def add_cache_tags(*tags):
+    """Attach extra dependency tags to the response being cached."""
+    g.setdefault('cache_tags', set()).update(tags)
+
+
+def invalidate(*tags):
+    get_versions().bump(tags)
+    get_cache().invalidate(tags)
+
+
+def cached(key, tags=(), ttl=None):
+    """Cache a view's 200 responses.
+
+    ``key`` receives the view arguments and returns the cache key, or None to
+    bypass the cache for this request. ``tags`` receives the same arguments
+    and returns the entry's dependency tags; views can add more with
+    ``add_cache_tags``.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['RESPONSE_CACHE_ENABLED']:
+                return view(*args, **kwargs)
+            cache_key = key(*args, **kwargs)
+            if cache_key is None:
+                return view(*args, **kwargs)
+            cache_key = view.__name__ + ':' + cache_key
+
+            backend = get_cache()
+            hit = backend.get(cache_key)
+            if hit is not None:
+                body, mimetype = hit
+                return current_app.response_class(body, mimetype=mimetype)
+
+            g.cache_tags = set(tags(*args, **kwargs) if callable(tags) else tags)
+            response = make_response(view(*args, **kwargs))
+            if (response.status_code == 200 and not response.direct_passthrough and not response.is_streamed
+                    and not session.modified):
+                backend.set(cache_key, (response.get_data(), response.mimetype),
+                            ttl or current_app.config['RESPONSE_CACHE_TTL'], g.cache_tags)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional(resource):
+    """Answer conditional GETs from tag versions without running the view.
+
+    ``resource`` receives the view arguments and returns ``(tags, variant)``,
+    where ``variant`` covers whatever else the body depends on (the viewer,
+    query string), or None to skip validation for this request.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            spec = resource(*args, **kwargs)
+            if spec is None:
+                return view(*args, **kwargs)
+            tags, variant = spec
+            etag, last_modified = get_versions().validators(list(tags), variant)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (request.if_modified_since is not None
+                                and int(last_modified) <= request.if_modified_since.timestamp())
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = int(last_modified)
+            # Browsers may keep the body but must revalidate before reusing it
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+    app.config.setdefault('RESPONSE_CACHE_TTL', 60)
+    app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 1024)
+    backend = app.config.get('RESPONSE_CACHE_BACKEND')
+    app.extensions['response_cache'] = backend or LRUCache(app.config['RESPONSE_CACHE_MAX_ENTRIES'])
+    app.extensions['content_versions'] = app.config.get('CONTENT_VERSION_STORE') or VersionStore()
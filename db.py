@@ -0,0 +1,214 @@
+"""Pooled SQLite connections shared across requests.
+
+Routes call ``get_db()`` to borrow a connection for the lifetime of the
+current app context; it is handed back to the pool on teardown instead of
+being closed, so the page cache and PRAGMA setup survive between requests.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+
+# Applied once when a connection is opened, never per request.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -16000,  # negative means KiB, so roughly 16 MB
+    'busy_timeout': 5000,
+    'foreign_keys': 'ON',
+}
+
+# Set in a request's WSGI environ to lend it a connection from that pool instead of the app's
+POOL_ENVIRON_KEY = 'tastely.db_pool'
+
+_pool_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the pool timeout."""
+
+
+class ConnectionPool:
+    def __init__(self, database, size=5, timeout=5.0, health_check_interval=30.0, pragmas=None,
+                 factory=sqlite3.Connection):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._pid = os.getpid()
+        self._stats = {'checkouts': 0, 'waits': 0, 'reuses': 0, 'created': 0, 'discarded': 0}
+
+    def _bump(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        return stats
+
+    def connect(self):
+        """Open a new connection with the pool's PRAGMAs applied."""
+        conn = sqlite3.connect(self.database, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _reset_after_fork(self):
+        # Connections must never be shared with a forked child worker.
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._pid = os.getpid()
+                self._idle = queue.LifoQueue()
+                self._open = 0
+
+    def _healthy(self, conn, idle_since):
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+        self._bump('discarded')
+
+    def acquire(self):
+        self._reset_after_fork()
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._open < self.size
+                    if can_open:
+                        self._open += 1
+                if can_open:
+                    try:
+                        conn = self.connect()
+                    except Exception:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+                    self._bump('created')
+                    self._bump('checkouts')
+                    return conn
+                self._bump('waits')
+                try:
+                    conn, idle_since = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+
+            if self._healthy(conn, idle_since):
+                self._bump('reuses')
+                self._bump('checkouts')
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        if os.getpid() != self._pid:
+            conn.close()
+            return
+        try:
+            # Never hand an open transaction to the next request.
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+def get_pool(app=None):
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.database != app.config['DATABASE']:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None or pool.database != app.config['DATABASE']:
+                if pool is not None:
+                    pool.close_all()
+                pool = create_pool(app, app.config['DB_POOL_SIZE'])
+                app.extensions['db_pool'] = pool
+    return pool
+
+
+def create_pool(app, size):
+    """A pool of ``size`` connections to the app's database, set up like the app's own."""
+    return ConnectionPool(
+        app.config['DATABASE'],
+        size=size,
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        health_check_interval=app.config['DB_HEALTH_CHECK_INTERVAL'],
+        pragmas=app.config['DB_PRAGMAS'],
+        factory=app.config['DB_CONNECTION_FACTORY'],
+    )
+
+
+def get_db():
+    """Return the connection bound to the current app context."""
+    if 'db' not in g:
+        pool = request.environ.get(POOL_ENVIRON_KEY) if has_request_context() else None
+        g.db_pool = pool or get_pool()
+        g.db = g.db_pool.acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    pool = g.pop('db_pool', None)
+    if conn is not None:
+        (pool or get_pool()).release(conn)
+
+
+def init_app(app):
+    app.config.setdefault('DATABASE', 'database.db')
+    app.config.setdefault('DB_POOL_SIZE', 5)
+    app.config.setdefault('DB_POOL_TIMEOUT', 5.0)
+    app.config.setdefault('DB_HEALTH_CHECK_INTERVAL', 30.0)
+    app.config.setdefault('DB_PRAGMAS', DEFAULT_PRAGMAS)
+    app.config.setdefault('DB_CONNECTION_FACTORY', sqlite3.Connection)
+    app.teardown_appcontext(close_db)
+
+
+def add_missing_column(conn, table, column, declaration):
+    """ALTER TABLE ``table`` to add ``column`` unless it is already there.
+
+    Returns True when the column was added. setup.sql only creates missing
+    tables, so columns added later are migrated into existing databases here.
+    """
+    if not conn.execute('SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?', ('table', table)).fetchone():
+        return False
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column in columns:
+        return False
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+    return True
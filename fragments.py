@@ -0,0 +1,49 @@
+"""Recipe cards rendered on the server, each cached per recipe version.
+
+The dashboard and recommended pages render their first page of cards with
+the page itself, and "Load more" fetches the next page as HTML from the same
+view with ``?partial=1``, so templates/_recipe_card.html is the only card
+markup. Each card is kept in an in-process LRU under the recipe's id and
+name and the versions of its ``recipe:<name>`` and ``ratings:<name>`` tags,
+the counters invalidate() bumps. An edit, a rating or a processed upload
+moves a version, so a stale card is never looked up again and ages out; a
+page whose cache entry was dropped re-renders only the cards that changed.
+"""
+from flask import current_app, render_template
+from markupsafe import Markup
+
+from cache import LRUCache, get_versions
+
+# Columns a card shows, for select_columns()
+CARD_FIELDS = ('recipe_name', 'recipe_image', 'image_key', 'recipe_description', 'avg_rating')
+
+
+def card_tags(recipe):
+    return 'recipe:' + recipe['recipe_name'], 'ratings:' + recipe['recipe_name']
+
+
+def render_cards(recipes):
+    """The cards of ``recipes`` as one Markup string, rendering only those not cached at their current version."""
+    fragments = get_fragment_cache()
+    tags = [tag for recipe in recipes for tag in card_tags(recipe)]
+    versions = iter(get_versions().lookup(tags))
+    cards = []
+    for recipe in recipes:
+        (recipe_version, _), (ratings_version, _) = next(versions), next(versions)
+        key = f"{recipe['recipe_id']}:{recipe_version}:{ratings_version}:{recipe['recipe_name']}"
+        card = fragments.get(key)
+        if card is None:
+            card = render_template('_recipe_card.html', recipe=recipe)
+            fragments.set(key, card, current_app.config['FRAGMENT_CACHE_TTL'])
+        cards.append(card)
+    return Markup(''.join(cards))
+
+
+def get_fragment_cache(app=None):
+    return (app or current_app).extensions['fragment_cache']
+
+
+def init_app(app):
+    app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 4096)
+    app.config.setdefault('FRAGMENT_CACHE_TTL', 3600)
+    app.extensions['fragment_cache'] = LRUCache(app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
@@ -0,0 +1,211 @@
+"""Content-addressed storage and resizing for recipe image uploads.
+
+An upload is stored once under the hash of its bytes, so identical files
+share one copy and same-named uploads no longer overwrite each other. The
+request thread only hashes and writes the raw bytes; stripping metadata and
+rendering the responsive variants runs in a worker pool. The stripped copy,
+re-encoded frame by frame for GIFs so animations survive, goes to
+``<hash>-original.<ext>`` next to the variants rather than over the raw file, since every URL under images/ is served as immutable and must
+never change. When the worker is done it points every recipe using the raw
+file at the stripped copy, records the hash in ``recipe.image_key`` and
+deletes the raw file. The list views build ``srcset`` from the hash. A raw
+file whose recipe write failed is removed with discard().
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Pillow, imported by _pillow() on the first upload rather than at startup
+Image = ImageOps = ImageSequence = None
+
+# Variant name -> width in pixels; each is written as WebP and JPEG
+VARIANTS = {'thumb': 320, 'card': 640}
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+_PIL_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+# Frame settings a re-encoded GIF keeps; comments, XMP and ICC profiles are dropped
+GIF_FRAME_INFO = ('duration', 'transparency', 'disposal', 'background', 'loop')
+
+# ``created`` is True when this upload wrote the raw file rather than finding it there
+StoredImage = namedtuple('StoredImage', 'path key ready created', defaults=(False,))
+
+_executor_lock = threading.Lock()
+
+
+def _pillow():
+    """Import Pillow if that has not happened yet; returns whether it is installed."""
+    global Image, ImageOps, ImageSequence
+    if Image is None:
+        try:
+            from PIL import Image as image_module, ImageOps as ops_module, ImageSequence as sequence_module
+        except ImportError:  # Pillow is optional; uploads are then stored as-is
+            return False
+        Image, ImageOps, ImageSequence = image_module, ops_module, sequence_module
+    return True
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def variant_paths(folder, key):
+    return [os.path.join(folder, f'{key}-{name}.{ext}') for name in VARIANTS for ext in FORMATS]
+
+
+def original_path(folder, key, extension):
+    """Where the metadata-free copy of an upload goes."""
+    return os.path.join(folder, f'{key}-original.{extension}')
+
+
+def store_upload(file, folder):
+    """Write ``file`` under its content hash and return a StoredImage.
+
+    Returns None when the upload is not an image Pillow can read. ``ready``
+    is True when the stripped copy and the variants for this content already
+    exist, in which case ``path`` is the stripped copy and nothing needs to
+    be scheduled.
+    """
+    data = file.read()
+    extension = os.path.splitext(file.filename)[1].lower().lstrip('.')
+    pillow = _pillow()
+    if pillow:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                extension = _PIL_EXTENSIONS.get(image.format, extension)
+                image.verify()
+        except Exception:
+            return None
+    key = content_key(data)
+    if pillow:
+        cleaned = original_path(folder, key, extension)
+        if all(os.path.exists(p) for p in [cleaned] + variant_paths(folder, key)):
+            return StoredImage(cleaned, key, True)
+    path = os.path.join(folder, f'{key}.{extension}')
+    created = not os.path.exists(path)
+    if created:
+        _atomic_write(path, data)
+    return StoredImage(path, key if pillow else None, not pillow, created)
+
+
+def discard(stored):
+    """Remove the raw file of an upload whose recipe was never written, if this upload wrote it."""
+    if stored is not None and stored.created:
+        try:
+            os.remove(stored.path)
+        except FileNotFoundError:
+            pass
+
+
+def _atomic_write(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _save(image, path, pil_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    _atomic_write(path, buffer.getvalue())
+
+
+def render_variants(stored, folder):
+    """Write a copy of the original without metadata and every resized variant; returns the copy's path."""
+    cleaned = original_path(folder, stored.key, os.path.splitext(stored.path)[1].lstrip('.'))
+    with Image.open(stored.path) as original:
+        pil_format = original.format
+        if pil_format == 'GIF':
+            frames = []
+            for frame in ImageSequence.Iterator(original):
+                frame = frame.copy()
+                frame.info = {key: value for key, value in frame.info.items() if key in GIF_FRAME_INFO}
+                frames.append(frame)
+            _save(frames[0], cleaned, pil_format, save_all=True, append_images=frames[1:])
+            image = frames[0]
+        else:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+            # Saving without exif/icc/pnginfo drops location and camera data
+            _save(image, cleaned, pil_format, **({'quality': 90} if pil_format == 'JPEG' else {}))
+        image = image.convert('RGB')
+
+    for name, width in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((width, width * 4), Image.LANCZOS)
+        for ext, variant_format in FORMATS.items():
+            _save(variant, os.path.join(folder, f'{stored.key}-{name}.{ext}'), variant_format, quality=80)
+    return cleaned
+
+
+def _process(app, stored):
+    from cache import invalidate
+    from db import get_pool
+
+    folder = app.config['UPLOAD_FOLDER']
+    cleaned = original_path(folder, stored.key, os.path.splitext(stored.path)[1].lstrip('.'))
+    if not all(os.path.exists(p) for p in [cleaned] + variant_paths(folder, stored.key)):
+        try:
+            render_variants(stored, folder)
+        except FileNotFoundError:
+            # A job for another upload of the same file finished first and removed it
+            if not os.path.exists(cleaned):
+                raise
+    pool = get_pool(app)
+    conn = pool.acquire()
+    try:
+        names = [row['recipe_name'] for row in conn.execute('SELECT recipe_name FROM recipe WHERE recipe_image = ?', (stored.path,))]
+        conn.execute('UPDATE recipe SET recipe_image = ?, image_key = ? WHERE recipe_image = ?',
+                     (cleaned, stored.key, stored.path))
+        conn.commit()
+    finally:
+        pool.release(conn)
+    if cleaned != stored.path:
+        # Every recipe that used it was queued a job of its own, so nothing points here any more
+        try:
+            os.remove(stored.path)
+        except FileNotFoundError:
+            pass
+    with app.app_context():
+        invalidate('recipes', *('recipe:' + name for name in names))
+
+
+def _log_failure(app, stored):
+    def callback(future):
+        error = future.exception()
+        if error is not None:
+            app.logger.error('Processing image %s failed', stored.path, exc_info=error)
+    return callback
+
+
+def get_executor(app):
+    executor = app.extensions.get('image_executor')
+    if executor is None:
+        with _executor_lock:
+            executor = app.extensions.get('image_executor')
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'], thread_name_prefix='images')
+                app.extensions['image_executor'] = executor
+    return executor
+
+
+def schedule(app, stored):
+    """Render variants for ``stored`` in the worker pool once the row is committed."""
+    if stored is None or stored.ready:
+        return None
+    future = get_executor(app).submit(_process, app, stored)
+    future.add_done_callback(_log_failure(app, stored))
+    return future
+
+
+def drain(app):
+    """Wait for every queued image job to finish."""
+    with _executor_lock:
+        executor = app.extensions.pop('image_executor', None)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def init_app(app):
+    app.config.setdefault('IMAGE_WORKERS', 2)
@@ -0,0 +1,199 @@
+"""Ingredient keys and the "what can I cook" index.
+
+Ingredients are typed free-form, so normalize_ingredient folds case,
+punctuation, spacing and plurals before comparing them: 'Tomatoes ',
+'tomato' and 'TOMATO' share the key 'tomato'. create_recipe stores the key in
+``ingredients.ingredient_key`` next to the text as typed.
+
+IngredientIndex keeps one bitset per key, a Python int with bit ``i`` set
+when the recipe at position ``i`` uses that ingredient. A query adds up the
+bitsets of the ingredients on hand with a bit-sliced counter, so the cost
+grows with the number of ingredients asked about and not with the number of
+recipes each one appears in.
+"""
+import re
+from array import array
+
+from flask import current_app
+
+from live_index import LiveIndex
+
+# More ingredients than this in one query is rejected rather than counted
+MAX_QUERY_INGREDIENTS = 50
+
+_SEPARATORS = re.compile(r'[^\w]+|_')
+# Words whose plural is not a suffix rule away, or that only look plural
+_IRREGULAR = {
+    'leaves': 'leaf', 'loaves': 'loaf', 'halves': 'half', 'knives': 'knife', 'calves': 'calf',
+    'cookies': 'cookie', 'brownies': 'brownie', 'chilies': 'chili', 'molasses': 'molasses',
+}
+_INVARIANT_ENDINGS = ('ss', 'us', 'is')
+
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def _singular(word):
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if len(word) <= 3 or word.endswith(_INVARIANT_ENDINGS):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'  # berries -> berry
+    if word.endswith(('oes', 'ches', 'shes', 'xes', 'zes', 'sses')):
+        return word[:-2]  # tomatoes -> tomato, peaches -> peach
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(name):
+    """Comparison key for an ingredient: lower case, single spaces, last word singular.
+
+    Only the last word is singularised, the head noun in names like 'black
+    beans' or 'chicken thighs'. Returns '' when nothing is left.
+    """
+    words = _SEPARATORS.sub(' ', name.lower()).split()
+    if not words:
+        return ''
+    words[-1] = _singular(words[-1])
+    return ' '.join(words)
+
+
+def parse_ingredients(text):
+    """Split a comma separated ingredient list into ``(name, key)`` pairs.
+
+    Blank entries are dropped, and so is any entry with the same key as an
+    earlier one, so 'egg, Eggs,' yields just ('egg', 'egg').
+    """
+    pairs = {}
+    for name in text.split(','):
+        key = normalize_ingredient(name)
+        if key:
+            pairs.setdefault(key, name.strip())
+    return [(name, key) for key, name in pairs.items()]
+
+
+def backfill_ingredient_keys(conn):
+    """Fill ``ingredient_key`` for rows written before the column existed."""
+    rows = conn.execute('SELECT recipe_id, ingredient_name FROM ingredients WHERE ingredient_key IS NULL').fetchall()
+    conn.executemany('UPDATE ingredients SET ingredient_key = ? WHERE recipe_id = ? AND ingredient_name = ?',
+                     [(normalize_ingredient(name), recipe_id, name) for recipe_id, name in rows])
+
+
+def _bitset(positions):
+    data = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _positions(bits):
+    """Set bit positions of ``bits``, lowest first."""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset * 8
+            for bit in _BYTE_BITS[byte]:
+                yield base + bit
+
+
+class IngredientIndex:
+    """Recipes per ingredient key as bitsets over recipe positions.
+
+    Recipes are numbered in recipe_id order; ``recipe_ids[i]`` is the recipe
+    behind bit ``i``. Recipes are also bucketed by how many distinct
+    ingredients they use, which ranks results without sorting them.
+    """
+
+    def __init__(self):
+        self.recipe_ids = array('q')
+        self.postings = {}  # ingredient key -> bitset of recipes using it
+        self.by_total = {}  # distinct ingredient count -> bitset of recipes using that many
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    @classmethod
+    def load(cls, conn):
+        index = cls()
+        index.extend(conn)
+        return index
+
+    def extend(self, conn):
+        """Index the recipes added since the last load or extend; returns how many there were."""
+        recipe_ids = [row[0] for row in conn.execute('SELECT recipe_id FROM recipe WHERE recipe_id > ? ORDER BY recipe_id',
+                                                     (self.high_water,))]
+        if not recipe_ids:
+            return 0
+        keys = {recipe_id: set() for recipe_id in recipe_ids}
+        rows = conn.execute('SELECT recipe_id, ingredient_name, ingredient_key FROM ingredients WHERE recipe_id > ? AND recipe_id <= ?',
+                            (self.high_water, recipe_ids[-1]))
+        for recipe_id, name, key in rows:
+            key = key or normalize_ingredient(name)
+            if key and recipe_id in keys:
+                keys[recipe_id].add(key)
+
+        start = len(self.recipe_ids)
+        postings, by_total = {}, {}
+        for position, recipe_id in enumerate(recipe_ids, start):
+            for key in keys[recipe_id]:
+                postings.setdefault(key, []).append(position)
+            by_total.setdefault(len(keys[recipe_id]), []).append(position)
+        # Positions go in before any bit that points at them, for readers on other threads
+        self.recipe_ids.extend(recipe_ids)
+        for key, positions in postings.items():
+            self.postings[key] = self.postings.get(key, 0) | _bitset(positions)
+        for total, positions in by_total.items():
+            self.by_total[total] = self.by_total.get(total, 0) | _bitset(positions)
+        self.high_water = recipe_ids[-1]
+        return len(recipe_ids)
+
+    def cookable(self, ingredients, limit=20):
+        """Recipes using any of ``ingredients``, ranked by how little is missing.
+
+        Returns ``(recipe_id, matched, missing)`` tuples ordered by fewest
+        missing ingredients, then most of ``ingredients`` used, then recipe_id.
+        """
+        wanted = {normalize_ingredient(name) for name in ingredients}
+        bitsets = [self.postings[key] for key in wanted if key in self.postings]
+        if not bitsets or limit <= 0:
+            return []
+
+        # Bit-sliced counter: bit k of each recipe's match count lives in planes[k]
+        planes = []
+        for carry in bitsets:
+            for k, plane in enumerate(planes):
+                planes[k] = plane ^ carry
+                carry &= plane
+                if not carry:
+                    break
+            else:
+                planes.append(carry)
+        matched = {}
+        for count in range(1, min(len(bitsets), (1 << len(planes)) - 1) + 1):
+            bits = -1
+            for k, plane in enumerate(planes):
+                bits &= plane if count >> k & 1 else ~plane
+            if bits:
+                matched[count] = bits
+
+        results = []
+        for missing in range(max(self.by_total) + 1):
+            for count in sorted(matched, reverse=True):
+                bits = matched[count] & self.by_total.get(count + missing, 0)
+                if not bits:
+                    continue
+                for position in _positions(bits):
+                    results.append((self.recipe_ids[position], count, missing))
+                    if len(results) == limit:
+                        return results
+        return results
+
+
+def get_ingredient_index(app=None):
+    return (app or current_app).extensions['ingredient_index']
+
+
+def init_app(app):
+    app.extensions['ingredient_index'] = LiveIndex(app, IngredientIndex)
@@ -0,0 +1,191 @@
+"""Test runs started from the dashboard, each in a process of its own.
+
+A job is pytest in a child process whose TASTELY_DATABASE points into a fresh
+temporary directory, so it neither blocks a web worker nor writes to the live
+database, and pytest is never imported by the server. Only one job is active
+at a time. A watcher thread follows the child through the JSON lines
+tests/progress.py appends as each test finishes.
+
+Runs are remembered by the process that started them, the last
+TEST_RUN_HISTORY of them, so their status has to be asked of the same worker.
+The app imports this module from its routes on first use and sets it up then.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+POLL_INTERVAL = 0.1
+# Characters of pytest's own output kept for the finished run
+OUTPUT_TAIL = 4000
+
+
+class Job:
+    """State of one test job, updated by the watcher thread and read by requests."""
+
+    def __init__(self, target):
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.status = 'running'
+        self.exit_code = None
+        self.total = None
+        self.tests = []
+        self.output = ''
+        self.started = time.time()
+        self.finished = None
+        self.changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status != 'running'
+
+    def record(self, event):
+        with self.changed:
+            if event.get('event') == 'collected':
+                self.total = event['total']
+            elif event.get('event') == 'test':
+                self.tests.append({key: event[key] for key in ('test', 'phase', 'outcome', 'duration')})
+            self.changed.notify_all()
+
+    def finish(self, status, exit_code, output):
+        with self.changed:
+            self.status = status
+            self.exit_code = exit_code
+            self.output = output[-OUTPUT_TAIL:]
+            self.finished = time.time()
+            self.changed.notify_all()
+
+    def summary(self):
+        with self.changed:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'passed': self.status == 'passed' if self.done else None,
+                'exit_code': self.exit_code,
+                'total': self.total,
+                'completed': len(self.tests),
+                'failed': sum(1 for test in self.tests if test['outcome'] == 'failed'),
+                'started': self.started,
+                'duration': round((self.finished or time.time()) - self.started, 3),
+            }
+
+    def snapshot(self):
+        with self.changed:
+            return dict(self.summary(), tests=list(self.tests), output=self.output)
+
+    def follow(self):
+        """Yield each test event from the first one on, returning once the job is over."""
+        seen = 0
+        while True:
+            with self.changed:
+                while seen == len(self.tests) and not self.done:
+                    self.changed.wait()
+                new, done = self.tests[seen:], self.done
+            seen += len(new)
+            yield from new
+            if done:
+                return
+
+
+class JobRunner:
+    """Starts test runs one at a time and keeps the recent ones for status requests."""
+
+    def __init__(self, app):
+        self.app = app
+        self.current = None
+        self.jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def start(self):
+        """Start a job unless one is going; returns the job and whether it is new."""
+        with self._lock:
+            if self.current is not None and not self.current.done:
+                return self.current, False
+            job = self.current = Job(self.app.config['TEST_RUN_TARGET'])
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.app.config['TEST_RUN_HISTORY']:
+                self.jobs.popitem(last=False)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='test-runs')
+            self._executor.submit(self._watch, job)
+            return job, True
+
+    def _watch(self, job):
+        workdir = tempfile.mkdtemp(prefix='tastely-tests-')
+        progress = os.path.join(workdir, 'progress.jsonl')
+        env = dict(os.environ, TASTELY_DATABASE=os.path.join(workdir, 'test.db'), TASTELY_TEST_PROGRESS=progress)
+        try:
+            with open(os.path.join(workdir, 'output.txt'), 'w+') as output:
+                child = subprocess.Popen(
+                    [sys.executable, '-m', 'pytest', '-p', 'tests.progress', '-p', 'no:cacheprovider', job.target],
+                    cwd=REPOSITORY, env=env, stdout=output, stderr=subprocess.STDOUT)
+                deadline = time.monotonic() + self.app.config['TEST_RUN_TIMEOUT']
+                offset, status = 0, None
+                while child.poll() is None:
+                    offset = self._read_progress(job, progress, offset)
+                    if time.monotonic() > deadline:
+                        child.kill()
+                        child.wait()
+                        status = 'timed out'
+                    time.sleep(POLL_INTERVAL)
+                self._read_progress(job, progress, offset)
+                output.seek(0)
+                job.finish(status or ('passed' if child.returncode == 0 else 'failed'), child.returncode, output.read())
+        except Exception as e:
+            self.app.logger.exception('Test job %s failed to start', job.id)
+            job.finish('error', None, str(e))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    @staticmethod
+    def _read_progress(job, path, offset):
+        """Record the complete lines written after ``offset``; returns the new offset."""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return offset
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            job.record(json.loads(line))
+        return offset + len(complete)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_init_lock = threading.Lock()
+
+
+def get_job_runner(app=None):
+    app = app or current_app
+    with _init_lock:
+        if 'job_runner' not in app.extensions:
+            init_app(app)
+    return app.extensions['job_runner']
+
+
+def init_app(app):
+    app.config.setdefault('TEST_RUN_TARGET', 'tests/test_route.py')
+    app.config.setdefault('TEST_RUN_TIMEOUT', 600)
+    app.config.setdefault('TEST_RUN_HISTORY', 20)
+    app.extensions['job_runner'] = JobRunner(app)
@@ -0,0 +1,91 @@
+"""In-memory recipe indexes kept in step with the database.
+
+An index is built once from a connection and afterwards extended with the
+recipes whose recipe_id is above the highest one it has seen; recipe_ids only
+grow, so that picks up every insert. Deletes, and any other change named in
+``rebuild_on``, bump a counter in recipe_changes; a counter that moved since
+the last sync is answered with a full rebuild.
+
+A request checks the version of the tags the index was built from, which
+invalidate() bumps, so a worker sees its own writes on its next request and
+those of other workers within LIVE_INDEX_SYNC_INTERVAL seconds. Indexes that
+also hold values which change without a recipe insert, such as rating counts,
+name a ``max_age_setting`` config key holding how often to rebuild them.
+
+Indexes provide ``load(conn)`` as a classmethod, ``extend(conn)`` and a
+``high_water`` recipe_id.
+"""
+import threading
+import time
+
+from cache import get_versions
+
+
+class LiveIndex:
+    """Holds one index for an app and syncs it before handing it out."""
+
+    def __init__(self, app, index_class, tags=('recipes',), max_age_setting=None, rebuild_on=('delete',)):
+        self.app = app
+        self.index_class = index_class
+        self.tags = list(tags)
+        self.max_age_setting = max_age_setting
+        self.rebuild_on = sorted(rebuild_on)
+        self.index = None
+        self.rebuilds = 0
+        self._versions = None
+        self._changes = None
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self, versions, now):
+        return (self.index is not None and versions == self._versions
+                and now - self._synced_at < self.app.config['LIVE_INDEX_SYNC_INTERVAL'])
+
+    def _read_changes(self, conn):
+        placeholders = ', '.join('?' * len(self.rebuild_on))
+        return tuple(row[0] for row in conn.execute(
+            f'SELECT version FROM recipe_changes WHERE kind IN ({placeholders}) ORDER BY kind', self.rebuild_on))
+
+    def get(self, conn):
+        """The index, brought up to date with ``conn`` first when it may be stale."""
+        # The database path is part of the version, so pointing the app elsewhere rebuilds
+        versions = (self.app.config['DATABASE'], get_versions(self.app).lookup(self.tags))
+        now = time.monotonic()
+        if self._fresh(versions, now):
+            return self.index
+        usable = self.index is not None and versions[0] == self._versions[0]
+        if not self._lock.acquire(blocking=not usable):
+            return self.index  # another request is syncing; serve the index it started from
+        try:
+            if self._fresh(versions, now):
+                return self.index
+            changes = self._read_changes(conn)
+            index = self.index
+            if index is not None and (versions[0] != self._versions[0] or changes != self._changes
+                                      or self.max_age_setting and now - self._built_at >= self.app.config[self.max_age_setting]):
+                index = None
+            if index is not None:
+                index.extend(conn)
+            else:
+                # Swapped in whole, so readers never see a half-built index
+                index = self.index_class.load(conn)
+                self.rebuilds += 1
+                self._built_at = now
+            self.index = index
+            self._versions = versions
+            self._changes = changes
+            self._synced_at = now
+            return index
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        with self._lock:
+            self.index = None
+            self._versions = None
+            self._changes = None
+
+
+def init_app(app):
+    app.config.setdefault('LIVE_INDEX_SYNC_INTERVAL', 10.0)
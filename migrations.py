@@ -0,0 +1,148 @@
+"""Data migrations for databases created by older versions of setup.sql.
+
+setup.sql only creates what is missing, so a table whose key changed has to
+be rebuilt here before setup.sql runs. Each rebuild copies rows into a table
+with the new shape, drops the old one and renames the copy into place, all
+inside one write transaction. Under WAL, readers keep working from the old
+tables until it commits, and other writers wait on busy_timeout.
+
+upgrade_schema runs all of it, then setup.sql, and stamps a checksum of
+setup.sql into ``PRAGMA user_version``. A database already carrying the
+current checksum is left alone, so starting the app costs one pragma read
+instead of the whole script.
+"""
+import functools
+import os
+import zlib
+
+from db import add_missing_column
+from ingredients import backfill_ingredient_keys
+from restrictions import rebuild_restriction_masks
+
+SETUP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'setup.sql')
+
+# Child tables keyed by recipe_name before they moved to recipe.recipe_id.
+# The CREATE statements are the shapes setup.sql had when this migration was
+# written and must not follow later schema changes.
+RECIPE_ID_TABLES = {
+    'recipe_restrictions': (
+        '''CREATE TABLE {name} (
+            recipe_id INTEGER NOT NULL,
+            RecRestriction VARCHAR(30) NOT NULL,
+            FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+            PRIMARY KEY (recipe_id, RecRestriction)
+        ) WITHOUT ROWID''',
+        '''INSERT OR IGNORE INTO {name} (recipe_id, RecRestriction)
+           SELECT r.recipe_id, t.RecRestriction
+           FROM recipe_restrictions t JOIN recipe r ON r.recipe_name = t.recipe_name
+           WHERE t.RecRestriction IS NOT NULL''',
+    ),
+    'ingredients': (
+        '''CREATE TABLE {name} (
+            recipe_id INTEGER NOT NULL,
+            ingredient_name VARCHAR(80) NOT NULL,
+            FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+            PRIMARY KEY (recipe_id, ingredient_name)
+        ) WITHOUT ROWID''',
+        '''INSERT OR IGNORE INTO {name} (recipe_id, ingredient_name)
+           SELECT r.recipe_id, t.ingredient_name
+           FROM ingredients t JOIN recipe r ON r.recipe_name = t.recipe_name
+           WHERE t.ingredient_name IS NOT NULL''',
+    ),
+    'contains': (
+        '''CREATE TABLE {name} (
+            CookBook_ID INTEGER NOT NULL,
+            recipe_id INTEGER NOT NULL,
+            FOREIGN KEY(CookBook_ID) REFERENCES cookbook(CookBook_ID) ON DELETE CASCADE,
+            FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+            PRIMARY KEY (CookBook_ID, recipe_id)
+        ) WITHOUT ROWID''',
+        # Rows saved before foreign keys were enforced may hold the URL slug
+        '''INSERT OR IGNORE INTO {name} (CookBook_ID, recipe_id)
+           SELECT t.CookBook_ID, r.recipe_id
+           FROM contains t JOIN recipe r
+             ON r.recipe_name = t.recipe_name OR r.recipe_name = REPLACE(t.recipe_name, '-', ' ')
+           JOIN cookbook c ON c.CookBook_ID = t.CookBook_ID''',
+    ),
+    'rates': (
+        '''CREATE TABLE {name} (
+            User_ID INTEGER NOT NULL,
+            recipe_id INTEGER NOT NULL,
+            user_rating INTEGER CHECK (user_rating BETWEEN 0 AND 5),
+            FOREIGN KEY(User_ID) REFERENCES account(id) ON DELETE CASCADE,
+            FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+            PRIMARY KEY (User_ID, recipe_id)
+        ) WITHOUT ROWID''',
+        '''INSERT OR IGNORE INTO {name} (User_ID, recipe_id, user_rating)
+           SELECT t.User_ID, r.recipe_id, t.user_rating
+           FROM rates t JOIN recipe r ON r.recipe_name = t.recipe_name
+           JOIN account a ON a.id = t.User_ID''',
+    ),
+}
+
+# Triggers whose bodies read the old recipe_name columns. ALTER TABLE RENAME
+# re-checks every trigger in the schema, so these have to go first; setup.sql
+# recreates them against the new columns.
+RECIPE_NAME_TRIGGERS = (
+    'recipe_fts_insert', 'ingredients_fts_insert', 'ingredients_fts_delete',
+    'rates_stats_insert', 'rates_stats_update', 'rates_stats_delete',
+)
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def migrate_recipe_id_keys(conn):
+    """Rebuild child tables still keyed by recipe_name; returns their names.
+
+    Rows pointing at recipes, cookbooks or accounts that no longer exist
+    are dropped on the way, since the rebuilt tables enforce those keys.
+    The derived tables (recipe_rating_stats, recipe_fts) are keyed by
+    recipe_id already and are left as they are.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Checked under the write lock so concurrent workers migrate only once
+        legacy = [table for table in RECIPE_ID_TABLES if 'recipe_name' in _columns(conn, table)]
+        if legacy:
+            for trigger in RECIPE_NAME_TRIGGERS:
+                conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        for table in legacy:
+            create, copy = RECIPE_ID_TABLES[table]
+            conn.execute(create.format(name=table + '_migrated'))
+            conn.execute(copy.format(name=table + '_migrated'))
+            conn.execute(f'DROP TABLE {table}')
+            conn.execute(f'ALTER TABLE {table}_migrated RENAME TO {table}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return legacy
+
+
+@functools.lru_cache(maxsize=None)
+def schema_version():
+    """Checksum of setup.sql, so any edit to it counts as a new schema version."""
+    with open(SETUP_SCRIPT, 'rb') as f:
+        # Line endings depend on the checkout and do not change the schema
+        return zlib.crc32(f.read().replace(b'\r\n', b'\n')) & 0x7fffffff or 1
+
+
+def upgrade_schema(conn):
+    """Migrate ``conn`` and apply setup.sql unless it is already at schema_version(); returns whether it ran."""
+    version = schema_version()
+    if conn.execute('PRAGMA user_version').fetchone()[0] == version:
+        return False
+    migrate_recipe_id_keys(conn)
+    # Columns added to tables after they were first created by setup.sql
+    if add_missing_column(conn, 'recipe', 'restriction_mask', 'INTEGER NOT NULL DEFAULT 0'):
+        rebuild_restriction_masks(conn)
+    add_missing_column(conn, 'recipe', 'image_key', 'TEXT')
+    if add_missing_column(conn, 'ingredients', 'ingredient_key', 'TEXT'):
+        backfill_ingredient_keys(conn)
+    with open(SETUP_SCRIPT) as f:
+        conn.executescript(f.read())
+    conn.execute(f'PRAGMA user_version = {version}')
+    conn.commit()
+    return True
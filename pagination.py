@@ -0,0 +1,85 @@
+"""Keyset pagination and field projection for the JSON list endpoints.
+
+A page is fetched with ``LIMIT limit + 1``; the extra row only tells us
+whether another page exists. The cursor is an opaque token wrapping the sort
+key of the last row returned, so the next query can seek straight past it
+instead of counting through an OFFSET.
+"""
+import base64
+import binascii
+import json
+
+RECIPE_COLUMNS = (
+    'recipe_id', 'recipe_name', 'Cuisine_ID', 'UserID', 'recipe_description',
+    'prep_time', 'cook_time', 'recipe_image', 'image_key', 'instructions',
+)
+LIST_FIELDS = RECIPE_COLUMNS + ('avg_rating',)
+SEARCH_FIELDS = LIST_FIELDS + ('snippet', 'rank')
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Parse a ``limit=`` value, capped at ``maximum`` unless that is None."""
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    return limit if maximum is None else min(limit, maximum)
+
+
+def parse_fields(value, allowed=LIST_FIELDS):
+    """Parse a comma-separated ``fields=`` value; None means every field."""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError('Unknown fields: ' + ', '.join(unknown))
+    return fields
+
+
+def select_columns(fields, alias='r'):
+    """SQL column list for the projection, always including the recipe keys."""
+    if fields is None:
+        return alias + '.*'
+    keys = ['recipe_id', 'recipe_name']
+    columns = keys + [f for f in fields if f in RECIPE_COLUMNS and f not in keys]
+    return ', '.join(f'{alias}.{column}' for column in columns)
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Decode a cursor into its list of ``size`` sort-key values."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def paginate(rows, limit, key):
+    """Split ``limit + 1`` fetched rows into the page and the next cursor."""
+    page = rows[:limit]
+    next_cursor = encode_cursor(key(page[-1])) if len(rows) > limit else None
+    return page, next_cursor
+
+
+def project(row, fields):
+    if fields is None:
+        return dict(row)
+    return {field: row[field] for field in fields}
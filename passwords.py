@@ -0,0 +1,146 @@
+"""Password hashing on a bounded worker pool.
+
+Passwords are stored as ``scrypt$<n>$<r>$<p>$<salt>$<hash>``. The cost is
+PASSWORD_SCRYPT_N/R/P. hashlib.scrypt releases the GIL, so the
+PASSWORD_HASH_WORKERS threads run on separate cores while request threads
+wait on them. At most PASSWORD_HASH_QUEUE more calls may wait for a free
+worker. Past that, a call waits PASSWORD_HASH_WAIT seconds for room and then
+raises PasswordPoolBusy, which the routes turn into a 503. A login flood
+therefore sheds load instead of occupying every request worker with KDF
+work and starving the other routes. The routes hand their pooled connection
+back before hashing, and a PoolTimeout is answered with the same 503.
+
+Rows from before hashing hold the plaintext. verify() accepts them and
+returns a hash to store in their place, as it does for hashes made at an
+older cost, so accounts move to the current format on their next login.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, jsonify
+
+from db import PoolTimeout
+
+PREFIX = 'scrypt$'
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool and its queue stay full for PASSWORD_HASH_WAIT seconds."""
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, n, r, p):
+    # 128 * r * n bytes for the work array, doubled for the buffers around it
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * r * (n + p) + (1 << 20))
+
+
+def hash_with(password, n, r, p):
+    """``password`` hashed at the given cost, in the stored format. Runs on the calling thread."""
+    salt = secrets.token_bytes(16)
+    return f'{PREFIX}{n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}'
+
+
+def check(stored, password):
+    """Whether ``password`` matches ``stored``, a hash or a plaintext row. Runs on the calling thread."""
+    if not stored.startswith(PREFIX):
+        return hmac.compare_digest(stored.encode(), password.encode())
+    n, r, p, salt, expected = stored[len(PREFIX):].split('$')
+    digest = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(digest, base64.b64decode(expected))
+
+
+class PasswordHasher:
+    def __init__(self, app):
+        self.app = app
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self._slots = threading.BoundedSemaphore(self.workers + app.config['PASSWORD_HASH_QUEUE'])
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'hashed': 0, 'verified': 0, 'upgraded': 0, 'rejected': 0}
+        # Checked for unknown usernames so they take as long as real ones; cost -> hash
+        self._decoys = {}
+
+    @property
+    def cost(self):
+        config = self.app.config
+        return config['PASSWORD_SCRYPT_N'], config['PASSWORD_SCRYPT_R'], config['PASSWORD_SCRYPT_P']
+
+    def _bump(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.app.config['PASSWORD_HASH_WAIT']):
+            self._bump('rejected')
+            raise PasswordPoolBusy('Too many sign-ins at once; try again shortly')
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='passwords')
+            return self._executor.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        self._bump('hashed')
+        return self._run(hash_with, password, *self.cost)
+
+    def verify(self, stored, password):
+        """Check ``password``; returns whether it matched and, if the row should change, its new hash.
+
+        ``stored`` None stands for an unknown user and never matches.
+        """
+        self._bump('verified')
+        cost = self.cost
+        if stored is None:
+            if cost not in self._decoys:
+                self._decoys[cost] = self._run(hash_with, secrets.token_hex(8), *cost)
+            self._run(check, self._decoys[cost], password)
+            return False, None
+        if not self._run(check, stored, password):
+            return False, None
+        if stored.startswith(PREFIX + '$'.join(map(str, cost)) + '$'):
+            return True, None
+        self._bump('upgraded')
+        return True, self.hash(password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def busy_response(error):
+    response = jsonify({'message': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def get_password_hasher(app=None):
+    return (app or current_app).extensions['password_hasher']
+
+
+def init_app(app):
+    app.config.setdefault('PASSWORD_SCRYPT_N', 2 ** 14)
+    app.config.setdefault('PASSWORD_SCRYPT_R', 8)
+    app.config.setdefault('PASSWORD_SCRYPT_P', 1)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+    app.config.setdefault('PASSWORD_HASH_QUEUE', 16)
+    app.config.setdefault('PASSWORD_HASH_WAIT', 1.0)
+    app.extensions['password_hasher'] = PasswordHasher(app)
+    app.register_error_handler(PasswordPoolBusy, busy_response)
+    app.register_error_handler(PoolTimeout, busy_response)
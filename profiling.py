@@ -0,0 +1,350 @@
+"""Per-request timing, SQL instrumentation and a Prometheus ``/metrics`` view.
+
+Pool connections are created from ``ProfiledConnection``, whose cursors
+count and time ``execute`` and the ``fetch*`` calls, keyed by the statement
+text with literals stripped. Iterating a cursor directly is not timed.
+Statements are counted here rather than in a ``set_trace_callback`` hook:
+SQLite traces every statement FTS5 runs against its shadow tables, which is
+thousands per search and doubled search latency. Template rendering is
+timed separately through Flask's render signals.
+
+Every request reports its totals in a ``Server-Timing`` header and adds
+them to the counters behind ``/metrics``, which asks for METRICS_TOKEN as a
+bearer token or, when none is set, an admin session. Requests slower than
+PROFILING_SLOW_REQUEST_MS are logged together with their slowest
+statements. With PROFILING_SAMPLE_RATE above zero, that share of requests
+also runs under cProfile and writes a ``.prof`` file to PROFILING_DIR.
+"""
+import functools
+import hmac
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from flask import before_render_template, current_app, g, has_app_context, request, template_rendered
+
+import cache
+import db
+import writes
+from sessions import is_admin
+
+# Upper bounds in seconds for the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Distinct statement texts kept for /metrics; later new ones are not tracked
+MAX_TRACKED_STATEMENTS = 500
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Statement text with literals replaced by ``?`` and whitespace collapsed."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(?, ...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RequestProfile:
+    """Timings collected while one request is handled."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.queries = {}  # normalized sql -> [calls, seconds, slowest]
+        self._render_starts = []
+        self.profiler = None
+
+    def add_query(self, sql, seconds, call):
+        entry = self.queries.get(sql)
+        if entry is None:
+            entry = self.queries[sql] = [0, 0.0, 0.0]
+        if call:
+            entry[0] += 1
+            self.statements += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+        self.sql_time += seconds
+
+    def slowest(self, n=3):
+        return sorted(self.queries.items(), key=lambda item: item[1][1], reverse=True)[:n]
+
+
+def _current_profile():
+    return g.get('profile') if has_app_context() else None
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _sql = None
+
+    def _record(self, seconds, call=False):
+        profile = _current_profile()
+        if profile is not None and self._sql is not None:
+            profile.add_query(normalize_sql(self._sql), seconds, call)
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(time.perf_counter() - start, call=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(time.perf_counter() - start, call=True)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._record(time.perf_counter() - start)
+
+    # Most routes loop over the cursor, stepping the statement once per row
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._record(time.perf_counter() - start)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection factory for the pool that reports into the current request."""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # The built-in shortcuts create plain cursors, so route them through ours
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class Metrics:
+    """Process-wide counters rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}  # (endpoint, method, status) -> count
+        self.durations = {}  # endpoint -> [bucket counts..., sum, count]
+        self.endpoint_totals = {}  # endpoint -> [sql statements, sql seconds, render seconds]
+        self.statements = {}  # normalized sql -> [calls, seconds, slowest]
+
+    def observe(self, endpoint, method, status, seconds, profile):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            histogram = self.durations.get(endpoint)
+            if histogram is None:
+                histogram = self.durations[endpoint] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+            totals = self.endpoint_totals.setdefault(endpoint, [0, 0.0, 0.0])
+            totals[0] += profile.statements
+            totals[1] += profile.sql_time
+            totals[2] += profile.render_time
+
+            for sql, (calls, total, slowest) in profile.queries.items():
+                entry = self.statements.get(sql)
+                if entry is None:
+                    if len(self.statements) >= MAX_TRACKED_STATEMENTS:
+                        continue
+                    entry = self.statements[sql] = [0, 0.0, 0.0]
+                entry[0] += calls
+                entry[1] += total
+                entry[2] = max(entry[2], slowest)
+
+    def render(self, slow_statements=10, extra=()):
+        with self._lock:
+            requests = dict(self.requests)
+            durations = {endpoint: list(values) for endpoint, values in self.durations.items()}
+            totals = {endpoint: list(values) for endpoint, values in self.endpoint_totals.items()}
+            statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:slow_statements]
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        family('tastely_requests_total', 'counter', 'Requests handled, by endpoint, method and status.')
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f'tastely_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+        family('tastely_request_duration_seconds', 'histogram', 'Wall time spent handling a request.')
+        for endpoint, histogram in sorted(durations.items()):
+            for bound, count in zip(BUCKETS, histogram):
+                lines.append(f'tastely_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {count}')
+            lines.append(f'tastely_request_duration_seconds_bucket{_labels(endpoint=endpoint, le="+Inf")} {histogram[-1]}')
+            lines.append(f'tastely_request_duration_seconds_sum{_labels(endpoint=endpoint)} {histogram[-2]:.6f}')
+            lines.append(f'tastely_request_duration_seconds_count{_labels(endpoint=endpoint)} {histogram[-1]}')
+
+        for index, (name, help_text) in enumerate((
+            ('tastely_sql_statements_total', 'SQL statements executed.'),
+            ('tastely_sql_seconds_total', 'Time spent executing and fetching SQL.'),
+            ('tastely_template_render_seconds_total', 'Time spent rendering templates.'),
+        )):
+            family(name, 'counter', help_text)
+            for endpoint, values in sorted(totals.items()):
+                value = values[index]
+                lines.append(f'{name}{_labels(endpoint=endpoint)} {value if index == 0 else f"{value:.6f}"}')
+
+        family('tastely_statement_calls_total', 'counter', 'Calls of the statements with the most total time.')
+        for sql, (calls, _, _) in statements:
+            lines.append(f'tastely_statement_calls_total{_labels(statement=sql)} {calls}')
+        family('tastely_statement_seconds_total', 'counter', 'Total time of the statements with the most total time.')
+        for sql, (_, total, _) in statements:
+            lines.append(f'tastely_statement_seconds_total{_labels(statement=sql)} {total:.6f}')
+        family('tastely_statement_max_seconds', 'gauge', 'Slowest single call of those statements.')
+        for sql, (_, _, slowest) in statements:
+            lines.append(f'tastely_statement_max_seconds{_labels(statement=sql)} {slowest:.6f}')
+
+        for name, help_text, values in extra:
+            family(name, 'gauge', help_text)
+            for stat, value in sorted(values.items()):
+                lines.append(f'{name}{_labels(stat=stat)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def get_metrics(app=None):
+    return (app or current_app).extensions['metrics']
+
+
+def start_request():
+    profile = g.profile = RequestProfile()
+    rate = current_app.config['PROFILING_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is already active in this thread
+            return
+        profile.profiler = profiler
+
+
+def finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    config = current_app.config
+    if profile.profiler is not None:
+        profile.profiler.disable()
+        _dump_profile(profile.profiler, config['PROFILING_DIR'])
+    elapsed = time.perf_counter() - profile.start
+    endpoint = request.endpoint or 'unmatched'
+
+    get_metrics().observe(endpoint, request.method, response.status_code, elapsed, profile)
+    if config['PROFILING_SERVER_TIMING']:
+        response.headers['Server-Timing'] = (
+            f'total;dur={elapsed * 1000:.2f}, '
+            f'sql;dur={profile.sql_time * 1000:.2f};desc="{profile.statements} statements", '
+            f'render;dur={profile.render_time * 1000:.2f}'
+        )
+    if elapsed * 1000 >= config['PROFILING_SLOW_REQUEST_MS']:
+        slowest = '; '.join(f'{seconds * 1000:.1f} ms x{calls} {sql}' for sql, (calls, seconds, _) in profile.slowest())
+        current_app.logger.warning('Slow request %s %s: %.1f ms, %d statements, %.1f ms SQL, %.1f ms render. Slowest: %s',
+                                   request.method, request.path, elapsed * 1000, profile.statements,
+                                   profile.sql_time * 1000, profile.render_time * 1000, slowest)
+    return response
+
+
+def _dump_profile(profiler, folder):
+    os.makedirs(folder, exist_ok=True)
+    endpoint = (request.endpoint or 'unmatched').replace('.', '_')
+    profiler.dump_stats(os.path.join(folder, f'{endpoint}-{time.time_ns()}.prof'))
+
+
+def _render_started(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None:
+        profile._render_starts.append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    profile = g.get('profile')
+    if profile is not None and profile._render_starts:
+        profile.render_time += time.perf_counter() - profile._render_starts.pop()
+
+
+def metrics_view():
+    # A scraper presents METRICS_TOKEN; without one configured only admins may read the metrics
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = is_admin()
+    if not allowed:
+        return current_app.response_class('Forbidden\n', status=403, mimetype='text/plain')
+    extra = [
+        ('tastely_db_pool', 'Connection pool counters and sizes.', db.get_pool().stats()),
+        ('tastely_response_cache', 'Response cache counters.', cache.get_cache().stats()),
+        ('tastely_db_writer', 'Write queue depth and batch size counters.', writes.get_writer().stats()),
+    ]
+    body = get_metrics().render(current_app.config['METRICS_SLOW_STATEMENTS'], extra)
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.config.setdefault('PROFILING_ENABLED', True)
+    app.config.setdefault('PROFILING_SERVER_TIMING', True)
+    app.config.setdefault('PROFILING_SLOW_REQUEST_MS', 500)
+    app.config.setdefault('PROFILING_SAMPLE_RATE', 0.0)
+    app.config.setdefault('PROFILING_DIR', 'profiles')
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('METRICS_SLOW_STATEMENTS', 10)
+    app.extensions['metrics'] = Metrics()
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    app.config['DB_CONNECTION_FACTORY'] = ProfiledConnection
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
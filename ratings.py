@@ -0,0 +1,34 @@
+"""Consistency checks for the materialized recipe_rating_stats table.
+
+Triggers in setup.sql keep the table current on every rating write; these
+helpers recompute it from ``rates`` for audits and repairs.
+"""
+
+_FRESH_TOTALS = '''
+    SELECT r.recipe_id,
+           COALESCE(SUM(ra.user_rating), 0) AS rating_sum,
+           COUNT(ra.user_rating) AS rating_count
+    FROM recipe r
+    LEFT JOIN rates ra ON ra.recipe_id = r.recipe_id
+    GROUP BY r.recipe_id
+'''
+
+
+def check_rating_stats(conn):
+    """Return the ids of recipes whose stored totals disagree with rates."""
+    rows = conn.execute(f'''
+        SELECT fresh.recipe_id
+        FROM ({_FRESH_TOTALS}) fresh
+        LEFT JOIN recipe_rating_stats s ON s.recipe_id = fresh.recipe_id
+        WHERE s.recipe_id IS NULL
+           OR s.rating_sum != fresh.rating_sum
+           OR s.rating_count != fresh.rating_count
+    ''').fetchall()
+    return [row['recipe_id'] for row in rows]
+
+
+def rebuild_rating_stats(conn):
+    """Recompute every row of recipe_rating_stats from scratch."""
+    conn.execute('DELETE FROM recipe_rating_stats')
+    conn.execute(f'INSERT INTO recipe_rating_stats (recipe_id, rating_sum, rating_count) {_FRESH_TOTALS}')
+    conn.commit()
@@ -0,0 +1,312 @@
+"""Item-item collaborative filtering over the ``rates`` table.
+
+A build reads every rating into a sparse user x recipe matrix and centres
+each user's ratings on their own mean (adjusted cosine). It then multiplies
+the normalised recipe columns block by block to find each recipe's nearest
+neighbours. Only the top RECOMMENDER_NEIGHBORS per recipe are kept. Each
+user's top RECOMMENDER_TOP_N unrated recipes are scored from those
+neighbours. Both results are stored as CSR arrays, so serving a request is a
+binary search and a slice.
+
+Builds run on a background thread. A request that finds the model older
+than RECOMMENDER_REBUILD_INTERVAL schedules a build and keeps serving the old
+model meanwhile. Users who rate something are rescored against the current
+neighbours every RECOMMENDER_REFRESH_INTERVAL seconds without a full build.
+Each worker process holds its own model.
+
+NumPy and SciPy are optional. Without them there is no model, the similar
+recipes endpoint answers 503 and personalized ordering falls back to the
+weighted score.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+# NumPy and SciPy, imported by _scientific() on first use rather than at startup
+np = sparse = None
+
+# Rough cap on non-zeros produced per block multiplication, to bound memory
+BLOCK_BUDGET = 4_000_000
+
+
+def _scientific():
+    """Import NumPy and SciPy if that has not happened yet; returns whether they are installed."""
+    global np, sparse
+    if np is None:
+        try:
+            import numpy
+            from scipy import sparse as scipy_sparse
+        except ImportError:  # recommendations are disabled without NumPy and SciPy
+            return False
+        np, sparse = numpy, scipy_sparse
+    return True
+
+
+def _blocks(work, budget):
+    """Split rows into consecutive ranges whose estimated output fits ``budget``."""
+    start, total = 0, 0
+    for row, cost in enumerate(work.tolist()):
+        if total and total + cost > budget:
+            yield start, row
+            start, total = row, 0
+        total += cost
+    if start < len(work):
+        yield start, len(work)
+
+
+def _top_k(product, k, exclude=None, offset=0):
+    """The ``k`` largest positive entries of each row of CSR ``product``.
+
+    ``exclude(row)`` may return column indexes to drop from that row first.
+    Returns per-row column and value arrays, best first.
+    """
+    columns, values = [], []
+    indptr, indices, data = product.indptr, product.indices, product.data
+    for row in range(product.shape[0]):
+        lo, hi = indptr[row], indptr[row + 1]
+        cols, vals = indices[lo:hi], data[lo:hi]
+        keep = vals > 0
+        if exclude is not None:
+            keep &= ~np.isin(cols, exclude(offset + row))
+        cols, vals = cols[keep], vals[keep]
+        if len(vals) > k:
+            top = np.argpartition(-vals, k)[:k]
+            cols, vals = cols[top], vals[top]
+        order = np.lexsort((cols, -vals))
+        columns.append(cols[order])
+        values.append(vals[order])
+    return columns, values
+
+
+def _pack(columns, values):
+    """Concatenate per-row results into CSR ``(indptr, indices, values)``."""
+    indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+    np.cumsum([len(cols) for cols in columns], out=indptr[1:])
+    if not columns:
+        return indptr, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+    return indptr, np.concatenate(columns).astype(np.int32), np.concatenate(values).astype(np.float32)
+
+
+class SimilarityModel:
+    """Precomputed neighbours per recipe and recommendations per user."""
+
+    def __init__(self, recipe_ids, neighbors, user_ids, recommendations, top_n, ratings):
+        self.recipe_ids = recipe_ids  # sorted; position is the recipe's column
+        self.sim_indptr, self.sim_indices, self.sim_values = neighbors
+        self.user_ids = user_ids  # sorted
+        self.rec_indptr, self.rec_indices, self.rec_scores = recommendations
+        self.top_n = top_n
+        self.ratings = ratings
+        self.built_at = time.monotonic()
+        self.overrides = {}  # user_id -> (recipe ids, scores) rescored since the build
+        size = len(recipe_ids)
+        self.similarity = sparse.csr_matrix((self.sim_values, self.sim_indices, self.sim_indptr), shape=(size, size))
+
+    @staticmethod
+    def _find(keys, key):
+        position = int(np.searchsorted(keys, key))
+        return position if position < len(keys) and keys[position] == key else None
+
+    def similar(self, recipe_id, limit=None):
+        """Nearest recipes to ``recipe_id`` as ``(recipe_id, similarity)`` pairs."""
+        item = self._find(self.recipe_ids, recipe_id)
+        if item is None:
+            return []
+        lo, hi = self.sim_indptr[item], self.sim_indptr[item + 1]
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return list(zip(self.recipe_ids[self.sim_indices[lo:hi]].tolist(), self.sim_values[lo:hi].tolist()))
+
+    def for_user(self, user_id):
+        """Recommendations for ``user_id`` as ``(recipe_id, score)`` pairs, best first."""
+        if user_id in self.overrides:
+            recipe_ids, scores = self.overrides[user_id]
+            return list(zip(recipe_ids.tolist(), scores.tolist()))
+        user = self._find(self.user_ids, user_id)
+        if user is None:
+            return []
+        lo, hi = self.rec_indptr[user], self.rec_indptr[user + 1]
+        return list(zip(self.recipe_ids[self.rec_indices[lo:hi]].tolist(), self.rec_scores[lo:hi].tolist()))
+
+    def score_user(self, ratings):
+        """Score one user's ``(recipe_id, rating)`` rows against the neighbours."""
+        if not ratings:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        recipe_ids = np.array([recipe_id for recipe_id, _ in ratings], dtype=np.int64)
+        values = np.array([rating for _, rating in ratings], dtype=np.float64)
+        centred = values - values.mean()
+        items = np.searchsorted(self.recipe_ids, recipe_ids).clip(max=max(len(self.recipe_ids) - 1, 0))
+        known = (self.recipe_ids[items] == recipe_ids) if len(self.recipe_ids) else np.zeros(len(items), bool)
+        items, centred = items[known], centred[known]
+        row = sparse.csr_matrix((centred, (np.zeros(len(items), dtype=np.int64), items)), shape=(1, len(self.recipe_ids)))
+        columns, values = _top_k((row @ self.similarity).tocsr(), self.top_n, exclude=lambda _: items)
+        return self.recipe_ids[columns[0]], values[0].astype(np.float32)
+
+
+def build_model(conn, neighbors=20, top_n=100):
+    """Build a SimilarityModel from every row in ``rates``."""
+    if not _scientific():
+        raise RuntimeError('Recommendations need NumPy and SciPy installed')
+    rows = conn.execute('SELECT User_ID, recipe_id, user_rating FROM rates').fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    user_ids, users = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+    recipe_ids, items = np.unique(data[:, 1].astype(np.int64), return_inverse=True)
+    ratings = data[:, 2]
+    counts = np.bincount(users, minlength=len(user_ids))
+    means = np.bincount(users, ratings, minlength=len(user_ids)) / np.maximum(counts, 1)
+
+    # Adjusted cosine: each user's ratings centred on their mean, columns normalised
+    matrix = sparse.csr_matrix((ratings - means[users], (users, items)), shape=(len(user_ids), len(recipe_ids)))
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalised = (matrix @ sparse.diags(1.0 / norms)).tocsr()
+    by_recipe = normalised.T.tocsr()
+
+    # A recipe's similarity row touches every recipe its raters rated, capped at the catalogue size
+    rated = (matrix != 0).astype(np.float64)
+    work = np.minimum(np.asarray(rated.T @ np.asarray(rated.sum(axis=1)).ravel()).ravel(), len(recipe_ids))
+    columns, values = [], []
+    for start, end in _blocks(work, BLOCK_BUDGET):
+        block = (by_recipe[start:end] @ normalised).tocsr()
+        cols, vals = _top_k(block, neighbors, exclude=lambda item: item, offset=start)
+        columns += cols
+        values += vals
+    similarity = _pack(columns, values)
+
+    size = len(recipe_ids)
+    neighbours = sparse.csr_matrix((similarity[2], similarity[1], similarity[0]), shape=(size, size))
+    user_work = np.asarray(rated @ np.diff(similarity[0])).ravel()
+    columns, values = [], []
+    for start, end in _blocks(user_work, BLOCK_BUDGET):
+        block = (matrix[start:end] @ neighbours).tocsr()
+        cols, vals = _top_k(block, top_n, exclude=lambda user: matrix.indices[matrix.indptr[user]:matrix.indptr[user + 1]],
+                            offset=start)
+        columns += cols
+        values += vals
+    return SimilarityModel(recipe_ids, similarity, user_ids, _pack(columns, values), top_n, len(rows))
+
+
+class Recommender:
+    """Owns the current model for one app and schedules its rebuilds."""
+
+    def __init__(self, app):
+        self.app = app
+        self.model = None
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._future = None
+        self._last_refresh = time.monotonic()
+        self._executor = None
+
+    @property
+    def available(self):
+        return _scientific()
+
+    def similar(self, recipe_id, limit=None):
+        model = self.model
+        return model.similar(recipe_id, limit) if model is not None else []
+
+    def for_user(self, user_id):
+        model = self.model
+        return model.for_user(user_id) if model is not None else []
+
+    def rating_changed(self, user_id):
+        with self._lock:
+            self._dirty.add(user_id)
+
+    def maybe_refresh(self):
+        """Schedule a rebuild or a rescore of changed users when one is due."""
+        if not self.available:
+            return None
+        config = self.app.config
+        with self._lock:
+            if self._future is not None and not self._future.done():
+                return self._future
+            now = time.monotonic()
+            if self.model is None or now - self.model.built_at >= config['RECOMMENDER_REBUILD_INTERVAL']:
+                job = self.rebuild
+            elif self._dirty and now - self._last_refresh >= config['RECOMMENDER_REFRESH_INTERVAL']:
+                job = self.refresh_users
+            else:
+                return None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommender')
+            self._future = self._executor.submit(self._run, job)
+            return self._future
+
+    def _run(self, job):
+        try:
+            return job()
+        except Exception:
+            self.app.logger.exception('Recommendation job failed')
+
+    def rebuild(self):
+        """Build a fresh model from the database and swap it in."""
+        from cache import invalidate
+        from db import get_pool
+
+        with self._lock:
+            # Ratings from here on are rescored against the new model
+            self._dirty.clear()
+            self._last_refresh = time.monotonic()
+        pool = get_pool(self.app)
+        conn = pool.acquire()
+        try:
+            model = build_model(conn, self.app.config['RECOMMENDER_NEIGHBORS'], self.app.config['RECOMMENDER_TOP_N'])
+        finally:
+            pool.release(conn)
+        self.model = model
+        with self.app.app_context():
+            invalidate('recommendations')
+        return model
+
+    def refresh_users(self):
+        """Rescore the users who rated something since the last build or refresh."""
+        from cache import invalidate
+        from db import get_pool
+
+        with self._lock:
+            users, self._dirty = self._dirty, set()
+            self._last_refresh = time.monotonic()
+        model = self.model
+        if model is None or not users:
+            return users
+        pool = get_pool(self.app)
+        conn = pool.acquire()
+        try:
+            for user_id in users:
+                ratings = conn.execute('SELECT recipe_id, user_rating FROM rates WHERE User_ID = ?', (user_id,)).fetchall()
+                model.overrides[user_id] = model.score_user([tuple(row) for row in ratings])
+        finally:
+            pool.release(conn)
+        with self.app.app_context():
+            invalidate(*(f'user:{user_id}' for user_id in users))
+        return users
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def get_recommender(app=None):
+    return (app or current_app).extensions['recommender']
+
+
+def init_app(app):
+    app.config.setdefault('RECOMMENDER_NEIGHBORS', 20)
+    app.config.setdefault('RECOMMENDER_TOP_N', 100)
+    app.config.setdefault('RECOMMENDER_REBUILD_INTERVAL', 3600)
+    app.config.setdefault('RECOMMENDER_REFRESH_INTERVAL', 30)
+    app.extensions['recommender'] = Recommender(app)
+
+    @app.cli.command('build-recommendations')
+    def build_recommendations_command():
+        """Build the recommendation model once and report its size."""
+        model = get_recommender(app).rebuild()
+        print(f'Built recommendations from {model.ratings} ratings: {len(model.recipe_ids)} recipes, '
+              f'{len(model.user_ids)} users, {len(model.sim_indices)} neighbour links')
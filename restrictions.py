@@ -0,0 +1,119 @@
+"""Dietary restriction tags packed into integer bitmasks.
+
+Each recipe stores the OR of its tag bits in ``recipe.restriction_mask``; a
+user's restrictions compile to the same shape, and a recipe qualifies when
+``(restriction_mask & user_mask) = user_mask``. MaskIndex holds the same
+masks in memory, kept current by a LiveIndex, for checking recipes without a
+query.
+"""
+from array import array
+
+from flask import current_app
+
+from live_index import LiveIndex
+
+ALL_TAGS = ['Vegetarian', 'Vegan', 'Gluten-Free', 'Dairy-Free']
+TAG_BITS = {tag: 1 << i for i, tag in enumerate(ALL_TAGS)}
+
+
+def tags_to_mask(tags):
+    """Bitmask for a recipe's tags; tags outside ALL_TAGS are ignored."""
+    mask = 0
+    for tag in tags:
+        mask |= TAG_BITS.get(tag, 0)
+    return mask
+
+
+def user_mask(restrictions):
+    """Compile a user's restrictions into the mask a recipe must contain.
+
+    Returns 0 when nothing is filtered (no restrictions, or 'None' picked) and
+    None when a restriction falls outside the vocabulary and so has no bit;
+    callers then have to match against the recipe_restrictions rows.
+    """
+    if not restrictions or 'None' in restrictions:
+        return 0
+    if any(tag not in TAG_BITS for tag in restrictions):
+        return None
+    return tags_to_mask(restrictions)
+
+
+def rebuild_restriction_masks(conn):
+    """Recompute recipe.restriction_mask from the recipe_restrictions rows."""
+    masks = {}
+    for row in conn.execute('SELECT recipe_id, RecRestriction FROM recipe_restrictions'):
+        masks[row[0]] = masks.get(row[0], 0) | TAG_BITS.get(row[1], 0)
+    conn.execute('UPDATE recipe SET restriction_mask = 0')
+    conn.executemany('UPDATE recipe SET restriction_mask = ? WHERE recipe_id = ?',
+                     [(mask, recipe_id) for recipe_id, mask in masks.items()])
+
+
+
+class MaskIndex:
+    """Recipe masks held in parallel arrays for filtering without SQL.
+
+    Recipes are kept in recipe_id order, and ``positions`` maps a recipe_id to
+    its slot in the arrays.
+    """
+
+    def __init__(self):
+        self.recipe_ids = array('q')
+        self.masks = array('B')
+        self.positions = {}
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    @classmethod
+    def load(cls, conn):
+        index = cls()
+        index.extend(conn)
+        return index
+
+    def extend(self, conn):
+        """Add the recipes created since the last load or extend; returns how many there were."""
+        rows = conn.execute('SELECT recipe_id, restriction_mask FROM recipe WHERE recipe_id > ? ORDER BY recipe_id',
+                            (self.high_water,)).fetchall()
+        for recipe_id, mask in rows:
+            self.set(recipe_id, mask)
+        return len(rows)
+
+    def set(self, recipe_id, mask):
+        position = self.positions.get(recipe_id)
+        if position is None:
+            self.positions[recipe_id] = len(self.recipe_ids)
+            self.recipe_ids.append(recipe_id)
+            self.masks.append(mask)
+            self.high_water = max(self.high_water, recipe_id)
+        else:
+            self.masks[position] = mask
+
+    def remove(self, recipe_id):
+        position = self.positions.pop(recipe_id, None)
+        if position is None:
+            return
+        del self.recipe_ids[position]
+        del self.masks[position]
+        for moved in self.recipe_ids[position:]:
+            self.positions[moved] -= 1
+
+    def qualifies(self, recipe_id, wanted):
+        """Whether the recipe carries every bit in ``wanted``; recipes the index has not seen yet count as qualifying."""
+        position = self.positions.get(recipe_id)
+        return position is None or self.masks[position] & wanted == wanted
+
+    def matching(self, wanted):
+        """Ids of recipes carrying every bit in ``wanted``, in recipe_id order."""
+        if wanted == 0:
+            return list(self.recipe_ids)
+        return [recipe_id for recipe_id, mask in zip(self.recipe_ids, self.masks) if mask & wanted == wanted]
+
+
+def get_restriction_index(app=None):
+    return (app or current_app).extensions['restriction_index']
+
+
+def init_app(app):
+    # Edits change masks in place, so they rebuild the index like deletes do
+    app.extensions['restriction_index'] = LiveIndex(app, MaskIndex, rebuild_on=('delete', 'restrictions'))
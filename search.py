@@ -0,0 +1,70 @@
+"""Full-text recipe search backed by the recipe_fts FTS5 table."""
+import re
+
+# bm25() column weights: recipe_name, recipe_description, instructions, ingredients
+COLUMN_WEIGHTS = (10.0, 4.0, 1.0, 2.0)
+SNIPPET_TOKENS = 12
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a prefix match.
+
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    Returns None when the text has nothing searchable in it.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return ' '.join('"{}"*'.format(token) for token in tokens)
+
+
+def index_recipe(conn, recipe_id):
+    """Write the recipe's full-text row from its columns and every ingredient it has now."""
+    conn.execute('DELETE FROM recipe_fts WHERE rowid = ?', (recipe_id,))
+    conn.execute('''
+        INSERT INTO recipe_fts (rowid, recipe_name, recipe_description, instructions, ingredients)
+        SELECT r.recipe_id, r.recipe_name, r.recipe_description, r.instructions,
+               (SELECT group_concat(i.ingredient_name, ' ') FROM ingredients i WHERE i.recipe_id = r.recipe_id)
+        FROM recipe r
+        WHERE r.recipe_id = ?
+    ''', (recipe_id,))
+
+
+def search_recipes(conn, text, limit=None, after=None, columns='r.*'):
+    """Return recipes matching ``text`` ordered by BM25 rank, best first.
+
+    Each row carries ``columns``, ``avg_rating``, a highlighted ``snippet``
+    from the best matching column and its ``rank``. ``after`` is the
+    ``(rank, recipe_id)`` of the last row already seen.
+    """
+    return list(iter_search_recipes(conn, text, limit, after, columns))
+
+
+def iter_search_recipes(conn, text, limit=None, after=None, columns='r.*'):
+    """search_recipes, with the rows read from the cursor as they are iterated."""
+    match = build_match_query(text)
+    if match is None:
+        return iter(())
+    query = '''
+        SELECT * FROM (
+            SELECT {columns},
+                   COALESCE(s.avg_rating, 0) AS avg_rating,
+                   snippet(recipe_fts, -1, '<mark>', '</mark>', '...', {tokens}) AS snippet,
+                   bm25(recipe_fts, {weights}) AS rank
+            FROM recipe_fts
+            JOIN recipe r ON r.recipe_id = recipe_fts.rowid
+            LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id
+            WHERE recipe_fts MATCH ?
+        )
+    '''.format(columns=columns, tokens=SNIPPET_TOKENS, weights=', '.join(str(w) for w in COLUMN_WEIGHTS))
+    params = [match]
+    if after is not None:
+        query += ' WHERE (rank, recipe_id) > (?, ?)'
+        params.extend(after)
+    query += ' ORDER BY rank, recipe_id'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return conn.execute(query, params)
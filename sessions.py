@@ -0,0 +1,289 @@
+"""Server-side sessions and the cached auth context of each user.
+
+The cookie only carries a random session id, signed with a secret key that
+survives restarts: SECRET_KEY when configured (TASTELY_SECRET_KEY in the
+environment), otherwise one generated on first start and kept in
+``instance/secret_key`` for every later process and worker on the host.
+Session data lives in a SessionStore, by default a ``sessions`` table in a
+SQLite file of its own next to the app's database (SESSION_DATABASE to move
+it elsewhere), or any key-value store shared by the workers through
+KeyValueSessionStore. The file is separate because the store writes through
+its own autocommit connection on every login and session extension; in the
+app's database those writes would queue for the lock the writer holds for
+each batch (writes.py), or take it from under the writer. Entries last
+PERMANENT_SESSION_LIFETIME and are extended once half of that has passed,
+so an active session is not rewritten on every request; expired rows are
+swept every SESSION_SWEEP_INTERVAL seconds.
+
+The same store caches each user's AuthContext, their admin flag and dietary
+restrictions, so routes do not query the admin and user_restrictions tables
+per request. update_security_key, update_diet_restrictions and
+delete_account drop it with invalidate_auth_context(); a context filled
+from a read that raced one of those lives at most AUTH_CONTEXT_TTL seconds.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, g, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from db import get_db
+from restrictions import user_mask
+
+AuthContext = namedtuple('AuthContext', 'is_admin restrictions mask')
+
+SESSIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS sessions (
+        key TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+'''
+
+
+class SessionStore:
+    """Interface every session store implements. Values are strings."""
+
+    def get(self, key):
+        """Return the stored value, or None when it is missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def sweep(self):
+        """Remove expired entries; returns how many went."""
+        return 0
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite table, through one autocommit connection per thread.
+
+    ``database`` is a path, or a callable returning one so the store can
+    follow the app's DATABASE setting.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._local = threading.local()
+
+    def _conn(self):
+        path = self.database() if callable(self.database) else self.database
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.path != path:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(path, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA busy_timeout = 5000')
+            conn.executescript(SESSIONS_TABLE)
+            self._local.conn, self._local.path = conn, path
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT data FROM sessions WHERE key = ? AND expires_at > ?',
+                                   (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        self._conn().execute('INSERT OR REPLACE INTO sessions (key, data, expires_at) VALUES (?, ?, ?)',
+                             (key, value, time.time() + ttl))
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM sessions WHERE key = ?', (key,))
+
+    def sweep(self):
+        return self._conn().execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+class KeyValueSessionStore(SessionStore):
+    """Adapter for an external key-value store shared between workers.
+
+    ``client`` needs ``get(key)``, ``set(key, value, ex=seconds)`` and
+    ``delete(key)``, as redis-py provides. The store expires keys itself.
+    """
+
+    def __init__(self, client, prefix='tastely:session:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.previous_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        """Move the data to a new id, dropping the old one; call it when the user logs in."""
+        if self.sid is not None and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+        self._last_sweep = time.monotonic()
+        self._sweep_lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='tastely-session')
+
+    def open_session(self, app, request):
+        token = request.cookies.get(self.get_cookie_name(app))
+        if token:
+            try:
+                sid = self._signer(app).unsign(token).decode()
+            except BadSignature:
+                sid = None
+            stored = self.store.get('session:' + sid) if sid else None
+            if stored is not None:
+                value = self.serializer.loads(stored)
+                return ServerSession(value['data'], sid, value['expires_at'])
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name, domain, path = self.get_cookie_name(app), self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.previous_sid is not None:
+            self.store.delete('session:' + session.previous_sid)
+            session.previous_sid = None
+        if not session:
+            if session.sid is not None:
+                self.store.delete('session:' + session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        # Past half its lifetime an unchanged session is written again to extend it
+        if not session.modified and session.expires_at and session.expires_at - now > lifetime / 2:
+            return
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + lifetime
+        self.store.set('session:' + session.sid, self.serializer.dumps({'data': dict(session),
+                                                                        'expires_at': session.expires_at}), lifetime)
+        response.set_cookie(name, self._signer(app).sign(session.sid).decode(),
+                            expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        self._maybe_sweep(app)
+
+    def _maybe_sweep(self, app):
+        if time.monotonic() - self._last_sweep < app.config['SESSION_SWEEP_INTERVAL']:
+            return
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = time.monotonic()
+            removed = self.store.sweep()
+            if removed:
+                app.logger.info('Swept %d expired session entries', removed)
+        finally:
+            self._sweep_lock.release()
+
+
+def get_session_store(app=None):
+    return (app or current_app).extensions['session_store']
+
+
+def auth_context(user_id=None):
+    """AuthContext of ``user_id``, by default the logged-in user; None when nobody is logged in."""
+    user_id = user_id or session.get('user_id')
+    if user_id is None:
+        return None
+    cached = g.setdefault('auth_contexts', {})
+    if user_id in cached:
+        return cached[user_id]
+    store = get_session_store()
+    stored = store.get(f'auth:{user_id}')
+    if stored is not None:
+        is_admin, restrictions = ServerSessionInterface.serializer.loads(stored)
+    else:
+        conn = get_db()
+        is_admin = conn.execute('SELECT 1 FROM admin WHERE Account_ID = ?', (user_id,)).fetchone() is not None
+        restrictions = [row[0] for row in conn.execute(
+            'SELECT UserRestriction FROM user_restrictions WHERE User_ID = ?', (user_id,))]
+        store.set(f'auth:{user_id}', ServerSessionInterface.serializer.dumps([is_admin, restrictions]),
+                  current_app.config['AUTH_CONTEXT_TTL'])
+    context = cached[user_id] = AuthContext(is_admin, restrictions, user_mask(restrictions))
+    return context
+
+
+def is_admin():
+    context = auth_context()
+    return bool(context and context.is_admin)
+
+
+def invalidate_auth_context(user_id):
+    """Forget ``user_id``'s cached AuthContext after a change to their admin row or restrictions."""
+    get_session_store().delete(f'auth:{user_id}')
+    g.get('auth_contexts', {}).pop(user_id, None)
+
+
+def load_secret_key(app):
+    """SECRET_KEY if set, else the key in the instance folder, created by the first process to need it."""
+    if app.config.get('SECRET_KEY'):
+        return app.config['SECRET_KEY']
+    path = os.path.join(app.instance_path, 'secret_key')
+    os.makedirs(app.instance_path, exist_ok=True)
+    try:
+        # O_EXCL makes one of several workers starting at once the one that writes it
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        key = b''
+        while not key:  # empty until the process that created it has written it
+            with open(path, 'rb') as f:
+                key = f.read()
+            time.sleep(0 if key else 0.01)
+        return key
+    key = os.urandom(32)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def session_database(app):
+    """SESSION_DATABASE, or ``<database>-sessions.db`` beside the app's DATABASE."""
+    return app.config['SESSION_DATABASE'] or os.path.splitext(app.config['DATABASE'])[0] + '-sessions.db'
+
+
+def init_app(app):
+    app.config.setdefault('SECRET_KEY', os.environ.get('TASTELY_SECRET_KEY'))
+    app.config.setdefault('SESSION_DATABASE', None)
+    app.config.setdefault('SESSION_SWEEP_INTERVAL', 3600)
+    app.config.setdefault('AUTH_CONTEXT_TTL', 300)
+    app.secret_key = load_secret_key(app)
+    store = app.config.get('SESSION_STORE') or SQLiteSessionStore(lambda: session_database(app))
+    app.extensions['session_store'] = store
+    app.session_interface = ServerSessionInterface(store)
+    app.add_template_global(is_admin)
@@ -44,24 +44,34 @@ CREATE TABLE IF NOT EXISTS recipe (
     prep_time INTEGER,  
     cook_time INTEGER,  
     recipe_image TEXT,  
+    image_key TEXT,  -- content hash of recipe_image once its variants exist, see images.py
     instructions TEXT,
+    restriction_mask INTEGER NOT NULL DEFAULT 0,  -- bit per tag, see restrictions.py
     FOREIGN KEY(Cuisine_ID) REFERENCES cuisine(Cuisine_ID) ON DELETE SET NULL,
-    FOREIGN KEY(UserID) REFERENCES account(id) ON DELETE CASCADE
+    FOREIGN KEY(UserID) REFERENCES account(id) ON DELETE SET NULL  -- recipes outlive their author's account
 );
 
+-- Child tables reference recipes by recipe_id; databases that still key them
+-- by recipe_name are rebuilt by migrations.py before this script runs.
+-- WITHOUT ROWID stores each row in its primary key, so lookups by the leading
+-- key columns are covered without a second B-tree.
 CREATE TABLE IF NOT EXISTS recipe_restrictions (
-    recipe_name VARCHAR(80),
-    RecRestriction VARCHAR(30),
-    FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE,
-    PRIMARY KEY (recipe_name, RecRestriction)
-);
+    recipe_id INTEGER NOT NULL,
+    RecRestriction VARCHAR(30) NOT NULL,
+    FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+    PRIMARY KEY (recipe_id, RecRestriction)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_recipe_restrictions_tag ON recipe_restrictions (RecRestriction, recipe_id);
 
 CREATE TABLE IF NOT EXISTS ingredients (
-    recipe_name VARCHAR(80),
-    ingredient_name VARCHAR(80),
-    FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE,
-    PRIMARY KEY (recipe_name, ingredient_name)
-);
+    recipe_id INTEGER NOT NULL,
+    ingredient_name VARCHAR(80) NOT NULL,
+    -- ingredient_name folded by ingredients.normalize_ingredient
+    ingredient_key TEXT,
+    FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+    PRIMARY KEY (recipe_id, ingredient_name)
+) WITHOUT ROWID;
 
 CREATE TABLE IF NOT EXISTS user_restrictions (
     User_ID INTEGER,
@@ -77,23 +87,156 @@ CREATE TABLE IF NOT EXISTS cookbook (
 
 
 CREATE TABLE IF NOT EXISTS contains (
-    CookBook_ID INTEGER,
-    recipe_name TEXT,
+    CookBook_ID INTEGER NOT NULL,
+    recipe_id INTEGER NOT NULL,
     FOREIGN KEY(CookBook_ID) REFERENCES cookbook(CookBook_ID) ON DELETE CASCADE,
-    FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE,
-    PRIMARY KEY (CookBook_ID, recipe_name)
-);
+    FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+    PRIMARY KEY (CookBook_ID, recipe_id)
+) WITHOUT ROWID;
 
 
 CREATE TABLE IF NOT EXISTS rates (
     User_ID INTEGER NOT NULL,
-    recipe_name VARCHAR(80) NOT NULL,
+    recipe_id INTEGER NOT NULL,
     user_rating INTEGER CHECK (user_rating BETWEEN 0 AND 5),
     FOREIGN KEY(User_ID) REFERENCES account(id) ON DELETE CASCADE,
-    FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE,
-    PRIMARY KEY (User_ID, recipe_name)
+    FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE,
+    PRIMARY KEY (User_ID, recipe_id)
+) WITHOUT ROWID;
+
+-- Child-side indexes so ON DELETE CASCADE from recipe does not scan. The
+-- rates one also covers the per-recipe totals in ratings.py.
+CREATE INDEX IF NOT EXISTS idx_contains_recipe ON contains (recipe_id);
+CREATE INDEX IF NOT EXISTS idx_rates_recipe ON rates (recipe_id, user_rating);
+-- Recipes by author: the cookbook lists a user's own recipes, and deleting an
+-- account cascades to them.
+CREATE INDEX IF NOT EXISTS idx_recipe_user ON recipe (UserID);
+
+-- Running rating totals per recipe, maintained by the triggers below so list
+-- endpoints never aggregate over rates. weighted_score is a Bayesian average
+-- that pulls recipes with few ratings towards a prior of 3 stars worth 5 votes.
+CREATE TABLE IF NOT EXISTS recipe_rating_stats (
+    recipe_id INTEGER PRIMARY KEY,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    avg_rating REAL GENERATED ALWAYS AS (
+        CASE WHEN rating_count > 0 THEN CAST(rating_sum AS REAL) / rating_count ELSE 0.0 END
+    ) STORED,
+    weighted_score REAL GENERATED ALWAYS AS ((rating_sum + 3.0 * 5) / (rating_count + 5)) STORED,
+    FOREIGN KEY(recipe_id) REFERENCES recipe(recipe_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_rating_stats_avg ON recipe_rating_stats (avg_rating DESC, recipe_id);
+CREATE INDEX IF NOT EXISTS idx_rating_stats_score ON recipe_rating_stats (weighted_score DESC, recipe_id);
+
+CREATE TRIGGER IF NOT EXISTS recipe_rating_stats_insert AFTER INSERT ON recipe BEGIN
+    INSERT OR IGNORE INTO recipe_rating_stats (recipe_id) VALUES (new.recipe_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS rates_stats_insert AFTER INSERT ON rates BEGIN
+    UPDATE recipe_rating_stats
+    SET rating_sum = rating_sum + COALESCE(new.user_rating, 0),
+        rating_count = rating_count + (new.user_rating IS NOT NULL)
+    WHERE recipe_id = new.recipe_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rates_stats_update AFTER UPDATE OF user_rating, recipe_id ON rates BEGIN
+    UPDATE recipe_rating_stats
+    SET rating_sum = rating_sum - COALESCE(old.user_rating, 0),
+        rating_count = rating_count - (old.user_rating IS NOT NULL)
+    WHERE recipe_id = old.recipe_id;
+    UPDATE recipe_rating_stats
+    SET rating_sum = rating_sum + COALESCE(new.user_rating, 0),
+        rating_count = rating_count + (new.user_rating IS NOT NULL)
+    WHERE recipe_id = new.recipe_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS rates_stats_delete AFTER DELETE ON rates BEGIN
+    UPDATE recipe_rating_stats
+    SET rating_sum = rating_sum - COALESCE(old.user_rating, 0),
+        rating_count = rating_count - (old.user_rating IS NOT NULL)
+    WHERE recipe_id = old.recipe_id;
+END;
+
+-- Seed totals for recipes that predate the stats table
+INSERT INTO recipe_rating_stats (recipe_id, rating_sum, rating_count)
+SELECT r.recipe_id, COALESCE(SUM(ra.user_rating), 0), COUNT(ra.user_rating)
+FROM recipe r
+LEFT JOIN rates ra ON ra.recipe_id = r.recipe_id
+WHERE r.recipe_id NOT IN (SELECT recipe_id FROM recipe_rating_stats)
+GROUP BY r.recipe_id;
+
+-- Change counters the in-memory indexes (live_index.py) poll to notice
+-- deletes and restriction edits, which extending by recipe_id cannot pick up.
+-- Reading a row here replaces counting every recipe on each sync.
+CREATE TABLE IF NOT EXISTS recipe_changes (
+    kind TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO recipe_changes (kind) VALUES ('delete'), ('restrictions');
+
+CREATE TRIGGER IF NOT EXISTS recipe_changes_delete AFTER DELETE ON recipe BEGIN
+    UPDATE recipe_changes SET version = version + 1 WHERE kind = 'delete';
+END;
+
+CREATE TRIGGER IF NOT EXISTS recipe_changes_restrictions AFTER UPDATE OF restriction_mask ON recipe
+WHEN old.restriction_mask IS NOT new.restriction_mask BEGIN
+    UPDATE recipe_changes SET version = version + 1 WHERE kind = 'restrictions';
+END;
+
+-- Full-text index over recipes, keyed by recipe_id. The ingredients column
+-- holds every ingredient of the recipe joined by spaces.
+CREATE VIRTUAL TABLE IF NOT EXISTS recipe_fts USING fts5(
+    recipe_name,
+    recipe_description,
+    instructions,
+    ingredients,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
 );
 
+-- Also picks up ingredients inserted ahead of the recipe in the same
+-- transaction. Recreated on every start so older databases get it too.
+DROP TRIGGER IF EXISTS recipe_fts_insert;
+CREATE TRIGGER recipe_fts_insert AFTER INSERT ON recipe BEGIN
+    INSERT INTO recipe_fts (rowid, recipe_name, recipe_description, instructions, ingredients)
+    VALUES (new.recipe_id, new.recipe_name, new.recipe_description, new.instructions,
+            (SELECT group_concat(ingredient_name, ' ') FROM ingredients WHERE recipe_id = new.recipe_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS recipe_fts_update AFTER UPDATE OF recipe_name, recipe_description, instructions ON recipe BEGIN
+    UPDATE recipe_fts
+    SET recipe_name = new.recipe_name, recipe_description = new.recipe_description, instructions = new.instructions
+    WHERE rowid = new.recipe_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS recipe_fts_delete AFTER DELETE ON recipe BEGIN
+    DELETE FROM recipe_fts WHERE rowid = old.recipe_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ingredients_fts_insert AFTER INSERT ON ingredients BEGIN
+    UPDATE recipe_fts
+    SET ingredients = COALESCE(ingredients || ' ', '') || new.ingredient_name
+    WHERE rowid = new.recipe_id;
+END;
+
+-- Skipped when the recipe itself is gone, so a cascading delete does not
+-- rewrite the full-text row once per ingredient
+CREATE TRIGGER IF NOT EXISTS ingredients_fts_delete AFTER DELETE ON ingredients
+WHEN EXISTS (SELECT 1 FROM recipe WHERE recipe_id = old.recipe_id) BEGIN
+    UPDATE recipe_fts
+    SET ingredients = (SELECT group_concat(ingredient_name, ' ') FROM ingredients WHERE recipe_id = old.recipe_id)
+    WHERE rowid = old.recipe_id;
+END;
+
+-- Index recipes that predate the full-text table
+INSERT INTO recipe_fts (rowid, recipe_name, recipe_description, instructions, ingredients)
+SELECT r.recipe_id, r.recipe_name, r.recipe_description, r.instructions,
+       (SELECT group_concat(i.ingredient_name, ' ') FROM ingredients i WHERE i.recipe_id = r.recipe_id)
+FROM recipe r
+WHERE r.recipe_id NOT IN (SELECT rowid FROM recipe_fts);
+
 -- Insert into 'cuisine' only if the cuisine does not already exist
 INSERT OR IGNORE INTO cuisine (Cuisine_ID) VALUES
 ('American'),
@@ -1,59 +1,46 @@
 document.addEventListener("DOMContentLoaded", function() {
     const recipesContainer = document.querySelector('.recipes-container');
     const searchForm = document.querySelector('form');
+    const loadMoreButton = document.getElementById('load-more');
 
-    function fetchRecipes(query = '') {
-        let url = '/api/recipes';
-        if (query) {
-            url += '?search=' + encodeURIComponent(query);
-        }
+    // The server renders the first page of cards; later pages come from the same URL as HTML
+    function loadMore() {
+        const marker = recipesContainer.querySelector('[data-next-cursor]');
+        const params = new URLSearchParams(window.location.search);
+        params.set('cursor', marker.dataset.nextCursor);
+        params.set('partial', '1');
 
-        fetch(url)
-            .then(response => response.json())
-            .then(data => {
-                displayRecipes(data.recipes);
+        fetch(window.location.pathname + '?' + params.toString())
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.text();
+            })
+            .then(html => {
+                marker.remove();
+                recipesContainer.insertAdjacentHTML('beforeend', html);
+                const next = recipesContainer.querySelector('[data-next-cursor]');
+                loadMoreButton.classList.toggle('hidden', !next.dataset.nextCursor);
             })
             .catch(error => {
                 console.error('Error loading recipes:', error);
-                recipesContainer.innerHTML = '<p>Error loading recipes.</p>';
             });
     }
 
-    function displayRecipes(recipes) {
-        recipesContainer.innerHTML = ''; 
-        recipes.forEach(recipe => {
-            const stars = renderStars(recipe.avg_rating);
-            const recipeElem = document.createElement('div');
-            recipeElem.className = 'bg-white rounded-lg shadow p-4 flex flex-col';
-            recipeElem.innerHTML = `
-                <div class="h-48 w-full overflow-hidden rounded-lg">
-                    <img src="${recipe.recipe_image}" alt="${recipe.recipe_name}" class="w-full h-full object-cover">
-                </div>
-                <div class="flex-grow flex justify-between items-center">
-                    <h3 class="font-bold text-lg mt-2">${recipe.recipe_name}</h3>
-                    <div class="text-yellow-400 text-lg">${stars}</div>
-                </div>
-                <p class="text-gray-600">${recipe.recipe_description}</p>
-                <button onclick="location.href='/recipe/${encodeURIComponent(recipe.recipe_name.replace(/ /g, '-'))}';" class="mt-3 px-4 py-2 bg-green-500 text-white rounded hover:bg-green-700 transition">View Recipe</button>
-            `;
-            recipesContainer.appendChild(recipeElem);
-        });
-    }
-    
-    function renderStars(rating) {
-        let stars = '';
-        for (let i = 1; i <= 5; i++) {
-            if (i <= Math.round(rating)) {
-                stars += '★';  // Black star
-            } else {
-                stars += '☆';  // White star
-            }
-        }
-        return stars;
+    function waitForTests(statusUrl) {
+        return fetch(statusUrl)
+            .then(response => response.json())
+            .then(data => data.status === 'running'
+                ? new Promise(resolve => setTimeout(resolve, 1000)).then(() => waitForTests(statusUrl))
+                : data);
     }
+
     function runTests() {
-        fetch('/run-tests')
+        // The run happens in a background job; 409 means one is already going, so follow that one
+        fetch('/run-tests', { method: 'POST' })
             .then(response => response.json())
+            .then(job => waitForTests(job.status_url))
             .then(data => {
                 let alertBox = document.createElement('div');
                 alertBox.style.position = 'fixed';
@@ -67,8 +54,8 @@ document.addEventListener("DOMContentLoaded", function() {
                 alertBox.style.zIndex = 9999;
     
                 alertBox.innerText = data.passed
-                    ? `✅ All tests passed (exit code ${data.exit_code})`
-                    : `❌ Tests failed (exit code ${data.exit_code})`;
+                    ? `✅ All ${data.completed} tests passed in ${data.duration}s`
+                    : `❌ ${data.failed} of ${data.completed} tests failed (${data.status}, exit code ${data.exit_code})`;
     
                 document.body.appendChild(alertBox);
                 setTimeout(() => alertBox.remove(), 6000);
@@ -79,14 +66,34 @@ document.addEventListener("DOMContentLoaded", function() {
     }
     
     
-    // Listen for search form submission to re-fetch recipes based on search query
-    searchForm.addEventListener('submit', function(event) {
-        event.preventDefault();
-        const searchValue = this.querySelector('input[name="search"]').value;
-        fetchRecipes(searchValue);
+    // Typeahead: ask for completions on every keystroke, dropping replies to older ones
+    const searchInput = searchForm.querySelector('input[name="search"]');
+    const suggestionList = document.getElementById('search-suggestions');
+    let pendingSuggest = null;
+    searchInput.addEventListener('input', function() {
+        if (pendingSuggest) {
+            pendingSuggest.abort();
+        }
+        pendingSuggest = new AbortController();
+        fetch('/api/suggest?' + new URLSearchParams({ q: this.value }), { signal: pendingSuggest.signal })
+            .then(response => response.json())
+            .then(data => {
+                suggestionList.innerHTML = '';
+                data.suggestions.forEach(suggestion => {
+                    const option = document.createElement('option');
+                    option.value = suggestion.text;
+                    option.label = suggestion.type;
+                    suggestionList.appendChild(option);
+                });
+            })
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    console.error('Error loading suggestions:', error);
+                }
+            });
     });
 
-    fetchRecipes(); // Initial fetch of recipes when the page loads
+    loadMoreButton.addEventListener('click', loadMore);
 
     // Test button logic
     document.getElementById("test-button").addEventListener("click", function () {
@@ -0,0 +1,80 @@
+"""Streamed JSON and NDJSON bodies for the recipe listings.
+
+The paged listings fetch a page with fetchall() and hand it to jsonify, which
+is fine at MAX_LIMIT rows. With ``?stream=json`` or ``?stream=ndjson`` they
+instead send every row after the cursor (or ``limit`` of them, uncapped)
+straight off the SQLite cursor, STREAM_CHUNK_ROWS rows per write, so memory
+stays flat however many recipes match and the first bytes leave before the
+last row is read. ``json`` keeps the paged shape, ``{"recipes": [...],
+"next_cursor": null}``; ``ndjson`` sends one recipe per line.
+
+Streamed bodies are never stored in the response cache. Rows are encoded
+with orjson when it is installed and the json module otherwise.
+"""
+import itertools
+import json
+
+from flask import current_app, request, stream_with_context
+
+from pagination import project
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; rows are encoded by the json module then
+    orjson = None
+
+# ?stream= value -> mimetype
+FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def encode(value):
+    """``value`` as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return _encoder.encode(value).encode()
+
+
+def stream_format():
+    """The requested ``?stream=`` format, or None for a normal paged response."""
+    value = request.args.get('stream')
+    if not value:
+        return None
+    if value not in FORMATS:
+        raise ValueError('stream must be one of: ' + ', '.join(FORMATS))
+    return value
+
+
+def _chunks(rows, fields, size):
+    """Lists of up to ``size`` encoded rows, read from ``rows`` as they are needed."""
+    rows = iter(rows)
+    while True:
+        chunk = [encode(project(row, fields)) for row in itertools.islice(rows, size)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_rows(rows, fields, fmt):
+    """A response streaming ``rows``, projected to ``fields``, as ``fmt``."""
+    chunks = _chunks(rows, fields, current_app.config['STREAM_CHUNK_ROWS'])
+
+    def ndjson():
+        for chunk in chunks:
+            yield b'\n'.join(chunk) + b'\n'
+
+    def json_array():
+        yield b'{"recipes":['
+        separator = b''
+        for chunk in chunks:
+            yield separator + b','.join(chunk)
+            separator = b','
+        yield b'],"next_cursor":null}'
+
+    body = ndjson() if fmt == 'ndjson' else json_array()
+    return current_app.response_class(stream_with_context(body), mimetype=FORMATS[fmt])
+
+
+def init_app(app):
+    app.config.setdefault('STREAM_CHUNK_ROWS', 100)
@@ -0,0 +1,167 @@
+"""Typeahead suggestions for recipe names, cuisines and ingredients.
+
+Every suggestion is indexed under each of its words, so 'cu' finds 'Spicy
+Chicken Curry', in one sorted list of ``(key, entry)`` pairs searched with
+bisect. Any prefix shared by at least ``heavy_size`` keys also gets its best
+``SUGGEST_MAX_RESULTS`` entries precomputed. A lookup is therefore either a
+dict hit or a scan of fewer than ``heavy_size`` keys, however many recipes
+there are.
+
+Suggestions rank by popularity, the rating count of a recipe or the summed
+rating counts of the recipes using a cuisine or ingredient. New recipes are
+added in place. Rating counts drift until the next full rebuild, every
+SUGGEST_REBUILD_INTERVAL seconds.
+"""
+import heapq
+import re
+from bisect import bisect_left, insort
+
+from flask import current_app
+
+from ingredients import normalize_ingredient
+from live_index import LiveIndex
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_LAST = '\U0010ffff'
+
+
+def fold(text):
+    """Lower case words separated by single spaces, the form keys and queries are compared in."""
+    return ' '.join(_WORD_RE.findall(text.lower()))
+
+
+def word_keys(text):
+    """``text`` folded and cut at the start of each word: 'a b c' gives 'a b c', 'b c' and 'c'."""
+    words = fold(text).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class SuggestIndex:
+    """Sorted word keys over recipe, cuisine and ingredient entries."""
+
+    def __init__(self, limit=10, heavy_size=64):
+        self.limit = limit
+        self.heavy_size = heavy_size
+        self.entries = []  # entry -> [kind, text, popularity]
+        self.keys = []  # sorted (key, entry) pairs
+        self.heavy = {}  # prefix -> best entries under it, best first
+        self.recipe_ids = set()
+        self.cuisines = {}  # Cuisine_ID -> entry
+        self.ingredients = {}  # ingredient key -> entry
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    @classmethod
+    def load(cls, conn, limit=None, heavy_size=64):
+        index = cls(limit or current_app.config['SUGGEST_MAX_RESULTS'], heavy_size)
+        for (cuisine,) in conn.execute('SELECT Cuisine_ID FROM cuisine'):
+            index.cuisines[cuisine] = index._add('cuisine', cuisine, 0)
+        index._read(conn)
+        index.keys = sorted((key, entry) for entry, (_, text, _) in enumerate(index.entries) for key in word_keys(text))
+        index._collect('', 0, len(index.keys))
+        return index
+
+    def _rank(self, entry):
+        kind, text, popularity = self.entries[entry]
+        return -popularity, text.lower(), entry
+
+    def _top(self, entries):
+        return heapq.nsmallest(self.limit, set(entries), key=self._rank)
+
+    def _add(self, kind, text, popularity):
+        self.entries.append([kind, text, popularity])
+        return len(self.entries) - 1
+
+    def _read(self, conn):
+        """Add recipes past ``high_water`` and their ingredients; returns the entries that changed."""
+        recipes = conn.execute('''
+            SELECT r.recipe_id, r.recipe_name, r.Cuisine_ID, COALESCE(s.rating_count, 0)
+            FROM recipe r
+            LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id
+            WHERE r.recipe_id > ?
+            ORDER BY r.recipe_id
+        ''', (self.high_water,)).fetchall()
+        if not recipes:
+            return set()
+        ingredients = {}
+        for recipe_id, name, key in conn.execute(
+                'SELECT recipe_id, ingredient_name, ingredient_key FROM ingredients WHERE recipe_id > ? AND recipe_id <= ?',
+                (self.high_water, recipes[-1][0])):
+            ingredients.setdefault(recipe_id, {}).setdefault(key or normalize_ingredient(name), name)
+
+        changed = set()
+        for recipe_id, name, cuisine, ratings in recipes:
+            self.recipe_ids.add(recipe_id)
+            changed.add(self._add('recipe', name, ratings))
+            uses = [self.cuisines.get(cuisine)]
+            for key, spelling in ingredients.get(recipe_id, {}).items():
+                if key and key not in self.ingredients:
+                    self.ingredients[key] = self._add('ingredient', spelling.strip(), 0)
+                    changed.add(self.ingredients[key])
+                uses.append(self.ingredients.get(key))
+            for entry in uses:
+                if entry is not None and ratings:
+                    self.entries[entry][2] += ratings
+                    changed.add(entry)
+        self.high_water = recipes[-1][0]
+        return changed
+
+    def _collect(self, prefix, lo, hi):
+        """Best entries among ``keys[lo:hi]``, which all start with ``prefix``; caches heavy prefixes."""
+        if hi - lo < self.heavy_size:
+            return self._top(entry for _, entry in self.keys[lo:hi])
+        depth = len(prefix)
+        # Keys equal to the prefix sort ahead of the longer ones
+        start = bisect_left(self.keys, (prefix + '\0',), lo, hi)
+        candidates = [entry for _, entry in self.keys[lo:start]]
+        while start < hi:
+            child = self.keys[start][0][:depth + 1]
+            end = bisect_left(self.keys, (child[:-1] + chr(ord(child[-1]) + 1),), start, hi)
+            candidates.extend(self._collect(child, start, end))
+            start = end
+        top = self.heavy[prefix] = self._top(candidates)
+        return top
+
+    def extend(self, conn):
+        """Add recipes created since the last load or extend; returns how many there were."""
+        before, first = len(self.recipe_ids), len(self.entries)
+        changed = self._read(conn)
+        for entry in range(first, len(self.entries)):
+            for key in word_keys(self.entries[entry][1]):
+                insort(self.keys, (key, entry))
+        for entry in changed:
+            self._promote(entry)
+        return len(self.recipe_ids) - before
+
+    def _promote(self, entry):
+        """Rerank ``entry`` in the cached lists of every heavy prefix it falls under."""
+        for key in word_keys(self.entries[entry][1]):
+            for end in range(len(key) + 1):
+                top = self.heavy.get(key[:end])
+                if top is None:
+                    break  # longer prefixes have fewer keys, so none of them is heavy either
+                self.heavy[key[:end]] = self._top(top + [entry])
+
+    def suggest(self, text, limit=None):
+        """Best entries whose words start with ``text``, as ``(kind, text, popularity)`` tuples."""
+        prefix = fold(text)
+        if not prefix:
+            return []
+        top = self.heavy.get(prefix)
+        if top is None:
+            lo = bisect_left(self.keys, (prefix,))
+            hi = bisect_left(self.keys, (prefix + _LAST,), lo)
+            top = self._top(entry for _, entry in self.keys[lo:hi])
+        return [tuple(self.entries[entry]) for entry in top[:limit or self.limit]]
+
+
+def get_suggest_index(app=None):
+    return (app or current_app).extensions['suggest_index']
+
+
+def init_app(app):
+    app.config.setdefault('SUGGEST_MAX_RESULTS', 10)
+    app.config.setdefault('SUGGEST_REBUILD_INTERVAL', 300)
+    app.extensions['suggest_index'] = LiveIndex(app, SuggestIndex, max_age_setting='SUGGEST_REBUILD_INTERVAL')
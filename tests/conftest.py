@@ -0,0 +1,35 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Before app is imported, so its module-level app works on a scratch copy
+# rather than on the tracked database.db
+_scratch = tempfile.mkdtemp(prefix='tastely-tests-')
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+_source = os.environ.get('TASTELY_DATABASE', os.path.join(os.path.dirname(__file__), '..', 'database.db'))
+os.environ['TASTELY_DATABASE'] = os.path.join(_scratch, 'database.db')
+if os.path.exists(_source):
+    shutil.copyfile(_source, os.environ['TASTELY_DATABASE'])
+
+from app import app, init_db  # noqa: E402
+from cache import get_cache  # noqa: E402
+
+# Importing app leaves the schema alone, so upgrade the copy as a server start would
+init_db()
+
+
+@pytest.fixture
+def db_client(tmp_path):
+    """Test client backed by a fresh database built from setup.sql."""
+    original = app.config['DATABASE']
+    app.config['TESTING'] = True
+    app.config['DATABASE'] = str(tmp_path / 'test.db')
+    init_db()
+    get_cache(app).clear()
+    with app.test_client() as client:
+        yield client
+    app.config['DATABASE'] = original
+    get_cache(app).clear()
@@ -0,0 +1,16 @@
+"""Shared test helpers, imported by the test modules."""
+from ingredients import normalize_ingredient
+from restrictions import tags_to_mask
+
+
+def add_recipe(conn, name, description='', instructions='', ingredients=(), tags=(), user_id=None):
+    recipe_id = conn.execute(
+        'INSERT INTO recipe (recipe_name, recipe_description, UserID, instructions, restriction_mask) VALUES (?, ?, ?, ?, ?)',
+        (name, description, user_id, instructions, tags_to_mask(tags)),
+    ).lastrowid
+    conn.executemany('INSERT INTO ingredients (recipe_id, ingredient_name, ingredient_key) VALUES (?, ?, ?)',
+                     [(recipe_id, ingredient, normalize_ingredient(ingredient)) for ingredient in ingredients])
+    conn.executemany('INSERT INTO recipe_restrictions (recipe_id, RecRestriction) VALUES (?, ?)',
+                     [(recipe_id, tag) for tag in tags])
+    conn.commit()
+    return recipe_id
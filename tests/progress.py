@@ -0,0 +1,26 @@
+"""pytest plugin that reports a run's progress as JSON lines.
+
+jobs.py loads it with ``-p tests.progress`` and reads the file named by
+TASTELY_TEST_PROGRESS while the run goes on: one ``collected`` line with the
+number of tests, then one ``test`` line per finished test with its timing.
+"""
+import json
+import os
+
+
+def _write(event):
+    path = os.environ.get('TASTELY_TEST_PROGRESS')
+    if path:
+        with open(path, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+
+
+def pytest_collection_finish(session):
+    _write({'event': 'collected', 'total': len(session.items)})
+
+
+def pytest_runtest_logreport(report):
+    # A test's call phase, or the setup or teardown phase that failed or skipped it
+    if report.when == 'call' or report.outcome != 'passed':
+        _write({'event': 'test', 'test': report.nodeid, 'phase': report.when, 'outcome': report.outcome,
+                'duration': round(report.duration, 4)})
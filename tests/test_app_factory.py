@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from app import create_app
+from benchmarks.bench_startup import HEAVY_MODULES
+from migrations import schema_version, upgrade_schema
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def test_create_app_builds_an_independent_app(tmp_path):
+    path = str(tmp_path / 'factory.db')
+    first = create_app({'DATABASE': path, 'TESTING': True})
+    second = create_app({'DATABASE': path, 'TESTING': True})
+    assert first is not second
+    assert first.extensions['response_cache'] is not second.extensions['response_cache']
+    # Building an app leaves the database alone; init-db is the step that upgrades it
+    assert not os.path.exists(path)
+    result = first.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0 and 'Upgraded' in result.output
+    assert sqlite3.connect(path).execute('PRAGMA user_version').fetchone()[0] == schema_version()
+    assert first.test_client().get('/api/suggest?q=').get_json() == {'suggestions': []}
+
+
+def test_schema_runs_once_per_version(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'schema.db'))
+    assert upgrade_schema(conn)
+    assert not upgrade_schema(conn)
+    conn.execute('DROP INDEX idx_rates_recipe')
+    conn.execute('PRAGMA user_version = 1')  # an older setup.sql
+    assert upgrade_schema(conn)
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_rates_recipe'").fetchone()
+
+
+def test_startup_leaves_heavy_modules_unloaded(tmp_path):
+    probe = f'import sys, app; print(" ".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    env = dict(os.environ, TASTELY_DATABASE=str(tmp_path / 'startup.db'))
+    result = subprocess.run([sys.executable, '-c', probe], cwd=REPOSITORY, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.split() == []
+    # Importing app does not create or migrate its database
+    assert not os.path.exists(env['TASTELY_DATABASE'])
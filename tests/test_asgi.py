@@ -0,0 +1,124 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from app import app
+from asgi import AsgiAdapter, wsgi_environ
+from db import get_db, get_pool
+from helpers import add_recipe
+from passwords import get_password_hasher
+
+
+def call(adapter, method, path, body=b'', headers=(), query_string=b''):
+    """Run one request through ``adapter``; returns (status, headers, body chunks)."""
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string, 'http_version': '1.1',
+             'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+             'headers': [(name.encode(), value.encode()) for name, value in headers]}
+    # Delivered in two parts, as a server does with a large body
+    messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:]}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(adapter(scope, receive, send))
+    start, chunks = sent[0], [message['body'] for message in sent[1:]]
+    assert not sent[-1].get('more_body')
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, chunks
+
+
+@pytest.fixture
+def adapter(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        for i in range(30):
+            add_recipe(conn, f'Recipe {i}', description=f'Stew {i}')
+    adapter = AsgiAdapter(app)
+    yield adapter
+    adapter.shutdown()
+
+
+def test_read_endpoints_are_served_from_the_read_pool(adapter):
+    status, headers, chunks = call(adapter, 'GET', '/api/recipes', query_string=b'limit=5&fields=recipe_name')
+    assert status == 200
+    assert headers['content-type'] == 'application/json'
+    page = json.loads(b''.join(chunks))
+    assert [recipe['recipe_name'] for recipe in page['recipes']] == [f'Recipe {i}' for i in range(5)]
+    assert page['next_cursor']
+
+    assert call(adapter, 'GET', '/recipe/Recipe-3')[0] == 200
+    assert call(adapter, 'GET', '/')[0] == 200
+    stats = adapter.stats()
+    assert (stats['requests'], stats['read'], stats['default'], stats['in_flight']) == (3, 2, 1, 0)
+
+
+def test_sessions_and_request_bodies_pass_through(adapter):
+    status, headers, _ = call(adapter, 'POST', '/login', json.dumps({'username': 'cook', 'password': 'pw'}).encode(),
+                              headers=[('Content-Type', 'application/json')])
+    assert status == 200
+    cookie = headers['set-cookie'].split(';', 1)[0]
+
+    status, _, chunks = call(adapter, 'GET', '/check-cookbook/Recipe 3', headers=[('Cookie', cookie)])
+    assert (status, json.loads(b''.join(chunks))) == (200, {'in_cookbook': False})
+    assert call(adapter, 'GET', '/settings', headers=[('Cookie', cookie)])[0] == 200
+    assert call(adapter, 'GET', '/settings')[0] == 302
+
+
+def test_streams_are_sent_chunk_by_chunk(adapter):
+    app.config['STREAM_CHUNK_ROWS'] = 10
+    try:
+        status, headers, chunks = call(adapter, 'GET', '/api/recipes', query_string=b'stream=ndjson&fields=recipe_name')
+    finally:
+        app.config['STREAM_CHUNK_ROWS'] = 100
+    assert headers['content-type'] == 'application/x-ndjson'
+    assert len([chunk for chunk in chunks if chunk]) == 3
+    names = [json.loads(line)['recipe_name'] for line in b''.join(chunks).splitlines()]
+    assert names == [f'Recipe {i}' for i in range(30)]
+
+
+def test_reads_do_not_wait_on_connections_held_elsewhere(adapter, monkeypatch):
+    hasher = get_password_hasher(app)
+    verify, hashing, release = hasher.verify, threading.Event(), threading.Event()
+
+    def slow_verify(stored, password):
+        hashing.set()
+        release.wait()
+        return verify(stored, password)
+
+    monkeypatch.setattr(hasher, 'verify', slow_verify)
+    statuses = []
+    login = threading.Thread(target=lambda: statuses.append(call(
+        adapter, 'POST', '/login', json.dumps({'username': 'cook', 'password': 'pw'}).encode(),
+        headers=[('Content-Type', 'application/json')])[0]))
+    login.start()
+    hashing.wait()
+    # Uploads and other requests hold every shared connection while the login hashes
+    pool = get_pool(app)
+    held = [pool.acquire() for _ in range(pool.size)]
+    try:
+        status, _, chunks = call(adapter, 'GET', '/api/recipes', query_string=b'limit=2&fields=recipe_name')
+        assert status == 200
+        assert [recipe['recipe_name'] for recipe in json.loads(b''.join(chunks))['recipes']] == ['Recipe 0', 'Recipe 1']
+        assert adapter.read_pool().stats()['checkouts'] == 1
+    finally:
+        for conn in held:
+            pool.release(conn)
+        release.set()
+        login.join()
+    assert statuses == [200]
+
+
+def test_environ_translates_the_scope():
+    environ = wsgi_environ({'type': 'http', 'method': 'GET', 'path': '/app/recipe/Crème', 'root_path': '/app',
+                            'query_string': b'a=1', 'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                                                                (b'content-type', b'text/plain')]}, b'hi')
+    assert (environ['SCRIPT_NAME'], environ['PATH_INFO']) == ('/app', '/recipe/Crème'.encode().decode('latin-1'))
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert (environ['CONTENT_TYPE'], environ['CONTENT_LENGTH'], environ['wsgi.input'].read()) == ('text/plain', '2', b'hi')
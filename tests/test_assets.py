@@ -0,0 +1,69 @@
+import gzip
+import os
+
+import pytest
+from flask import url_for
+
+import assets
+from app import app
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    original = app.static_folder
+    folder = tmp_path / 'static'
+    (folder / 'images').mkdir(parents=True)
+    (folder / 'app.js').write_text('console.log("hello");\n' * 50)
+    (folder / 'images' / ('a' * 32 + '-card.jpg')).write_bytes(b'jpeg')
+    app.static_folder = str(folder)
+    assets.refresh(app)
+    yield folder
+    app.static_folder = original
+    assets.refresh(app)
+
+
+def test_url_for_uses_fingerprinted_name(static_dir):
+    with app.test_request_context():
+        url = url_for('static', filename='app.js')
+    digest = assets.fingerprint(str(static_dir / 'app.js'))
+    assert url == f'/static/app.{digest}.js'
+
+
+def test_hashed_urls_are_immutable(static_dir):
+    client = app.test_client()
+    hashed = app.extensions['asset_manifest']['app.js']
+    response = client.get('/static/' + hashed)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == assets.IMMUTABLE
+    response.close()
+
+    response = client.get('/static/app.js')
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+    response.close()
+
+    response = client.get('/static/images/' + 'a' * 32 + '-card.jpg')
+    assert response.headers['Cache-Control'] == assets.IMMUTABLE
+    response.close()
+
+
+def test_precompressed_sibling_served_when_accepted(static_dir):
+    assert str(static_dir / 'app.js.gz') in assets.compress_assets(str(static_dir))
+    client = app.test_client()
+    hashed = app.extensions['asset_manifest']['app.js']
+
+    response = client.get('/static/' + hashed, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/javascript'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == (static_dir / 'app.js').read_bytes()
+    response.close()
+
+    response = client.get('/static/' + hashed)
+    assert 'Content-Encoding' not in response.headers
+    response.close()
+
+    # A sibling older than its source is ignored
+    os.utime(static_dir / 'app.js.gz', (0, 0))
+    response = client.get('/static/' + hashed, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    response.close()
@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from app import app
+from cache import KeyValueCache, LRUCache, get_cache
+from db import get_db
+from helpers import add_recipe
+
+
+class FakeStore:
+    """Just enough of a redis-style client for KeyValueCache."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set('a', 1, ttl=60)
+    cache.set('b', 2, ttl=60)
+    assert cache.get('a') == 1
+    cache.set('c', 3, ttl=60)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 1)
+
+
+def test_lru_expires_entries():
+    cache = LRUCache()
+    cache.set('a', 1, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+@pytest.mark.parametrize('backend', [LRUCache(), KeyValueCache(FakeStore())], ids=['lru', 'key-value'])
+def test_invalidate_drops_only_tagged_entries(backend):
+    backend.set('soup', 'soup page', ttl=60, tags=['recipe:Soup'])
+    backend.set('list', 'list page', ttl=60, tags=['recipes', 'recipe:Soup'])
+    backend.set('salad', 'salad page', ttl=60, tags=['recipe:Salad'])
+    backend.invalidate(['recipe:Soup'])
+    assert backend.get('soup') is None
+    assert backend.get('list') is None
+    assert backend.get('salad') == 'salad page'
+
+
+@pytest.mark.parametrize('backend', [LRUCache(), KeyValueCache(FakeStore())], ids=['lru', 'key-value'])
+def test_clear_drops_every_entry(backend):
+    backend.set('soup', 'soup page', ttl=60, tags=['recipe:Soup'])
+    backend.set('salad', 'salad page', ttl=60)
+    backend.clear()
+    assert backend.get('soup') is None and backend.get('salad') is None
+    backend.set('soup', 'new soup page', ttl=60)
+    assert backend.get('soup') == 'new soup page'
+
+
+@pytest.fixture
+def logged_in(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        add_recipe(conn, 'Soup', description='Warm', user_id=1)
+        add_recipe(conn, 'Salad', description='Cold')
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return db_client
+
+
+def test_view_recipe_is_served_from_cache_until_rated(logged_in):
+    first = logged_in.get('/recipe/Soup')
+    assert logged_in.get('/recipe/Soup').data == first.data
+    assert get_cache(app).stats()['hits'] == 1
+
+    logged_in.post('/rate-recipe', json={'recipe_name': 'Soup', 'rating': 4})
+    assert b'4.0' in logged_in.get('/recipe/Soup').data
+
+
+def test_rating_only_invalidates_the_rated_recipe(logged_in):
+    logged_in.get('/recipe/Soup')
+    logged_in.get('/recipe/Salad')
+    logged_in.post('/rate-recipe', json={'recipe_name': 'Salad', 'rating': 2})
+    hits = get_cache(app).stats()['hits']
+    logged_in.get('/recipe/Soup')
+    logged_in.get('/recipe/Salad')
+    assert get_cache(app).stats()['hits'] == hits + 1
+
+
+def test_cookbook_and_recommendations_follow_user_writes(logged_in):
+    assert b'Salad' not in logged_in.get('/cookbook').data
+    logged_in.post('/toggle-cookbook/Salad')
+    assert b'Salad' in logged_in.get('/cookbook').data
+
+    everything = logged_in.get('/api/recommended?fields=recipe_name').get_json()['recipes']
+    assert len(everything) == 2
+    logged_in.post('/update_diet_restrictions', data={'diet[]': ['Vegan']})
+    assert logged_in.get('/api/recommended?fields=recipe_name').get_json()['recipes'] == []
+
+
+def test_list_pages_see_new_recipes(logged_in):
+    assert len(logged_in.get('/api/recipes').get_json()['recipes']) == 2
+    logged_in.post('/rate-recipe', json={'recipe_name': 'Soup', 'rating': 5})
+    recipes = logged_in.get('/api/recipes').get_json()['recipes']
+    assert recipes[0]['avg_rating'] == 5.0
+
+
+def test_dashboard_is_shared_between_users(logged_in):
+    with app.app_context():
+        get_db().execute("INSERT INTO account (id, username, email, password) VALUES (2, 'guest', 'g@test.com', 'pw')")
+        get_db().commit()
+    first = logged_in.get('/dashboard?search=Soup')
+    hits = get_cache(app).stats()['hits']
+    with logged_in.session_transaction() as sess:
+        sess['user_id'] = 2
+    assert logged_in.get('/dashboard?search=Soup').data == first.data
+    assert get_cache(app).stats()['hits'] == hits + 1
+    with logged_in.session_transaction() as sess:
+        del sess['user_id']
+    assert logged_in.get('/dashboard?search=Soup').status_code == 302
+
+
+def test_cache_stats_require_admin(logged_in):
+    assert logged_in.get('/api/cache-stats').status_code == 403
+    logged_in.post('/update_security_key', data={'security_key': 'admin'})
+    assert 'hits' in logged_in.get('/api/cache-stats').get_json()
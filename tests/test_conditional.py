@@ -0,0 +1,70 @@
+import pytest
+
+from app import app
+from db import get_db, get_pool
+from cache import VersionStore
+from helpers import add_recipe
+
+
+@pytest.fixture
+def logged_in(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        add_recipe(conn, 'Soup')
+        add_recipe(conn, 'Salad')
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return db_client
+
+
+def test_version_store_etags_change_on_bump():
+    store = VersionStore()
+    etag, _ = store.validators(['recipe:Soup'], 'viewer')
+    assert store.validators(['recipe:Soup'], 'viewer')[0] == etag
+    assert store.validators(['recipe:Soup'], 'other viewer')[0] != etag
+    store.bump(['recipe:Salad'])
+    assert store.validators(['recipe:Soup'], 'viewer')[0] == etag
+    store.bump(['recipe:Soup'])
+    assert store.validators(['recipe:Soup'], 'viewer')[0] != etag
+
+
+@pytest.mark.parametrize('url', ['/recipe/Soup', '/api/recipes', '/api/recommended', '/check-cookbook/Soup'])
+def test_matching_etag_short_circuits_before_sql(logged_in, url):
+    first = logged_in.get(url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    checkouts = get_pool(app).stats()['checkouts']
+    again = logged_in.get(url, headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert get_pool(app).stats()['checkouts'] == checkouts
+
+
+def test_writes_change_the_etag(logged_in):
+    recipe_etag = logged_in.get('/recipe/Soup').headers['ETag']
+    list_etag = logged_in.get('/api/recipes').headers['ETag']
+    check_etag = logged_in.get('/check-cookbook/Soup').headers['ETag']
+
+    logged_in.post('/rate-recipe', json={'recipe_name': 'Salad', 'rating': 3})
+    assert logged_in.get('/recipe/Soup', headers={'If-None-Match': recipe_etag}).status_code == 304
+    assert logged_in.get('/api/recipes', headers={'If-None-Match': list_etag}).status_code == 200
+
+    logged_in.post('/toggle-cookbook/Soup')
+    response = logged_in.get('/check-cookbook/Soup', headers={'If-None-Match': check_etag})
+    assert response.status_code == 200
+    assert response.get_json() == {'in_cookbook': True}
+
+
+def test_if_modified_since(logged_in):
+    first = logged_in.get('/recipe/Soup')
+    last_modified = first.headers['Last-Modified']
+    assert logged_in.get('/recipe/Soup', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert logged_in.get('/recipe/Soup', headers={'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}).status_code == 200
+
+
+def test_etag_varies_by_viewer(logged_in):
+    etag = logged_in.get('/recipe/Soup').headers['ETag']
+    logged_in.post('/update_security_key', data={'security_key': 'admin'})
+    assert logged_in.get('/recipe/Soup', headers={'If-None-Match': etag}).status_code == 200
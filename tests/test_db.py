@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+from flask import Flask
+
+import db
+from db import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=2, timeout=0.1)
+    yield pool
+    pool.close_all()
+
+
+def test_pragmas_applied_once_per_connection(pool):
+    conn = pool.acquire()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert conn.execute('PRAGMA foreign_keys').fetchone()[0] == 1
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+    pool.release(conn)
+
+
+def test_connections_are_reused(pool):
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    assert second is first
+    stats = pool.stats()
+    assert stats['checkouts'] == 2
+    assert stats['reuses'] == 1
+    assert stats['created'] == 1
+
+
+def test_release_rolls_back_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.commit()
+    conn.execute('INSERT INTO t VALUES (1)')
+    pool.release(conn)
+    conn = pool.acquire()
+    assert conn.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    pool.release(conn)
+
+
+def test_exhausted_pool_waits_then_times_out(pool):
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['waits'] == 1
+
+    threading.Timer(0.02, pool.release, args=(held[0],)).start()
+    pool.timeout = 1.0
+    assert pool.acquire() is held[0]
+
+
+def test_health_check_discards_broken_connection(pool):
+    pool.health_check_interval = 0
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert pool.stats()['discarded'] == 1
+
+
+def test_app_context_returns_connection_to_pool(tmp_path):
+    app = Flask(__name__)
+    app.config['DATABASE'] = str(tmp_path / 'app.db')
+    db.init_app(app)
+    with app.app_context():
+        first = db.get_db()
+        assert db.get_db() is first
+    with app.app_context():
+        assert db.get_db() is first
+    assert db.get_pool(app).stats()['reuses'] == 1
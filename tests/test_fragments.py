@@ -0,0 +1,98 @@
+import re
+
+import pytest
+
+from app import app
+from db import get_db, get_pool
+from fragments import get_fragment_cache
+from helpers import add_recipe
+from recommender import get_recommender
+
+CARD_NAME = re.compile(r'<h3 class="font-bold text-lg mt-2">([^<]*)</h3>')
+NEXT_CURSOR = re.compile(r'data-next-cursor="([^"]*)"')
+
+
+@pytest.fixture
+def cook(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        for i in range(30):
+            add_recipe(conn, f'Recipe {i}', description=f'Stew {i}')
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    get_fragment_cache(app).clear()
+    return db_client
+
+
+def test_dashboard_renders_the_first_page_and_loads_more_as_html(cook):
+    page = cook.get('/dashboard').get_data(as_text=True)
+    assert CARD_NAME.findall(page) == [f'Recipe {i}' for i in range(24)]
+    cursor = NEXT_CURSOR.search(page).group(1)
+    assert cursor
+
+    more = cook.get(f'/dashboard?cursor={cursor}&partial=1').get_data(as_text=True)
+    assert '<html' not in more
+    assert CARD_NAME.findall(more) == [f'Recipe {i}' for i in range(24, 30)]
+    assert NEXT_CURSOR.search(more).group(1) == ''
+
+    found = cook.get('/dashboard?search=stew 7').get_data(as_text=True)
+    assert CARD_NAME.findall(found)[0] == 'Recipe 7'
+
+
+def test_a_page_view_runs_one_query(cook):
+    checkouts = get_pool(app).stats()['checkouts']
+    cook.get('/dashboard?search=stew')
+    assert get_pool(app).stats()['checkouts'] == checkouts + 1
+
+
+def test_cards_are_reused_until_their_recipe_changes(cook):
+    fragments = get_fragment_cache(app)
+    before = fragments.stats()
+    cook.get('/dashboard')
+    cook.post('/rate-recipe', json={'recipe_name': 'Recipe 3', 'rating': 5})
+    page = cook.get('/dashboard').get_data(as_text=True)
+    after = fragments.stats()
+    # The second render only redoes the rated card
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses']) == (23, 25)
+    assert page.count('★★★★★') == 1
+
+
+def test_recommended_page_renders_cards(cook):
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (1, ?, ?)', [(2, 5), (5, 3)])
+        conn.commit()
+    page = cook.get('/recommended').get_data(as_text=True)
+    assert CARD_NAME.findall(page)[0] == 'Recipe 1'
+    assert len(CARD_NAME.findall(page)) == 24
+    assert NEXT_CURSOR.search(page).group(1)
+
+
+def test_recommended_pages_cover_every_matching_recipe(cook):
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'cook{i}', f'cook{i}@test.com', 'pw') for i in (2, 3)])
+        # Users 2 and 3 like Recipe 1 and Recipe 2 together; user 1 has only rated Recipe 1
+        conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (?, ?, ?)',
+                         [(1, 2, 5), (1, 6, 1), (2, 2, 5), (2, 3, 5), (2, 6, 1), (3, 2, 4), (3, 3, 5), (3, 6, 2)])
+        conn.commit()
+        matching = conn.execute('SELECT COUNT(*) FROM recipe').fetchone()[0]
+    engine = get_recommender(app)
+    engine.rebuild()
+    try:
+        page = cook.get('/recommended').get_data(as_text=True)
+        names = CARD_NAME.findall(page)
+        # The model's pick leads the first page, which is still a full page
+        assert names[0] == 'Recipe 2'
+        assert len(names) == 24
+        cursor = NEXT_CURSOR.search(page).group(1)
+        while cursor:
+            more = cook.get(f'/recommended?cursor={cursor}&partial=1').get_data(as_text=True)
+            names += CARD_NAME.findall(more)
+            cursor = NEXT_CURSOR.search(more).group(1)
+    finally:
+        engine.shutdown()
+        engine.model = None
+    assert len(names) == len(set(names)) == matching
@@ -0,0 +1,123 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import images
+from app import app
+from db import get_db
+
+
+def jpeg_bytes(size=(1200, 800), color='orange'):
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCam'  # Make
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def uploads(db_client, tmp_path):
+    original = app.config['UPLOAD_FOLDER']
+    folder = tmp_path / 'images'
+    folder.mkdir()
+    app.config['UPLOAD_FOLDER'] = str(folder)
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'u', 'u@test.com', 'pw')")
+        conn.commit()
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    yield folder
+    images.drain(app)
+    app.config['UPLOAD_FOLDER'] = original
+
+
+def create(client, name, data, filename='photo.jpg'):
+    return client.post('/create-recipe', data={
+        'recipe_name': name, 'description': 'd', 'prep_time': '5', 'cook_time': '5',
+        'ingredients': 'salt', 'instructions': 'cook', 'cuisine_type': 'American',
+        'recipe_image': (io.BytesIO(data), filename),
+    }, content_type='multipart/form-data')
+
+
+def recipe_row(name):
+    with app.app_context():
+        return get_db().execute('SELECT recipe_image, image_key FROM recipe WHERE recipe_name = ?', (name,)).fetchone()
+
+
+def test_upload_is_content_addressed_and_processed(db_client, uploads):
+    data = jpeg_bytes()
+    assert create(db_client, 'Toast', data).status_code == 302
+    row = recipe_row('Toast')
+    key = images.content_key(data)
+    raw = os.path.join(str(uploads), key + '.jpg')
+    assert row['recipe_image'] == raw
+    assert row['image_key'] is None
+
+    images.drain(app)
+    row = recipe_row('Toast')
+    assert row['image_key'] == key
+    for path in images.variant_paths(str(uploads), key):
+        with Image.open(path) as variant:
+            assert variant.width in images.VARIANTS.values()
+    # The stripped copy has a URL of its own; the raw upload is never rewritten, only removed
+    assert row['recipe_image'] == os.path.join(str(uploads), key + '-original.jpg')
+    with Image.open(row['recipe_image']) as original:
+        assert 0x010F not in original.getexif()
+    assert not os.path.exists(raw)
+
+    data = db_client.get('/api/recipes?fields=recipe_name,image_key').get_json()
+    assert data['recipes'] == [{'recipe_name': 'Toast', 'image_key': key}]
+
+
+def test_duplicate_upload_reuses_variants(db_client, uploads):
+    data = jpeg_bytes(color='blue')
+    create(db_client, 'First', data, 'a.jpg')
+    images.drain(app)
+    create(db_client, 'Second', data, 'b.jpg')
+    assert tuple(recipe_row('Second')) == tuple(recipe_row('First'))
+    assert recipe_row('Second')['image_key'] == images.content_key(data)
+    assert len(os.listdir(uploads)) == 1 + len(images.variant_paths('', 'x'))
+
+
+def test_gif_metadata_is_stripped_and_frames_kept(db_client, uploads):
+    frames = [Image.new('RGB', (64, 48), color) for color in ('red', 'green', 'blue')]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, 'GIF', save_all=True, append_images=frames[1:], duration=[100, 200, 300], loop=0,
+                   comment=b'taken at home')
+    data = buffer.getvalue()
+    assert create(db_client, 'Spinner', data, 'spin.gif').status_code == 302
+    images.drain(app)
+    key = images.content_key(data)
+    row = recipe_row('Spinner')
+    assert row['recipe_image'] == os.path.join(str(uploads), key + '-original.gif')
+    with open(row['recipe_image'], 'rb') as f:
+        assert b'taken at home' not in f.read()
+    with Image.open(row['recipe_image']) as cleaned:
+        assert cleaned.n_frames == 3 and 'comment' not in cleaned.info
+    assert not os.path.exists(os.path.join(str(uploads), key + '.gif'))
+
+
+def test_failed_create_removes_its_upload(db_client, uploads):
+    assert create(db_client, 'Toast', jpeg_bytes()).status_code == 302
+    images.drain(app)
+    before = sorted(os.listdir(uploads))
+    assert create(db_client, 'Toast', jpeg_bytes(color='green')).status_code == 500
+    assert sorted(os.listdir(uploads)) == before
+
+
+def test_rejects_files_that_are_not_images(db_client, uploads):
+    create(db_client, 'Fake', b'not an image', 'fake.png')
+    assert recipe_row('Fake')['recipe_image'] is None
+    assert os.listdir(uploads) == []
+
+
+def test_failed_processing_is_logged(db_client, uploads, caplog):
+    stored = images.StoredImage(str(uploads / 'missing.jpg'), 'missing', False)
+    future = images.schedule(app, stored)
+    with pytest.raises(FileNotFoundError):
+        future.result()
+    images.drain(app)
+    assert 'Processing image' in caplog.text and 'missing.jpg' in caplog.text
@@ -0,0 +1,131 @@
+import random
+import sqlite3
+
+import pytest
+
+from app import app, init_db
+from db import get_db
+from helpers import add_recipe
+from ingredients import IngredientIndex, get_ingredient_index, normalize_ingredient, parse_ingredients
+
+
+@pytest.mark.parametrize('name, key', [
+    ('Tomatoes ', 'tomato'),
+    ('TOMATO', 'tomato'),
+    ('  black   beans', 'black bean'),
+    ('Fresh-Berries', 'fresh berry'),
+    ('peaches', 'peach'),
+    ('bay leaves', 'bay leaf'),
+    ('hummus', 'hummus'),
+    ('swiss', 'swiss'),
+    ('eggs', 'egg'),
+    (' , ', ''),
+])
+def test_normalize_ingredient(name, key):
+    assert normalize_ingredient(name) == key
+
+
+def test_parse_ingredients_keeps_the_text_as_typed():
+    assert parse_ingredients('Eggs, whole  milk ') == [('Eggs', 'egg'), ('whole  milk', 'whole milk')]
+    assert parse_ingredients('egg, Eggs, , milk,') == [('egg', 'egg'), ('milk', 'milk')]
+
+
+def brute_force(recipes, have, limit):
+    wanted = {normalize_ingredient(name) for name in have}
+    ranked = []
+    for recipe_id, names in recipes.items():
+        keys = {normalize_ingredient(name) for name in names}
+        matched = len(keys & wanted)
+        if matched:
+            ranked.append((len(keys) - matched, -matched, recipe_id))
+    return [(recipe_id, -negative, missing) for missing, negative, recipe_id in sorted(ranked)[:limit]]
+
+
+def test_index_ranks_like_a_brute_force_count():
+    rng = random.Random(3)
+    pantry = [f'item{i}' for i in range(40)]
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE recipe (recipe_id INTEGER PRIMARY KEY)')
+    conn.execute('CREATE TABLE ingredients (recipe_id INTEGER, ingredient_name TEXT, ingredient_key TEXT)')
+    recipes = {}
+    for recipe_id in range(1, 800):
+        recipes[recipe_id] = rng.sample(pantry, rng.randint(0, 12))
+        conn.execute('INSERT INTO recipe VALUES (?)', (recipe_id,))
+        # Some rows predate ingredient_key and are normalised on load
+        conn.executemany('INSERT INTO ingredients VALUES (?, ?, ?)',
+                         [(recipe_id, name + 's', None if recipe_id % 2 else name) for name in recipes[recipe_id]])
+        if recipe_id == 500:
+            index = IngredientIndex.load(conn)
+    assert index.extend(conn) == 299
+
+    for size in (1, 3, 9, 40):
+        have = rng.sample(pantry, size)
+        assert index.cookable(have, 50) == brute_force(recipes, have, 50)
+
+
+def test_cookable_endpoint_lists_what_is_missing(db_client):
+    with app.app_context():
+        conn = get_db()
+        add_recipe(conn, 'Omelette', ingredients=['Eggs', 'butter'])
+        add_recipe(conn, 'Pancakes', ingredients=['eggs', 'flour', 'milk', 'butter'])
+        add_recipe(conn, 'Toast', ingredients=['bread'])
+
+    response = db_client.get('/api/recipes/cookable?ingredients=egg, Butter,milk&fields=recipe_name')
+    assert response.status_code == 200
+    assert response.get_json()['recipes'] == [
+        {'recipe_name': 'Omelette', 'matched': 2, 'missing': 0, 'missing_ingredients': []},
+        {'recipe_name': 'Pancakes', 'matched': 3, 'missing': 1, 'missing_ingredients': ['flour']},
+    ]
+    assert db_client.get('/api/recipes/cookable').status_code == 400
+
+
+def test_cookable_listing_follows_new_ratings(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        add_recipe(conn, 'Omelette', ingredients=['eggs'])
+    url = '/api/recipes/cookable?ingredients=eggs&fields=recipe_name,avg_rating'
+    assert db_client.get(url).get_json()['recipes'][0]['avg_rating'] == 0
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    db_client.post('/rate-recipe', json={'recipe_name': 'Omelette', 'rating': 4})
+    assert db_client.get(url).get_json()['recipes'][0]['avg_rating'] == 4
+
+
+def test_cookable_follows_created_and_deleted_recipes(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        conn.commit()
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    assert db_client.get('/api/recipes/cookable?ingredients=rice').get_json() == {'recipes': []}
+
+    db_client.post('/create-recipe', data={
+        'recipe_name': 'Fried Rice', 'description': '', 'prep_time': 5, 'cook_time': 10,
+        'ingredients': 'Rice, eggs, scallions', 'instructions': '', 'cuisine_type': 'American',
+        'recipe_image': (b'', ''),
+    }, content_type='multipart/form-data')
+    with app.app_context():
+        keys = [row[0] for row in get_db().execute('SELECT ingredient_key FROM ingredients ORDER BY ingredient_key')]
+    assert keys == ['egg', 'rice', 'scallion']
+    found = db_client.get('/api/recipes/cookable?ingredients=rice,egg').get_json()['recipes']
+    assert [(recipe['recipe_name'], recipe['missing']) for recipe in found] == [('Fried Rice', 1)]
+
+    rebuilds = get_ingredient_index(app).rebuilds
+    db_client.delete('/delete-recipe/Fried Rice')
+    assert db_client.get('/api/recipes/cookable?ingredients=rice').get_json() == {'recipes': []}
+    assert get_ingredient_index(app).rebuilds == rebuilds + 1
+
+
+def test_init_db_backfills_ingredient_keys(db_client):
+    # A database from before ingredient_key existed
+    conn = sqlite3.connect(app.config['DATABASE'])
+    conn.execute('ALTER TABLE ingredients DROP COLUMN ingredient_key')
+    conn.execute('PRAGMA user_version = 0')
+    conn.execute("INSERT INTO recipe (recipe_name) VALUES ('Salad')")
+    conn.executemany('INSERT INTO ingredients (recipe_id, ingredient_name) VALUES (1, ?)', [('Tomatoes',), ('Red Onions',)])
+    conn.commit()
+
+    init_db()
+    assert conn.execute('SELECT ingredient_key FROM ingredients ORDER BY ingredient_key').fetchall() == [('red onion',), ('tomato',)]
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+from app import app
+from jobs import get_job_runner
+
+SUITE = '''
+import os
+import time
+
+def test_fast():
+    pass
+
+def test_uses_a_scratch_database():
+    assert os.path.basename(os.environ['TASTELY_DATABASE']) == 'test.db'
+    assert os.path.dirname(os.environ['TASTELY_DATABASE']) != os.getcwd()
+
+def test_slow_failure():
+    time.sleep(0.5)
+    assert False
+'''
+
+
+@pytest.fixture
+def suite(tmp_path):
+    target = tmp_path / 'test_sample.py'
+    target.write_text(SUITE)
+    get_job_runner(app)  # sets the TEST_RUN_* defaults
+    original = app.config['TEST_RUN_TARGET']
+    app.config['TEST_RUN_TARGET'] = str(target)
+    with app.test_client() as client:
+        yield client
+    get_job_runner(app).shutdown()
+    app.config['TEST_RUN_TARGET'] = original
+
+
+def test_run_streams_progress_and_allows_one_job_at_a_time(suite):
+    started = suite.post('/run-tests')
+    assert started.status_code == 202
+    job = started.get_json()
+    assert job['status'] == 'running'
+
+    again = suite.post('/run-tests')
+    assert again.status_code == 409
+    assert again.get_json()['job_id'] == job['job_id']
+
+    lines = [json.loads(line) for line in suite.get(job['status_url'] + '?stream=1').data.splitlines()]
+    tests, summary = lines[:-1], lines[-1]
+    assert [(test['test'].split('::')[1], test['outcome']) for test in tests] == [
+        ('test_fast', 'passed'), ('test_uses_a_scratch_database', 'passed'), ('test_slow_failure', 'failed')]
+    assert tests[2]['duration'] >= 0.5
+    assert summary['status'] == 'failed'
+    assert (summary['total'], summary['completed'], summary['failed']) == (3, 3, 1)
+
+    snapshot = suite.get(job['status_url']).get_json()
+    assert snapshot['tests'] == tests
+    assert 'assert False' in snapshot['output']
+    assert suite.post('/run-tests').status_code == 202
+
+
+def test_unknown_job(suite):
+    assert suite.get('/run-tests/' + os.urandom(4).hex()).status_code == 404
+    assert suite.get('/run-tests').status_code == 405
@@ -0,0 +1,45 @@
+import sqlite3
+
+from app import app
+from benchmarks.generate_data import generate
+from benchmarks.loadtest import MIX, InProcessTransport, load_fixtures, report, run
+from ratings import check_rating_stats
+
+
+def test_generate_fills_every_table(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'load.db')
+    counts = generate(conn, accounts=20, recipes=50, ingredients=5, ratings=400, cookbook_entries=3, log=lambda _: None)
+
+    assert counts['ratings'] == 400
+    assert conn.execute('SELECT COUNT(*) FROM account').fetchone()[0] == 20
+    assert conn.execute('SELECT COUNT(*) FROM recipe').fetchone()[0] == 50
+    assert conn.execute('SELECT COUNT(*) FROM ingredients').fetchone()[0] == 250
+    assert conn.execute('SELECT COUNT(*) FROM rates').fetchone()[0] == 400
+    assert conn.execute('SELECT COUNT(*) FROM contains').fetchone()[0] == counts['cookbook_entries']
+    assert check_rating_stats(conn) == []
+    conn.close()
+
+
+def test_generate_is_deterministic(tmp_path):
+    dumps = []
+    for name in ('a.db', 'b.db'):
+        conn = sqlite3.connect(tmp_path / name)
+        generate(conn, accounts=10, recipes=20, ratings=100, log=lambda _: None)
+        dumps.append(conn.execute('SELECT User_ID, recipe_id, user_rating FROM rates ORDER BY 1, 2').fetchall())
+        conn.close()
+    assert dumps[0] == dumps[1]
+
+
+def test_driver_replays_mix_without_errors(db_client, tmp_path):
+    conn = sqlite3.connect(app.config['DATABASE'])
+    generate(conn, accounts=5, recipes=30, ratings=100, log=lambda _: None)
+    conn.close()
+
+    recipes, usernames = load_fixtures(app.config['DATABASE'])
+    latencies, errors, elapsed = run(lambda: InProcessTransport(app), recipes, usernames,
+                                     workers=2, duration=float('inf'), max_requests=200)
+
+    assert sum(map(len, latencies.values())) == 200
+    assert set(latencies) <= set(MIX)
+    assert not errors
+    assert report(latencies, errors, elapsed).splitlines()[-1].startswith('all')
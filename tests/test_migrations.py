@@ -0,0 +1,67 @@
+import sqlite3
+
+from app import app, init_db
+from db import get_db
+from helpers import add_recipe
+from migrations import RECIPE_ID_TABLES, migrate_recipe_id_keys
+from ratings import check_rating_stats
+from search import search_recipes
+
+# Child tables as setup.sql declared them before recipe_id keys
+LEGACY_TABLES = '''
+    CREATE TABLE recipe_restrictions (recipe_name VARCHAR(80), RecRestriction VARCHAR(30),
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (recipe_name, RecRestriction));
+    CREATE TABLE ingredients (recipe_name VARCHAR(80), ingredient_name VARCHAR(80),
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (recipe_name, ingredient_name));
+    CREATE TABLE contains (CookBook_ID INTEGER, recipe_name TEXT,
+        FOREIGN KEY(CookBook_ID) REFERENCES cookbook(CookBook_ID) ON DELETE CASCADE,
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (CookBook_ID, recipe_name));
+    CREATE TABLE rates (User_ID INTEGER NOT NULL, recipe_name VARCHAR(80) NOT NULL,
+        user_rating INTEGER CHECK (user_rating BETWEEN 0 AND 5),
+        FOREIGN KEY(User_ID) REFERENCES account(id) ON DELETE CASCADE,
+        FOREIGN KEY(recipe_name) REFERENCES recipe(recipe_name) ON DELETE CASCADE, PRIMARY KEY (User_ID, recipe_name));
+'''
+
+
+def test_migrates_name_keyed_tables(db_client):
+    path = app.config['DATABASE']
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'u', 'u@test.com', 'pw')")
+        conn.execute('INSERT INTO cookbook (CookBook_ID) VALUES (1)')
+        add_recipe(conn, 'Fish Tacos')
+        add_recipe(conn, 'Green Salad')
+
+    legacy = sqlite3.connect(path)
+    legacy.executescript('PRAGMA foreign_keys = OFF; PRAGMA user_version = 0;' + ''.join(f'DROP TABLE {table};' for table in RECIPE_ID_TABLES) + LEGACY_TABLES + '''
+        INSERT INTO ingredients VALUES ('Fish Tacos', 'cod'), ('Fish Tacos', 'lime'), ('Gone Recipe', 'salt');
+        INSERT INTO recipe_restrictions VALUES ('Green Salad', 'Vegan');
+        INSERT INTO contains VALUES (1, 'Fish-Tacos'), (999, 'Green Salad');
+        INSERT INTO rates VALUES (1, 'Fish Tacos', 4), (1, 'Green Salad', 2), (999, 'Fish Tacos', 1);
+        UPDATE recipe_rating_stats SET rating_sum = 4, rating_count = 1 WHERE recipe_id = 1;
+        UPDATE recipe_rating_stats SET rating_sum = 2, rating_count = 1 WHERE recipe_id = 2;
+    ''')
+    legacy.close()
+
+    init_db()
+    with app.app_context():
+        conn = get_db()
+        assert migrate_recipe_id_keys(conn) == []
+        def rows(sql):
+            return sorted(tuple(row) for row in conn.execute(sql))
+
+        assert rows('SELECT r.recipe_name, i.ingredient_name FROM ingredients i JOIN recipe r USING (recipe_id)') == [
+            ('Fish Tacos', 'cod'), ('Fish Tacos', 'lime')]
+        # Rows left behind by a deleted account or cookbook are dropped
+        assert rows('SELECT recipe_id FROM contains') == [(1,)]
+        assert rows('SELECT User_ID, recipe_id FROM rates') == [(1, 1), (1, 2)]
+        assert rows('SELECT recipe_id, RecRestriction FROM recipe_restrictions') == [(2, 'Vegan')]
+        assert check_rating_stats(conn) == []
+
+        # Triggers were recreated against recipe_id
+        conn.execute('UPDATE rates SET user_rating = 5 WHERE recipe_id = 1')
+        conn.execute("INSERT INTO ingredients (recipe_id, ingredient_name) VALUES (2, 'kale')")
+        conn.commit()
+        assert check_rating_stats(conn) == []
+        assert [row['recipe_name'] for row in search_recipes(conn, 'kale')] == ['Green Salad']
+        assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
@@ -0,0 +1,68 @@
+import pytest
+
+from app import app
+from db import get_db
+from helpers import add_recipe
+from pagination import decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def catalog(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'user{i}', f'user{i}@test.com', 'pw') for i in (1, 2)])
+        for i in range(7):
+            add_recipe(conn, f'Recipe {i}', description=f'Tasty stew number {i}', instructions='x' * 500)
+        conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) '
+                         'VALUES (?, (SELECT recipe_id FROM recipe WHERE recipe_name = ?), ?)',
+                         [(1, 'Recipe 3', 5), (2, 'Recipe 3', 4), (1, 'Recipe 5', 2), (1, 'Recipe 1', 5)])
+        conn.commit()
+    return db_client
+
+
+def walk(client, url):
+    names, cursor = [], None
+    while True:
+        page_url = url + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(page_url).get_json()
+        names += [recipe['recipe_name'] for recipe in data['recipes']]
+        cursor = data['next_cursor']
+        if not cursor:
+            return names
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor([4.5, 12]), 2) == [4.5, 12]
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor([1]), 2)
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor!', 1)
+
+
+def test_recipes_keyset_pages_cover_catalog(catalog):
+    assert walk(catalog, '/api/recipes?limit=3') == [f'Recipe {i}' for i in range(7)]
+
+
+def test_search_pages_follow_rank_order(catalog):
+    everything = catalog.get('/api/recipes?search=stew&limit=100').get_json()
+    assert walk(catalog, '/api/recipes?search=stew&limit=2') == [r['recipe_name'] for r in everything['recipes']]
+
+
+def test_fields_projection_skips_large_columns(catalog):
+    data = catalog.get('/api/recipes?fields=recipe_name,avg_rating&limit=2').get_json()
+    assert data['recipes'] == [{'recipe_name': 'Recipe 0', 'avg_rating': 0}, {'recipe_name': 'Recipe 1', 'avg_rating': 5.0}]
+
+
+def test_invalid_parameters_are_rejected(catalog):
+    assert catalog.get('/api/recipes?fields=password').status_code == 400
+    assert catalog.get('/api/recipes?limit=0').status_code == 400
+    assert catalog.get('/api/recipes?cursor=garbage').status_code == 400
+
+
+def test_recommended_pages_by_rating(catalog):
+    with catalog.session_transaction() as sess:
+        sess['user_id'] = 1
+    names = walk(catalog, '/api/recommended?limit=2&fields=recipe_name')
+    assert names[:3] == ['Recipe 1', 'Recipe 3', 'Recipe 5']
+    assert sorted(names) == [f'Recipe {i}' for i in range(7)]
@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from app import app, create_app, init_db
+from db import get_db, get_pool
+from passwords import PREFIX, PasswordPoolBusy, check, get_password_hasher, hash_with
+
+
+def stored_password(username):
+    with app.app_context():
+        return get_db().execute('SELECT password FROM account WHERE username = ?', (username,)).fetchone()[0]
+
+
+def test_hash_round_trip():
+    stored = hash_with('secret', 2 ** 10, 8, 1)
+    assert stored.startswith(PREFIX + '1024$8$1$')
+    assert check(stored, 'secret')
+    assert not check(stored, 'Secret')
+    assert hash_with('secret', 2 ** 10, 8, 1) != stored
+
+
+def test_signup_stores_a_hash_and_login_checks_it(db_client):
+    db_client.post('/signup', json={'username': 'cook', 'email': 'cook@test.com', 'password': 'pw'})
+    assert stored_password('cook').startswith(PREFIX)
+    assert db_client.post('/login', json={'username': 'cook', 'password': 'pw'}).status_code == 200
+    assert db_client.post('/login', json={'username': 'cook', 'password': 'nope'}).status_code == 401
+    assert db_client.post('/login', json={'username': 'nobody', 'password': 'pw'}).status_code == 401
+
+
+def test_plaintext_and_old_cost_rows_are_upgraded_on_login(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (username, email, password) VALUES ('old', 'old@test.com', 'pw')")
+        conn.execute("INSERT INTO account (username, email, password) VALUES ('weak', 'weak@test.com', ?)",
+                     (hash_with('pw', 2 ** 10, 8, 1),))
+        conn.commit()
+    assert db_client.post('/login', json={'username': 'old', 'password': 'wrong'}).status_code == 401
+    assert stored_password('old') == 'pw'
+
+    for username in ('old', 'weak'):
+        assert db_client.post('/login', json={'username': username, 'password': 'pw'}).status_code == 200
+        upgraded = stored_password(username)
+        assert upgraded.startswith(PREFIX + '$'.join(map(str, get_password_hasher(app).cost)) + '$')
+        assert db_client.post('/login', json={'username': username, 'password': 'pw'}).status_code == 200
+        assert stored_password(username) == upgraded
+
+
+def test_change_password_rehashes(db_client):
+    db_client.post('/signup', json={'username': 'cook', 'email': 'cook@test.com', 'password': 'pw'})
+    db_client.post('/login', json={'username': 'cook', 'password': 'pw'})
+    assert db_client.post('/change_password', data={'current_password': 'bad', 'new_password': 'x'}).status_code == 401
+    assert db_client.post('/change_password', data={'current_password': 'pw', 'new_password': 'new'}).status_code == 200
+    assert check(stored_password('cook'), 'new')
+
+
+def test_a_full_pool_sheds_logins_with_503(tmp_path):
+    busy = create_app({'DATABASE': str(tmp_path / 'busy.db'), 'TESTING': True,
+                       'PASSWORD_HASH_WORKERS': 1, 'PASSWORD_HASH_QUEUE': 0, 'PASSWORD_HASH_WAIT': 0})
+    init_db(busy)
+    hasher = get_password_hasher(busy)
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait()
+
+    holder = threading.Thread(target=hasher._run, args=(hold,))
+    holder.start()
+    started.wait()
+    try:
+        with pytest.raises(PasswordPoolBusy):
+            hasher.hash('pw')
+        response = busy.test_client().post('/login', json={'username': 'cook', 'password': 'pw'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        holder.join()
+    assert hasher.stats()['rejected'] == 2
+    assert hasher.hash('pw').startswith(PREFIX)
+    hasher.shutdown()
+
+
+def test_logins_hash_without_holding_a_connection(tmp_path, monkeypatch):
+    small = create_app({'DATABASE': str(tmp_path / 'small.db'), 'TESTING': True,
+                        'DB_POOL_SIZE': 1, 'DB_POOL_TIMEOUT': 0.2})
+    init_db(small)
+    with small.app_context():
+        get_db().execute("INSERT INTO account (username, email, password) VALUES ('cook', 'cook@test.com', 'pw')")
+        get_db().commit()
+    hasher = get_password_hasher(small)
+    verify, hashing, release = hasher.verify, threading.Event(), threading.Event()
+
+    def slow_verify(stored, password):
+        hashing.set()
+        release.wait()
+        return verify(stored, password)
+
+    monkeypatch.setattr(hasher, 'verify', slow_verify)
+    statuses = []
+    login = threading.Thread(target=lambda: statuses.append(
+        small.test_client().post('/login', json={'username': 'cook', 'password': 'pw'}).status_code))
+    login.start()
+    hashing.wait()
+    pool = get_pool(small)
+    try:
+        # The only connection is free while the login hashes
+        conn = pool.acquire()
+        try:
+            # And a request that finds the pool empty is told to retry
+            response = small.test_client().get('/api/recipes')
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == '1'
+        finally:
+            pool.release(conn)
+    finally:
+        release.set()
+        login.join()
+    assert statuses == [200]
+    hasher.shutdown()
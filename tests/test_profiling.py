@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from flask import g
+
+from app import app
+from db import get_db
+from helpers import add_recipe
+from profiling import RequestProfile, normalize_sql
+
+
+@pytest.fixture
+def seeded(db_client):
+    with app.app_context():
+        conn = get_db()
+        add_recipe(conn, 'Lemon Tart', ingredients=['lemon', 'butter'])
+        add_recipe(conn, 'Herb Soup', ingredients=['thyme'])
+    return db_client
+
+
+@pytest.fixture
+def profiling_config():
+    keys = ('METRICS_TOKEN', 'PROFILING_SAMPLE_RATE', 'PROFILING_DIR')
+    saved = {key: app.config[key] for key in keys}
+    yield app.config
+    app.config.update(saved)
+
+
+def test_normalize_sql_strips_literals():
+    sql = """SELECT * FROM recipe
+             WHERE recipe_name = 'It''s' AND prep_time > 15 AND recipe_id IN (?, ?, ?)"""
+    assert normalize_sql(sql) == 'SELECT * FROM recipe WHERE recipe_name = ? AND prep_time > ? AND recipe_id IN (?, ...)'
+
+
+def test_server_timing_reports_sql(seeded):
+    response = seeded.get('/api/recipes')
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('total;dur=')
+    statements = int(timing.split('desc="')[1].split(' ')[0])
+    assert statements >= 1
+    assert 'render;dur=0.00' in timing
+
+
+def test_iterating_a_cursor_counts_as_sql_time(seeded):
+    sql = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 20000) SELECT i FROM n'
+    with app.app_context():
+        profile = g.profile = RequestProfile()
+        cursor = get_db().execute(sql)
+        after_execute = profile.sql_time
+        assert sum(1 for _ in cursor) == 20000
+    assert profile.sql_time > after_execute > 0
+    assert profile.queries[normalize_sql(sql)][0] == 1
+
+
+def test_server_timing_includes_template_render(seeded):
+    render = seeded.get('/').headers['Server-Timing'].split('render;dur=')[1]
+    assert float(render) > 0
+
+
+def test_metrics_exposes_requests_and_statements(seeded, profiling_config):
+    profiling_config['METRICS_TOKEN'] = 'secret'
+    seeded.get('/api/recipes')
+    body = seeded.get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+    assert 'tastely_requests_total{endpoint="get_recipes",method="GET",status="200"}' in body
+    assert 'tastely_request_duration_seconds_bucket{endpoint="get_recipes",le="+Inf"}' in body
+    assert 'tastely_sql_statements_total{endpoint="get_recipes"}' in body
+    assert 'tastely_statement_calls_total{statement="SELECT' in body
+    assert 'tastely_db_pool{stat="checkouts"}' in body
+
+
+def test_metrics_token(seeded, profiling_config):
+    profiling_config['METRICS_TOKEN'] = 'secret'
+    assert seeded.get('/metrics').status_code == 403
+    assert seeded.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_metrics_without_a_token_need_an_admin(seeded):
+    assert seeded.get('/metrics').status_code == 403
+    with app.app_context():
+        get_db().execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        get_db().commit()
+    with seeded.session_transaction() as sess:
+        sess['user_id'] = 1
+    assert seeded.get('/metrics').status_code == 403
+    seeded.post('/update_security_key', data={'security_key': 'admin'})
+    assert seeded.get('/metrics').status_code == 200
+
+
+def test_sampled_profile_written(seeded, profiling_config, tmp_path):
+    profiling_config['PROFILING_SAMPLE_RATE'] = 1.0
+    profiling_config['PROFILING_DIR'] = str(tmp_path / 'profiles')
+    seeded.get('/api/recipes')
+    assert [name for name in os.listdir(tmp_path / 'profiles') if name.startswith('get_recipes-')]
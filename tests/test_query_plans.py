@@ -0,0 +1,224 @@
+"""EXPLAIN QUERY PLAN checks for every statement the routes issue.
+
+The routes are driven against a database seeded by benchmarks/generate_data.py
+while the pool records each statement and its parameters. Each statement is
+then explained on the same data. A full scan of a large table, or a temp
+B-tree for sorting, grouping or deduplication, fails the test unless that
+plan step is listed in ALLOWED with the reason it is acceptable. Walking an
+index in order under a LIMIT counts as a lookup, not a scan.
+"""
+import re
+import sqlite3
+
+import pytest
+from flask import has_request_context, request
+
+from app import app, init_db
+from benchmarks.generate_data import generate
+from cache import get_cache
+from profiling import ProfiledConnection, ProfiledCursor, normalize_sql
+from recommender import get_recommender
+
+# Tables that grow with users and content; scans of the small lookup tables are fine
+LARGE_TABLES = {'account', 'users', 'user_restrictions', 'cookbook', 'contains', 'recipe', 'ingredients',
+                'recipe_restrictions', 'rates', 'recipe_rating_stats'}
+
+# (endpoint, fragment of the normalized statement, fragment of the plan step) -> why it is acceptable
+ALLOWED = {
+    ('dashboard', 'WHERE recipe_fts MATCH', 'TEMP B-TREE FOR ORDER BY'):
+        'bm25 rank is computed per match, so ranked results are sorted after MATCH narrows them',
+    ('get_recipes', 'WHERE recipe_fts MATCH', 'TEMP B-TREE FOR ORDER BY'):
+        'bm25 rank is computed per match, so ranked results are sorted after MATCH narrows them',
+    ('cookbook', 'UNION', 'UNION USING TEMP B-TREE'):
+        'UNION deduplicates one user\'s own and saved recipes; both arms are index lookups',
+    ('recommended_recipes', 'HAVING COUNT(*)', 'TEMP B-TREE FOR GROUP BY'):
+        'restrictions outside ALL_TAGS group the tag rows found through idx_recipe_restrictions_tag',
+    ('recommended_recipes', 'HAVING COUNT(*)', 'TEMP B-TREE FOR ORDER BY'):
+        'the recipes matching those tags drive the join and are sorted by score afterwards',
+}
+
+# Endpoints that never touch the database, so there is nothing to explain
+NO_SQL_ENDPOINTS = {'static', 'index', 'logout', 'settings', 'cache_stats', 'metrics', 'run_tests',
+                    'test_job_status'}
+
+_ALIAS = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SKIP = re.compile(r'^\s*(BEGIN|COMMIT|ROLLBACK|PRAGMA)\b', re.IGNORECASE)
+
+recorded = []
+
+
+class RecordingCursor(ProfiledCursor):
+    def execute(self, sql, parameters=()):
+        if has_request_context():
+            recorded.append((request.endpoint, sql, tuple(parameters)))
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        rows = list(seq_of_parameters)
+        if has_request_context() and rows:
+            recorded.append((request.endpoint, sql, tuple(rows[0])))
+        return super().executemany(sql, rows)
+
+
+class RecordingConnection(ProfiledConnection):
+    def cursor(self, factory=RecordingCursor):
+        return super().cursor(factory)
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess.clear()
+        sess['user_id'] = user_id
+
+
+def drive_routes(client, conn):
+    """Hit every route that runs SQL, covering each branch that issues different statements."""
+    recipes = [row[0] for row in conn.execute('SELECT recipe_name FROM recipe ORDER BY recipe_id LIMIT 3')]
+    owner = conn.execute('SELECT UserID FROM recipe WHERE recipe_name = ?', (recipes[0],)).fetchone()[0]
+    restricted = conn.execute('SELECT User_ID FROM user_restrictions LIMIT 1').fetchone()[0]
+    unrestricted, custom = [row[0] for row in conn.execute(
+        'SELECT id FROM account WHERE id NOT IN (SELECT User_ID FROM user_restrictions) LIMIT 2')]
+    # Restrictions outside ALL_TAGS take the tag-row branch of /api/recommended
+    for tag, every in (('Halal', 3), ('Kosher', 5)):
+        conn.execute('INSERT INTO user_restrictions (User_ID, UserRestriction) VALUES (?, ?)', (custom, tag))
+        conn.execute('INSERT INTO recipe_restrictions (recipe_id, RecRestriction) SELECT recipe_id, ? FROM recipe WHERE recipe_id % ? = 0',
+                     (tag, every))
+    conn.commit()
+    username = conn.execute('SELECT username FROM account WHERE id = ?', (owner,)).fetchone()[0]
+
+    def get(url, **kwargs):
+        get_cache(app).clear()
+        return client.get(url, **kwargs)
+
+    def post(url, **kwargs):
+        get_cache(app).clear()
+        return client.post(url, **kwargs)
+
+    post('/signup', json={'username': 'plan-user', 'email': 'plan@example.com', 'password': 'pw'})
+    post('/login', json={'username': username, 'password': 'password'})
+
+    first = get('/api/recipes?limit=5').get_json()
+    get('/api/recipes?limit=5&cursor=' + first['next_cursor'])
+    found = get('/api/recipes?limit=5&search=garlic').get_json()
+    get('/api/recipes?limit=5&search=garlic&cursor=' + found['next_cursor'])
+
+    for user_id in (unrestricted, restricted, custom):
+        login(client, user_id)
+        for sort in ('rating', 'score', 'personal'):
+            page = get(f'/api/recommended?limit=5&sort={sort}').get_json()
+            if page['next_cursor']:
+                get(f'/api/recommended?limit=5&sort={sort}&cursor=' + page['next_cursor'])
+
+    login(client, owner)
+    slug = recipes[0].replace(' ', '-')
+    get('/dashboard')
+    get('/dashboard?search=garlic')
+    get('/recommended')
+    get('/recipe/' + slug)
+    get(f'/api/recipes/{recipes[0]}/similar')
+    get('/api/recipes/cookable?ingredients=garlic,salt,eggs,rice')
+    get('/api/suggest?q=gar')
+    get('/edit-recipe/' + slug)
+    post('/edit-recipe/' + slug, data={'description': 'd', 'prep_time': 5, 'cook_time': 5, 'ingredients': 'salt',
+                                       'instructions': 'i', 'cuisine_type': 'Italian', 'tags[]': ['Vegan'],
+                                       'recipe_image': (b'', '')}, content_type='multipart/form-data')
+    get('/check-cookbook/' + recipes[1])
+    post('/save-to-cookbook/' + recipes[1])
+    post('/toggle-cookbook/' + recipes[1])
+    post('/toggle-cookbook/' + recipes[2])
+    get('/cookbook')
+    post('/rate-recipe', json={'recipe_name': recipes[1], 'rating': 4})
+    get('/create-recipe')
+    post('/create-recipe', data={'recipe_name': 'Plan Check Stew', 'description': 'd', 'prep_time': 5, 'cook_time': 5,
+                                 'ingredients': 'salt, pepper', 'instructions': 'i', 'cuisine_type': 'Italian',
+                                 'tags[]': ['Vegan'], 'recipe_image': (b'', '')}, content_type='multipart/form-data')
+    client.delete('/delete-recipe/Plan Check Stew')
+    # Again after the writes, so the in-memory indexes sync rather than build fresh
+    get('/api/recipes/cookable?ingredients=garlic,salt,eggs,rice')
+    get('/api/suggest?q=gar')
+    post('/change_email', data={'email': 'owner@example.com'})
+    post('/change_password', data={'current_password': 'password', 'new_password': 'password'})
+    post('/update_diet_restrictions', data={'diet[]': ['Vegan']})
+    post('/update_security_key', data={'security_key': 'admin'})
+    post('/change_username', data={'username': 'renamed-owner'})
+    post('/delete_account')
+
+
+@pytest.fixture(scope='module')
+def plans(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plans') / 'seeded.db')
+    conn = sqlite3.connect(path)
+    generate(conn, accounts=300, recipes=3000, ingredients=8, ratings=30000, cookbook_entries=5, log=lambda _: None)
+
+    original = app.config['DATABASE'], app.config['DB_CONNECTION_FACTORY'], app.config['LIVE_INDEX_SYNC_INTERVAL']
+    app.config['DB_CONNECTION_FACTORY'] = RecordingConnection
+    app.config['LIVE_INDEX_SYNC_INTERVAL'] = 0
+    app.config['DATABASE'] = path
+    recorded.clear()
+    try:
+        init_db()
+        get_recommender(app).rebuild()
+        with app.test_client() as client:
+            drive_routes(client, conn)
+    finally:
+        app.config['DATABASE'], app.config['DB_CONNECTION_FACTORY'], app.config['LIVE_INDEX_SYNC_INTERVAL'] = original
+        get_recommender(app).model = None
+        get_cache(app).clear()
+
+    statements = {}
+    for endpoint, sql, params in recorded:
+        if not _SKIP.match(sql):
+            statements.setdefault((endpoint, normalize_sql(sql)), (sql, params))
+    explained = {key: [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+                 for key, (sql, params) in statements.items()}
+    conn.close()
+    return explained
+
+
+def problems(sql, plan):
+    aliases = {}
+    for table, alias in _ALIAS.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in {'ON', 'WHERE', 'SET', 'VALUES', 'USING', 'JOIN', 'LEFT', 'GROUP', 'ORDER'}:
+            aliases[alias] = table
+    found = []
+    for detail in plan:
+        scan = re.match(r'SCAN (\w+)', detail)
+        if scan and 'VIRTUAL TABLE' not in detail and aliases.get(scan.group(1), scan.group(1)) in LARGE_TABLES:
+            if ' LIMIT ' in sql + ' ' and 'USING' in detail and 'INDEX' in detail:
+                continue  # ordered index walk that stops at the LIMIT
+            found.append(detail)
+        if 'TEMP B-TREE' in detail:
+            found.append(detail)
+    return found
+
+
+def allowed(endpoint, sql, detail):
+    return any(endpoint == allowed_endpoint and sql_fragment in sql and plan_fragment in detail
+               for allowed_endpoint, sql_fragment, plan_fragment in ALLOWED)
+
+
+def test_every_sql_route_was_exercised(plans):
+    exercised = {endpoint for endpoint, _ in plans}
+    assert set(app.view_functions) - NO_SQL_ENDPOINTS <= exercised
+
+
+def test_live_index_syncs_were_captured(plans):
+    synced = {endpoint for endpoint, sql in plans if 'FROM recipe_changes' in sql}
+    assert {'cookable_recipes', 'suggestions'} <= synced
+
+
+def test_hot_paths_use_indexes(plans):
+    failures = []
+    for (endpoint, sql), plan in sorted(plans.items()):
+        found = [detail for detail in problems(sql, plan) if not allowed(endpoint, sql, detail)]
+        if found:
+            failures.append(f'{endpoint}: {sql}\n    ' + '\n    '.join(found))
+    assert not failures, 'Unindexed statements:\n' + '\n'.join(failures)
+
+
+def test_allowed_entries_are_still_needed(plans):
+    stale = [key for key in ALLOWED
+             if not any(endpoint == key[0] and key[1] in sql and any(key[2] in detail for detail in problems(sql, plan))
+                        for (endpoint, sql), plan in plans.items())]
+    assert not stale, f'ALLOWED entries whose statements now plan cleanly: {stale}'
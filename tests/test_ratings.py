@@ -0,0 +1,95 @@
+import pytest
+
+from app import app
+from db import get_db
+from helpers import add_recipe
+from ratings import check_rating_stats, rebuild_rating_stats
+
+
+@pytest.fixture
+def rated(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'user{i}', f'user{i}@test.com', 'pw') for i in (1, 2, 3)])
+        add_recipe(conn, 'Soup')
+        add_recipe(conn, 'Salad')
+    return db_client
+
+
+def stats(name):
+    with app.app_context():
+        return get_db().execute('''
+            SELECT s.rating_sum, s.rating_count, s.avg_rating
+            FROM recipe_rating_stats s JOIN recipe r ON r.recipe_id = s.recipe_id
+            WHERE r.recipe_name = ?
+        ''', (name,)).fetchone()
+
+
+def rate(client, user_id, name, rating):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client.post('/rate-recipe', json={'recipe_name': name, 'rating': rating})
+
+
+def test_changed_rating_replaces_old_value(rated):
+    rate(rated, 1, 'Soup', 5)
+    rate(rated, 2, 'Soup', 3)
+    assert tuple(stats('Soup')) == (8, 2, 4.0)
+
+    rate(rated, 1, 'Soup', '1')
+    assert tuple(stats('Soup')) == (4, 2, 2.0)
+    assert tuple(stats('Salad')) == (0, 0, 0.0)
+
+
+def test_deleting_ratings_and_recipes_keeps_stats_consistent(rated):
+    rate(rated, 1, 'Soup', 4)
+    rate(rated, 3, 'Salad', 2)
+    with app.app_context():
+        conn = get_db()
+        conn.execute('DELETE FROM rates WHERE User_ID = 1')
+        conn.commit()
+        assert check_rating_stats(conn) == []
+        conn.execute("DELETE FROM recipe WHERE recipe_name = 'Salad'")
+        conn.commit()
+        assert conn.execute('SELECT COUNT(*) FROM recipe_rating_stats').fetchone()[0] == 1
+    assert tuple(stats('Soup')) == (0, 0, 0.0)
+
+
+def test_rebuild_repairs_drift(rated):
+    rate(rated, 1, 'Soup', 5)
+    with app.app_context():
+        conn = get_db()
+        conn.execute('UPDATE recipe_rating_stats SET rating_sum = 99')
+        conn.commit()
+        assert len(check_rating_stats(conn)) == 2
+        rebuild_rating_stats(conn)
+        assert check_rating_stats(conn) == []
+    assert tuple(stats('Soup')) == (5, 1, 5.0)
+
+
+def test_rebuild_command(rated):
+    result = app.test_cli_runner().invoke(args=['rebuild-rating-stats'])
+    assert '0 recipe(s) had drifted' in result.output
+
+
+def test_top_rated_is_an_index_scan(rated):
+    with app.app_context():
+        plan = get_db().execute('''
+            EXPLAIN QUERY PLAN
+            SELECT recipe_id FROM recipe_rating_stats ORDER BY weighted_score DESC, recipe_id LIMIT 10
+        ''').fetchall()
+    details = ' '.join(row['detail'] for row in plan)
+    assert 'idx_rating_stats_score' in details
+    assert 'TEMP B-TREE' not in details
+
+
+def test_recommended_sort_by_weighted_score(rated):
+    for user_id in (1, 2, 3):
+        rate(rated, user_id, 'Salad', 4)
+    rate(rated, 1, 'Soup', 5)
+    by_avg = rated.get('/api/recommended?fields=recipe_name').get_json()['recipes']
+    by_score = rated.get('/api/recommended?sort=score&fields=recipe_name').get_json()['recipes']
+    assert [r['recipe_name'] for r in by_avg] == ['Soup', 'Salad']
+    assert [r['recipe_name'] for r in by_score] == ['Salad', 'Soup']
+    assert rated.get('/api/recommended?sort=bogus').status_code == 400
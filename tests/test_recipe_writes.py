@@ -0,0 +1,129 @@
+import io
+
+import pytest
+
+from app import app
+from db import get_db
+
+
+@pytest.fixture
+def author(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'u', 'u@test.com', 'pw')")
+        conn.execute('INSERT INTO cookbook (CookBook_ID) VALUES (1)')
+        conn.commit()
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return db_client
+
+
+def create(client, name, ingredients, tags=()):
+    return client.post('/create-recipe', data={
+        'recipe_name': name, 'description': 'd', 'prep_time': '5', 'cook_time': '5',
+        'ingredients': ', '.join(ingredients), 'instructions': 'cook', 'cuisine_type': 'American',
+        'tags[]': list(tags), 'recipe_image': (io.BytesIO(b''), ''),
+    }, content_type='multipart/form-data')
+
+
+def recipe_id(conn, name):
+    return conn.execute('SELECT recipe_id FROM recipe WHERE recipe_name = ?', (name,)).fetchone()[0]
+
+
+def counts(conn, recipe_id):
+    return {table: conn.execute(f'SELECT COUNT(*) FROM {table} WHERE recipe_id = ?', (recipe_id,)).fetchone()[0]
+            for table in ('recipe', 'ingredients', 'recipe_restrictions', 'rates', 'contains')}
+
+
+def test_create_writes_children_and_full_text(author):
+    ingredients = [f'spice {i}' for i in range(60)]
+    assert create(author, 'Curry', ingredients, ['Vegan']).status_code == 302
+    with app.app_context():
+        conn = get_db()
+        assert counts(conn, recipe_id(conn, 'Curry')) == {'recipe': 1, 'ingredients': 60, 'recipe_restrictions': 1, 'rates': 0, 'contains': 0}
+        indexed = conn.execute('SELECT ingredients FROM recipe_fts WHERE recipe_name = ?', ('Curry',)).fetchone()[0]
+    assert sorted(indexed.split()) == sorted(' '.join(ingredients).split())
+
+
+def test_failed_create_leaves_nothing_behind(author):
+    assert create(author, 'Soup', ['salt']).status_code == 302
+    assert create(author, 'Soup', ['leek', 'potato'], ['Vegan']).status_code == 500
+    with app.app_context():
+        conn = get_db()
+        assert conn.execute('SELECT COUNT(*) FROM recipe').fetchone()[0] == 1
+        assert conn.execute('SELECT COUNT(*) FROM ingredients').fetchone()[0] == 1
+        assert conn.execute('SELECT COUNT(*) FROM recipe_restrictions').fetchone()[0] == 0
+
+
+def test_repeated_and_blank_ingredients_are_dropped(author):
+    assert create(author, 'Soup', ['salt', 'Salt', ' ', 'leeks', 'leek', '']).status_code == 302
+    with app.app_context():
+        conn = get_db()
+        soup = recipe_id(conn, 'Soup')
+        names = conn.execute('SELECT ingredient_name FROM ingredients WHERE recipe_id = ? ORDER BY ingredient_name',
+                             (soup,)).fetchall()
+        assert [row[0] for row in names] == ['leeks', 'salt']
+        assert conn.execute("SELECT rowid FROM recipe_fts WHERE recipe_fts MATCH 'leeks'").fetchone()[0] == soup
+
+
+def edit(client, name, tags, cuisine_type='American'):
+    return client.post('/edit-recipe/' + name.replace(' ', '-'), data={
+        'description': 'd', 'prep_time': '5', 'cook_time': '5', 'ingredients': 'salt', 'instructions': 'cook',
+        'cuisine_type': cuisine_type, 'tags[]': list(tags), 'recipe_image': (io.BytesIO(b''), ''),
+    }, content_type='multipart/form-data')
+
+
+def tags_of(conn, name):
+    rows = conn.execute('SELECT RecRestriction FROM recipe_restrictions WHERE recipe_id = ? ORDER BY RecRestriction',
+                        (recipe_id(conn, name),))
+    return [row[0] for row in rows]
+
+
+def test_edit_with_repeated_tags(author):
+    assert create(author, 'Soup', ['salt'], ['Vegan']).status_code == 302
+    assert edit(author, 'Soup', ['Vegan', 'Gluten-Free', 'Vegan']).status_code == 302
+    with app.app_context():
+        assert tags_of(get_db(), 'Soup') == ['Gluten-Free', 'Vegan']
+
+
+def test_failed_edit_keeps_the_old_tags(author):
+    assert create(author, 'Soup', ['salt'], ['Vegan']).status_code == 302
+    assert edit(author, 'Soup', ['Gluten-Free'], cuisine_type='Martian').status_code == 500
+    with app.app_context():
+        conn = get_db()
+        assert tags_of(conn, 'Soup') == ['Vegan']
+        assert conn.execute("SELECT Cuisine_ID FROM recipe WHERE recipe_name = 'Soup'").fetchone()[0] == 'American'
+
+
+def test_delete_cascades_to_child_rows(author):
+    create(author, 'Stew', ['beef', 'carrot'], ['Gluten-Free'])
+    author.post('/rate-recipe', json={'recipe_name': 'Stew', 'rating': 4})
+    author.post('/save-to-cookbook/Stew')
+    with app.app_context():
+        stew = recipe_id(get_db(), 'Stew')
+        assert counts(get_db(), stew) == {'recipe': 1, 'ingredients': 2, 'recipe_restrictions': 1, 'rates': 1, 'contains': 1}
+
+    assert author.delete('/delete-recipe/Stew').status_code == 200
+    with app.app_context():
+        conn = get_db()
+        assert counts(conn, stew) == {'recipe': 0, 'ingredients': 0, 'recipe_restrictions': 0, 'rates': 0, 'contains': 0}
+        assert conn.execute("SELECT COUNT(*) FROM recipe_fts WHERE recipe_fts MATCH 'beef'").fetchone()[0] == 0
+    assert author.delete('/delete-recipe/Stew').status_code == 404
+
+
+def test_deleting_an_account_keeps_its_recipes(author):
+    assert create(author, 'Curry', ['rice']).status_code == 302
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (2, 'fan', 'fan@test.com', 'pw')")
+        conn.execute('INSERT INTO cookbook (CookBook_ID) VALUES (2)')
+        curry = recipe_id(conn, 'Curry')
+        conn.execute('INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (2, ?, 5)', (curry,))
+        conn.execute('INSERT INTO contains (CookBook_ID, recipe_id) VALUES (2, ?)', (curry,))
+        conn.commit()
+    assert author.post('/delete_account').status_code == 200
+    with app.app_context():
+        conn = get_db()
+        assert conn.execute('SELECT UserID FROM recipe WHERE recipe_id = ?', (curry,)).fetchone()[0] is None
+        assert counts(conn, curry) == {'recipe': 1, 'ingredients': 1, 'recipe_restrictions': 0, 'rates': 1, 'contains': 1}
+        assert conn.execute('SELECT COUNT(*) FROM account WHERE id = 1').fetchone()[0] == 0
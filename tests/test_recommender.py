@@ -0,0 +1,145 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+from app import app
+from cache import invalidate
+from db import get_db
+from helpers import add_recipe
+from recommender import build_model, get_recommender
+from restrictions import get_restriction_index, tags_to_mask
+
+# Users 1-3 like the soups and dislike the salads; user 4 has only rated one soup
+RATINGS = [
+    (1, 'Tomato Soup', 5), (1, 'Onion Soup', 5), (1, 'Kale Salad', 1), (1, 'Bean Salad', 2),
+    (2, 'Tomato Soup', 4), (2, 'Onion Soup', 5), (2, 'Kale Salad', 2), (2, 'Bean Salad', 1),
+    (3, 'Tomato Soup', 5), (3, 'Onion Soup', 4), (3, 'Kale Salad', 1), (3, 'Bean Salad', 1),
+    (4, 'Tomato Soup', 5), (4, 'Kale Salad', 1),
+]
+
+
+@pytest.fixture
+def engine(db_client):
+    recommender = get_recommender(app)
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'user{i}', f'user{i}@test.com', 'pw') for i in range(1, 6)])
+        ids = {name: add_recipe(conn, name) for name in ('Tomato Soup', 'Onion Soup', 'Kale Salad', 'Bean Salad')}
+        conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (?, ?, ?)',
+                         [(user, ids[name], rating) for user, name, rating in RATINGS])
+        conn.commit()
+    recommender.rebuild()
+    yield recommender
+    recommender.shutdown()
+    recommender.model = None
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+
+def names(response):
+    return [recipe['recipe_name'] for recipe in response.get_json()['recipes']]
+
+
+def test_similar_recipes_follow_co_ratings(engine):
+    model = engine.model
+    with app.app_context():
+        ids = dict(get_db().execute('SELECT recipe_name, recipe_id FROM recipe').fetchall())
+    assert model.similar(ids['Tomato Soup'])[0][0] == ids['Onion Soup']
+    assert model.similar(ids['Kale Salad'])[0][0] == ids['Bean Salad']
+    # User 4 is recommended the other soup and not what they already rated
+    assert [recipe_id for recipe_id, _ in model.for_user(4)] == [ids['Onion Soup']]
+
+
+def test_rescoring_a_user_matches_a_full_build(engine):
+    conn = sqlite3.connect(app.config['DATABASE'])
+    ratings = conn.execute('SELECT recipe_id, user_rating FROM rates WHERE User_ID = 4').fetchall()
+    conn.close()
+    recipe_ids, scores = engine.model.score_user(ratings)
+    assert list(zip(recipe_ids.tolist(), scores.tolist())) == engine.model.for_user(4)
+
+
+def test_similar_endpoint(engine, db_client):
+    response = db_client.get('/api/recipes/Tomato Soup/similar?fields=recipe_name')
+    assert names(response)[0] == 'Onion Soup'
+    assert 0 < response.get_json()['recipes'][0]['similarity'] <= 1
+    assert db_client.get('/api/recipes/Nope/similar').status_code == 404
+
+
+def test_similar_listing_follows_new_ratings(engine, db_client):
+    url = '/api/recipes/Tomato Soup/similar?fields=recipe_name,avg_rating'
+    before = {r['recipe_name']: r['avg_rating'] for r in db_client.get(url).get_json()['recipes']}
+    login(db_client, 5)
+    db_client.post('/rate-recipe', json={'recipe_name': 'Onion Soup', 'rating': 1})
+    after = {r['recipe_name']: r['avg_rating'] for r in db_client.get(url).get_json()['recipes']}
+    assert after['Onion Soup'] < before['Onion Soup']
+
+
+def walk(client, url):
+    found, cursor = [], None
+    while True:
+        data = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+        found += [recipe['recipe_name'] for recipe in data['recipes']]
+        cursor = data['next_cursor']
+        if not cursor:
+            return found
+
+
+def test_personal_ordering_and_fallback(engine, db_client):
+    login(db_client, 4)
+    # The model's pick first, then every other recipe by weighted score
+    personal = names(db_client.get('/api/recommended?sort=personal&fields=recipe_name'))
+    assert personal == ['Onion Soup'] + [name for name in names(db_client.get('/api/recommended?sort=score&fields=recipe_name'))
+                                         if name != 'Onion Soup']
+    assert walk(db_client, '/api/recommended?sort=personal&fields=recipe_name&limit=1') == personal
+    # Nobody similar to user 5 yet, so they get the weighted-score order
+    login(db_client, 5)
+    fallback = names(db_client.get('/api/recommended?sort=personal&fields=recipe_name'))
+    assert fallback == names(db_client.get('/api/recommended?sort=score&fields=recipe_name'))
+
+
+def test_personal_picks_follow_restriction_edits(engine, db_client):
+    def tag(name, tags):
+        with app.app_context():
+            conn = get_db()
+            recipe_id = conn.execute('SELECT recipe_id FROM recipe WHERE recipe_name = ?', (name,)).fetchone()[0]
+            conn.execute('DELETE FROM recipe_restrictions WHERE recipe_id = ?', (recipe_id,))
+            conn.executemany('INSERT INTO recipe_restrictions (recipe_id, RecRestriction) VALUES (?, ?)',
+                             [(recipe_id, t) for t in tags])
+            conn.execute('UPDATE recipe SET restriction_mask = ? WHERE recipe_id = ?', (tags_to_mask(tags), recipe_id))
+            conn.commit()
+            invalidate('recipes')
+
+    with app.app_context():
+        get_db().execute("INSERT INTO user_restrictions (User_ID, UserRestriction) VALUES (4, 'Vegan')")
+        get_db().commit()
+    tag('Onion Soup', ['Vegan'])
+    tag('Kale Salad', ['Vegan'])
+    login(db_client, 4)
+    url = '/api/recommended?sort=personal&fields=recipe_name'
+    assert names(db_client.get(url)) == ['Onion Soup', 'Kale Salad']
+    rebuilds = get_restriction_index(app).rebuilds
+    tag('Onion Soup', [])
+    assert names(db_client.get(url)) == ['Kale Salad']
+    assert get_restriction_index(app).rebuilds == rebuilds + 1
+
+
+def test_new_ratings_rescore_the_user(engine, db_client):
+    login(db_client, 5)
+    db_client.post('/rate-recipe', json={'recipe_name': 'Kale Salad', 'rating': 5})
+    db_client.post('/rate-recipe', json={'recipe_name': 'Tomato Soup', 'rating': 1})
+    assert engine.refresh_users() == {5}
+    assert names(db_client.get('/api/recommended?sort=personal&fields=recipe_name'))[0] == 'Bean Salad'
+    assert len(names(db_client.get('/api/recommended?sort=personal&fields=recipe_name'))) == 4
+
+
+def test_empty_ratings_build(db_client):
+    with app.app_context():
+        model = build_model(get_db())
+    assert model.similar(1) == [] and model.for_user(1) == []
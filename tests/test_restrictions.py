@@ -0,0 +1,140 @@
+from itertools import combinations
+
+import pytest
+
+from app import app
+from db import get_db
+from helpers import add_recipe
+from restrictions import ALL_TAGS, MaskIndex, get_restriction_index, rebuild_restriction_masks, tags_to_mask, user_mask
+
+TAG_SETS = [list(combo) for n in range(len(ALL_TAGS) + 1) for combo in combinations(ALL_TAGS, n)]
+
+# The recommendation filter as it was written before restriction masks
+LEGACY_QUERY = '''
+    SELECT DISTINCT r.recipe_name
+    FROM recipe r
+    JOIN recipe_restrictions rr ON r.recipe_id = rr.recipe_id
+    WHERE rr.RecRestriction IN ({placeholders})
+    AND r.recipe_name IN (
+        SELECT r2.recipe_name
+        FROM recipe r2
+        JOIN recipe_restrictions rr2 ON r2.recipe_id = rr2.recipe_id
+        WHERE rr2.RecRestriction IN ({placeholders})
+        GROUP BY r2.recipe_name
+        HAVING COUNT(*) = {count}
+    )
+'''
+
+
+def test_user_mask():
+    assert user_mask([]) == 0
+    assert user_mask(['None', 'Vegan']) == 0
+    assert user_mask(['Vegan', 'Dairy-Free']) == tags_to_mask(['Dairy-Free', 'Vegan'])
+    assert user_mask(['Keto']) is None
+
+
+@pytest.fixture
+def tagged(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'u', 'u@test.com', 'pw')")
+        for i, tags in enumerate(TAG_SETS):
+            add_recipe(conn, 'Recipe ' + '+'.join(tags or ['plain']), tags=tags)
+        add_recipe(conn, 'Keto Vegan Bowl', tags=['Keto', 'Vegan'])
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return db_client
+
+
+@pytest.mark.parametrize('restrictions', TAG_SETS + [['None'], ['None', 'Vegan'], ['Keto']])
+def test_recommendations_match_legacy_filter(tagged, restrictions):
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO user_restrictions (User_ID, UserRestriction) VALUES (1, ?)',
+                         [(tag,) for tag in restrictions])
+        conn.commit()
+        if restrictions and 'None' not in restrictions:
+            placeholders = ','.join('?' for _ in restrictions)
+            legacy = conn.execute(LEGACY_QUERY.format(placeholders=placeholders, count=len(restrictions)),
+                                  restrictions + restrictions).fetchall()
+        else:
+            legacy = conn.execute('SELECT recipe_name FROM recipe').fetchall()
+        expected = {row['recipe_name'] for row in legacy}
+
+        wanted = user_mask(restrictions)
+        if wanted is not None:
+            names = conn.execute('SELECT recipe_name FROM recipe WHERE restriction_mask & ? = ?', (wanted, wanted))
+            assert {row['recipe_name'] for row in names} == expected
+
+    data = tagged.get('/api/recommended?limit=100&fields=recipe_name').get_json()
+    assert {recipe['recipe_name'] for recipe in data['recipes']} == expected
+
+
+def test_rebuild_restriction_masks(tagged):
+    with app.app_context():
+        conn = get_db()
+        conn.execute('UPDATE recipe SET restriction_mask = 0')
+        rebuild_restriction_masks(conn)
+        masks = dict(conn.execute('SELECT recipe_name, restriction_mask FROM recipe').fetchall())
+    assert masks['Recipe Vegan+Dairy-Free'] == tags_to_mask(['Vegan', 'Dairy-Free'])
+    assert masks['Keto Vegan Bowl'] == tags_to_mask(['Vegan'])
+
+
+
+def test_mask_index_matches_sql(tagged):
+    with app.app_context():
+        conn = get_db()
+        index = MaskIndex.load(conn)
+        for tags in TAG_SETS:
+            wanted = tags_to_mask(tags)
+            rows = conn.execute('SELECT recipe_id FROM recipe WHERE (restriction_mask & ?) = ? ORDER BY recipe_id',
+                                (wanted, wanted))
+            expected = [row[0] for row in rows]
+            assert index.matching(wanted) == expected
+            assert [recipe_id for recipe_id in index.recipe_ids if index.qualifies(recipe_id, wanted)] == expected
+
+
+def test_mask_index_updates():
+    index = MaskIndex()
+    index.set(1, 0b0011)
+    index.set(2, 0b0001)
+    assert index.matching(0b0001) == [1, 2]
+    index.set(2, 0b0111)
+    index.set(3, 0b0010)
+    assert index.matching(0b0010) == [1, 2, 3]
+    index.remove(1)
+    assert index.matching(0) == [2, 3]
+    assert index.positions == {2: 0, 3: 1}
+    index.set(3, 0b0100)
+    assert index.matching(0b0100) == [2, 3] and index.high_water == 3
+
+
+def recipe_form(tags):
+    return {'description': '', 'prep_time': 5, 'cook_time': 5, 'ingredients': 'salt', 'instructions': '',
+            'cuisine_type': 'Italian', 'tags[]': tags, 'recipe_image': (b'', '')}
+
+
+def test_restriction_index_follows_recipe_writes(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'u', 'u@test.com', 'pw')")
+        conn.commit()
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    vegan, gluten_free = tags_to_mask(['Vegan']), tags_to_mask(['Gluten-Free'])
+
+    db_client.post('/create-recipe', data=dict(recipe_form(['Vegan']), recipe_name='Stew'),
+                   content_type='multipart/form-data')
+    with app.app_context():
+        conn = get_db()
+        recipe_id = conn.execute("SELECT recipe_id FROM recipe WHERE recipe_name = 'Stew'").fetchone()[0]
+        assert get_restriction_index().get(conn).matching(vegan) == [recipe_id]
+
+    db_client.post('/edit-recipe/Stew', data=recipe_form(['Gluten-Free']), content_type='multipart/form-data')
+    with app.app_context():
+        index = get_restriction_index().get(get_db())
+        assert index.matching(vegan) == [] and index.matching(gluten_free) == [recipe_id]
+
+    db_client.delete('/delete-recipe/Stew')
+    with app.app_context():
+        assert len(get_restriction_index().get(get_db())) == 0
@@ -0,0 +1,56 @@
+from app import app
+from db import get_db
+from helpers import add_recipe
+from search import build_match_query, search_recipes
+
+
+def test_build_match_query_quotes_tokens():
+    assert build_match_query('chick pea') == '"chick"* "pea"*'
+    assert build_match_query('NEAR(" OR') == '"NEAR"* "OR"*'
+    assert build_match_query('  !! ') is None
+
+
+def test_search_matches_all_columns_with_ranking(db_client):
+    with app.app_context():
+        conn = get_db()
+        add_recipe(conn, 'Garlic Bread', description='Crunchy bread', ingredients=['bread', 'butter'])
+        add_recipe(conn, 'Tomato Soup', description='Goes well with garlic bread', ingredients=['tomato'])
+        add_recipe(conn, 'Fried Rice', instructions='Fry the rice', ingredients=['rice', 'garlic'])
+
+        names = [row['recipe_name'] for row in search_recipes(conn, 'garl')]
+        assert names[0] == 'Garlic Bread'
+        assert set(names) == {'Garlic Bread', 'Tomato Soup', 'Fried Rice'}
+
+        [row] = search_recipes(conn, 'tomato')
+        assert row['recipe_name'] == 'Tomato Soup'
+        assert '<mark>' in row['snippet']
+
+
+def test_search_index_follows_edits_and_deletes(db_client):
+    with app.app_context():
+        conn = get_db()
+        pancakes = add_recipe(conn, 'Pancakes', description='Fluffy', ingredients=['flour', 'egg'])
+        assert len(search_recipes(conn, 'flour')) == 1
+
+        conn.execute("UPDATE recipe SET recipe_description = 'Thin crepes' WHERE recipe_name = 'Pancakes'")
+        conn.commit()
+        assert search_recipes(conn, 'fluffy') == []
+        assert len(search_recipes(conn, 'crepes')) == 1
+
+        conn.execute("DELETE FROM ingredients WHERE recipe_id = ? AND ingredient_name = 'flour'", (pancakes,))
+        conn.commit()
+        assert search_recipes(conn, 'flour') == []
+        assert len(search_recipes(conn, 'egg')) == 1
+
+        conn.execute("DELETE FROM recipe WHERE recipe_name = 'Pancakes'")
+        conn.commit()
+        assert search_recipes(conn, 'crepes') == []
+
+
+def test_api_search_uses_full_text_index(db_client):
+    with app.app_context():
+        add_recipe(get_db(), 'Chana Masala', ingredients=['chickpeas', 'garam masala'])
+    response = db_client.get('/api/recipes?search=chickpea')
+    recipes = response.get_json()['recipes']
+    assert [r['recipe_name'] for r in recipes] == ['Chana Masala']
+    assert recipes[0]['avg_rating'] == 0
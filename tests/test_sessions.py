@@ -0,0 +1,91 @@
+import sqlite3
+import time
+
+from app import app, create_app, init_db
+from db import get_db
+from sessions import ServerSessionInterface, SQLiteSessionStore, auth_context, get_session_store
+
+
+def signup_and_login(client, username='cook'):
+    client.post('/signup', json={'username': username, 'email': f'{username}@test.com', 'password': 'pw'})
+    return client.post('/login', json={'username': username, 'password': 'pw'})
+
+
+def session_cookie(client):
+    return client.get_cookie('session').value
+
+
+def test_sessions_survive_a_restart_and_move_between_workers(tmp_path):
+    config = {'DATABASE': str(tmp_path / 'shared.db'), 'TESTING': True}
+    first, second = create_app(config), create_app(config)
+    init_db(first)
+    client = first.test_client()
+    assert signup_and_login(client).status_code == 200
+
+    other = second.test_client()
+    other.set_cookie('session', session_cookie(client))
+    assert other.get('/settings').status_code == 200
+    other.set_cookie('session', session_cookie(client)[:-2] + 'xx')
+    assert other.get('/settings').status_code == 302
+
+
+def test_sessions_stay_out_of_the_app_database(tmp_path):
+    application = create_app({'DATABASE': str(tmp_path / 'app.db'), 'TESTING': True})
+    init_db(application)
+    assert signup_and_login(application.test_client()).status_code == 200
+    tables = "SELECT name FROM sqlite_master WHERE name = 'sessions'"
+    assert sqlite3.connect(str(tmp_path / 'app.db')).execute(tables).fetchall() == []
+    assert sqlite3.connect(str(tmp_path / 'app-sessions.db')).execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 1
+
+
+def test_login_issues_a_new_id_and_logout_drops_it(db_client):
+    db_client.get('/')
+    with db_client.session_transaction() as sess:
+        sess['theme'] = 'dark'
+    before = session_cookie(db_client)
+    signup_and_login(db_client)
+    after = session_cookie(db_client)
+    assert after != before
+
+    store = get_session_store(app)
+    sid = after.rsplit('.', 1)[0]
+    assert store.get('session:' + sid) is not None
+    assert store.get('session:' + before.rsplit('.', 1)[0]) is None
+    db_client.get('/logout')
+    assert store.get('session:' + sid) is None
+
+
+def test_auth_context_is_cached_until_changed(db_client):
+    signup_and_login(db_client)
+    with app.test_request_context():
+        assert auth_context(1) == (False, [], 0)
+
+    with app.app_context():
+        # Written behind the app's back, so the cached context is not dropped
+        get_db().execute("INSERT INTO user_restrictions (User_ID, UserRestriction) VALUES (1, 'Vegan')")
+        get_db().commit()
+    with app.test_request_context():
+        assert auth_context(1).restrictions == []
+
+    db_client.post('/update_diet_restrictions', data={'diet[]': ['Vegan', 'Gluten-Free']})
+    db_client.post('/update_security_key', data={'security_key': 'admin'})
+    with app.test_request_context():
+        context = auth_context(1)
+    assert context.is_admin
+    assert sorted(context.restrictions) == ['Gluten-Free', 'Vegan']
+    assert db_client.get('/api/cache-stats').status_code == 200
+
+
+def test_expired_entries_are_swept(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    store.set('session:old', '{}', ttl=-1)
+    store.set('session:new', '{}', ttl=60)
+    assert store.get('session:old') is None
+    assert store.sweep() == 1
+    assert store.get('session:new') == '{}'
+
+    interface = ServerSessionInterface(store)
+    interface._last_sweep = time.monotonic() - app.config['SESSION_SWEEP_INTERVAL']
+    store.set('session:gone', '{}', ttl=-1)
+    interface._maybe_sweep(app)
+    assert store.sweep() == 0
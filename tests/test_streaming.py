@@ -0,0 +1,87 @@
+import json
+import tracemalloc
+
+import pytest
+
+from app import app
+from cache import get_cache
+from db import get_db
+from helpers import add_recipe
+
+
+@pytest.fixture
+def catalog(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        for i in range(250):
+            add_recipe(conn, f'Recipe {i}', description=f'Stew number {i}' if i % 2 else 'Salad')
+        conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (1, ?, ?)',
+                         [(recipe_id, recipe_id % 6) for recipe_id in range(1, 251)])
+        conn.commit()
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return db_client
+
+
+def names(recipes):
+    return [recipe['recipe_name'] for recipe in recipes]
+
+
+@pytest.mark.parametrize('url', ['/api/recipes?fields=recipe_name', '/api/recipes?search=stew&fields=recipe_name',
+                                 '/api/recommended?fields=recipe_name'])
+def test_streams_match_the_paged_listing(catalog, url):
+    paged = []
+    cursor = None
+    while True:
+        data = catalog.get(url + '&limit=100' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        paged += data['recipes']
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert len(paged) > 100
+
+    streamed = catalog.get(url + '&stream=json')
+    assert streamed.is_streamed
+    assert streamed.get_json() == {'recipes': paged, 'next_cursor': None}
+
+    lines = catalog.get(url + '&stream=ndjson')
+    assert lines.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in lines.data.splitlines()] == paged
+
+    after_first = catalog.get(url + '&limit=1').get_json()['next_cursor']
+    limited = catalog.get(url + f'&stream=ndjson&limit=150&cursor={after_first}').data.splitlines()
+    assert names(json.loads(line) for line in limited) == names(paged[1:151])
+
+
+def test_streams_are_not_cached(catalog):
+    get_cache(app).clear()
+    catalog.get('/api/recipes?stream=json')
+    assert get_cache(app).stats()['entries'] == 0
+    assert catalog.get('/api/recipes?search=zzz&stream=json').get_json() == {'recipes': [], 'next_cursor': None}
+    assert catalog.get('/api/recipes?stream=xml').status_code == 400
+
+
+def streamed_peak(client, url):
+    """Bytes sent and peak traced memory while reading a streamed response chunk by chunk."""
+    tracemalloc.start()
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak
+
+
+def test_stream_memory_does_not_grow_with_the_result(db_client):
+    with app.app_context():
+        conn = get_db()
+        for i in range(3000):
+            add_recipe(conn, f'Recipe {i}', instructions='x' * 1000)
+
+    streamed_peak(db_client, '/api/recipes?stream=ndjson&limit=500')  # first-request setup
+    small, small_peak = streamed_peak(db_client, '/api/recipes?stream=ndjson&limit=500')
+    large, large_peak = streamed_peak(db_client, '/api/recipes?stream=ndjson')
+    assert large == pytest.approx(6 * small, rel=0.01)
+    assert large_peak < 1.5 * small_peak
+    assert large_peak < large / 2
@@ -0,0 +1,104 @@
+import random
+import sqlite3
+
+from app import app
+from benchmarks.generate_data import ADJECTIVES, DISHES, INGREDIENTS
+from cache import invalidate
+from db import get_db
+from helpers import add_recipe
+from suggest import SuggestIndex, fold, word_keys
+
+
+def test_word_keys_start_at_every_word():
+    assert fold('  Spicy   Chicken-Curry!') == 'spicy chicken curry'
+    assert word_keys('Spicy Chicken Curry') == ['spicy chicken curry', 'chicken curry', 'curry']
+
+
+def seeded(recipes=600):
+    """In-memory database with recipes, ingredients, cuisines and skewed rating counts."""
+    rng = random.Random(5)
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE cuisine (Cuisine_ID TEXT PRIMARY KEY);
+        CREATE TABLE recipe (recipe_id INTEGER PRIMARY KEY, recipe_name TEXT, Cuisine_ID TEXT);
+        CREATE TABLE recipe_rating_stats (recipe_id INTEGER PRIMARY KEY, rating_count INTEGER);
+        CREATE TABLE ingredients (recipe_id INTEGER, ingredient_name TEXT, ingredient_key TEXT);
+    ''')
+    conn.executemany('INSERT INTO cuisine VALUES (?)', [('Italian',), ('Indian',), ('Greek',)])
+    for recipe_id in range(1, recipes + 1):
+        add_seeded(conn, rng, recipe_id)
+    return conn, rng
+
+
+def add_seeded(conn, rng, recipe_id):
+    name = f'{rng.choice(ADJECTIVES)} {rng.choice(INGREDIENTS).title()} {rng.choice(DISHES)} {recipe_id}'
+    conn.execute('INSERT INTO recipe VALUES (?, ?, ?)', (recipe_id, name, rng.choice(['Italian', 'Indian', 'Greek'])))
+    if rng.random() < 0.7:
+        conn.execute('INSERT INTO recipe_rating_stats VALUES (?, ?)', (recipe_id, int(rng.paretovariate(1.2))))
+    conn.executemany('INSERT INTO ingredients VALUES (?, ?, NULL)', [(recipe_id, name) for name in rng.sample(INGREDIENTS, 5)])
+
+
+def brute_force(conn, text, limit):
+    popularity = {}
+    for recipe_id, name, cuisine, count in conn.execute('''
+            SELECT r.recipe_id, recipe_name, Cuisine_ID, COALESCE(rating_count, 0)
+            FROM recipe r LEFT JOIN recipe_rating_stats s ON s.recipe_id = r.recipe_id'''):
+        popularity[('recipe', name)] = count
+        popularity[('cuisine', cuisine)] = popularity.get(('cuisine', cuisine), 0) + count
+        for (ingredient,) in conn.execute('SELECT ingredient_name FROM ingredients WHERE recipe_id = ?', (recipe_id,)):
+            popularity[('ingredient', ingredient)] = popularity.get(('ingredient', ingredient), 0) + count
+    prefix = fold(text)
+    found = [(kind, name, count) for (kind, name), count in popularity.items()
+             if any(key.startswith(prefix) for key in word_keys(name))]
+    return sorted(found, key=lambda row: (-row[2], row[1].lower()))[:limit]
+
+
+QUERIES = ['s', 'sp', 'spicy', 'spicy c', 'ita', 'garlic', 'curry 1', 'oil', 'zzz', 'Chicken Th']
+
+
+def test_suggestions_rank_by_popularity_like_a_scan():
+    conn, _ = seeded()
+    index = SuggestIndex.load(conn, limit=8, heavy_size=16)
+    assert index.heavy  # short prefixes are served from the precomputed lists
+    for query in QUERIES:
+        assert index.suggest(query) == brute_force(conn, query, 8), query
+
+
+def test_extend_matches_a_fresh_load():
+    conn, rng = seeded(400)
+    index = SuggestIndex.load(conn, limit=8, heavy_size=16)
+    for recipe_id in range(401, 461):
+        add_seeded(conn, rng, recipe_id)
+    assert index.extend(conn) == 60
+    fresh = SuggestIndex.load(conn, limit=8, heavy_size=16)
+    assert index.keys == fresh.keys
+    for query in QUERIES:
+        assert index.suggest(query) == fresh.suggest(query) == brute_force(conn, query, 8), query
+
+
+def test_suggest_endpoint(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'user{i}', f'user{i}@test.com', 'pw') for i in range(1, 4)])
+        quiet = add_recipe(conn, 'Tomato Tart', ingredients=['Tomatoes', 'flour'])
+        popular = add_recipe(conn, 'Roast Tomato Soup', ingredients=['tomato', 'onion'])
+        conn.executemany('INSERT INTO rates (User_ID, recipe_id, user_rating) VALUES (?, ?, 5)',
+                         [(1, popular), (2, popular), (3, quiet)])
+        conn.commit()
+
+    found = db_client.get('/api/suggest?q=tom').get_json()['suggestions']
+    assert found == [
+        {'type': 'ingredient', 'text': 'Tomatoes', 'popularity': 3},
+        {'type': 'recipe', 'text': 'Roast Tomato Soup', 'popularity': 2},
+        {'type': 'recipe', 'text': 'Tomato Tart', 'popularity': 1},
+    ]
+    assert db_client.get('/api/suggest?q=tom&limit=1').get_json()['suggestions'][0]['text'] == 'Tomatoes'
+    assert db_client.get('/api/suggest?q=').get_json() == {'suggestions': []}
+
+    with app.app_context():
+        add_recipe(get_db(), 'Tomatillo Salsa')
+        # add_recipe skips create_recipe, so bump the version that would have
+        invalidate('recipes')
+    texts = [item['text'] for item in db_client.get('/api/suggest?q=tomati').get_json()['suggestions']]
+    assert texts == ['Tomatillo Salsa']
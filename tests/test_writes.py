@@ -0,0 +1,169 @@
+import sqlite3
+import threading
+
+import pytest
+
+from app import app, create_app, init_db
+from db import get_db
+from helpers import add_recipe
+from writes import WriteQueueFull, get_writer
+
+
+@pytest.fixture
+def writer_app(tmp_path):
+    application = create_app({'DATABASE': str(tmp_path / 'writes.db'), 'TESTING': True, 'WRITE_BATCH_WAIT': 0.2})
+    init_db(application)
+    with application.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(i, f'cook{i}', f'cook{i}@test.com', 'pw') for i in range(1, 13)])
+        add_recipe(conn, 'Soup')
+    yield application
+    get_writer(application).shutdown()
+
+
+def in_threads(count, target):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_ratings_commit_in_shared_batches(writer_app):
+    statuses = []
+
+    def rate(i):
+        with writer_app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = i + 1
+            statuses.append(client.post('/rate-recipe', json={'recipe_name': 'Soup', 'rating': i % 5 + 1}).status_code)
+
+    in_threads(12, rate)
+    assert statuses == [200] * 12
+    with writer_app.app_context():
+        stats = get_db().execute('SELECT rating_count FROM recipe_rating_stats').fetchone()
+    assert stats['rating_count'] == 12
+    writes = get_writer(writer_app).stats()
+    assert writes['committed'] == 12
+    assert writes['batches'] < 12
+    assert writes['largest_batch'] > 1
+
+
+def test_a_failing_write_is_rolled_back_alone(writer_app):
+    writer = get_writer(writer_app)
+    errors = {}
+
+    def insert(i):
+        # Account 3 already exists, so that insert breaks the primary key
+        account_id = 3 if i == 0 else 100 + i
+        try:
+            writer.submit(lambda conn: conn.execute("INSERT INTO account (id, username, email, password) "
+                                                    "VALUES (?, ?, ?, 'pw')", (account_id, f'new{i}', f'new{i}@test.com')))
+        except sqlite3.IntegrityError as e:
+            errors[i] = e
+
+    in_threads(6, insert)
+    assert list(errors) == [0]
+    with writer_app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM account WHERE id > 100').fetchone()[0] == 5
+    assert writer.stats()['failed'] == 1
+
+
+def test_a_full_queue_answers_503(tmp_path):
+    busy = create_app({'DATABASE': str(tmp_path / 'busy.db'), 'TESTING': True,
+                       'WRITE_QUEUE_MAX': 1, 'WRITE_QUEUE_WAIT': 0})
+    init_db(busy)
+    writer = get_writer(busy)
+    started, release = threading.Event(), threading.Event()
+
+    def hold(conn):
+        started.set()
+        release.wait()
+
+    holders = [threading.Thread(target=writer.submit, args=(hold,))]
+    holders[0].start()
+    started.wait()
+    # Waits in the queue behind the held batch, filling it
+    holders.append(threading.Thread(target=writer.submit, args=(lambda conn: None,)))
+    holders[1].start()
+    try:
+        while writer.stats()['depth'] < 1:
+            pass
+        with pytest.raises(WriteQueueFull):
+            writer.submit(lambda conn: None)
+        with busy.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            response = client.post('/change_email', data={'email': 'new@test.com'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        for holder in holders:
+            holder.join()
+    assert writer.stats()['rejected'] == 2
+    writer.shutdown()
+
+
+def test_an_unexpected_error_releases_the_connection(tmp_path, monkeypatch):
+    application = create_app({'DATABASE': str(tmp_path / 'writes.db'), 'TESTING': True})
+    init_db(application)
+    writer = get_writer(application)
+    opened = []
+
+    def broken(conn, batch):
+        conn.execute('BEGIN IMMEDIATE')
+        opened.append(conn)
+        raise RuntimeError('not a database error')
+
+    monkeypatch.setattr(writer, '_commit', broken)
+    with pytest.raises(RuntimeError):
+        writer.submit(lambda conn: None)
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[0].execute('SELECT 1')  # closed, so its write lock is gone
+    monkeypatch.undo()
+    conn = sqlite3.connect(str(tmp_path / 'writes.db'), timeout=0)
+    conn.execute('BEGIN IMMEDIATE')
+    conn.rollback()
+    conn.close()
+    writer.submit(lambda conn: conn.execute("INSERT INTO account (username, email, password) VALUES ('c', 'c@t', 'pw')"))
+    writer.shutdown()
+
+
+def test_renaming_an_admin_moves_their_admin_row(db_client):
+    with app.app_context():
+        conn = get_db()
+        conn.executemany('INSERT INTO account (id, username, email, password) VALUES (?, ?, ?, ?)',
+                         [(1, 'boss', 'boss@test.com', 'pw'), (2, 'cook', 'cook@test.com', 'pw')])
+        conn.execute("INSERT INTO admin (Account_ID, admin_name) VALUES (1, 'boss')")
+        conn.commit()
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    assert db_client.post('/change_username', data={'username': 'chef'}).status_code == 200
+    assert db_client.post('/change_username', data={'username': 'cook'}).status_code == 500
+
+    with app.app_context():
+        conn = get_db()
+        assert conn.execute('SELECT admin_name FROM admin WHERE Account_ID = 1').fetchone()[0] == 'chef'
+        assert conn.execute('PRAGMA foreign_key_check').fetchall() == []
+
+
+def test_settings_writes_go_through_the_writer(db_client):
+    with app.app_context():
+        get_db().execute("INSERT INTO account (id, username, email, password) VALUES (1, 'cook', 'cook@test.com', 'pw')")
+        get_db().commit()
+    with db_client.session_transaction() as sess:
+        sess['user_id'] = 1
+    before = get_writer(app).stats()['committed']
+    assert db_client.post('/change_username', data={'username': 'chef'}).status_code == 200
+    assert db_client.post('/change_email', data={'email': 'chef@test.com'}).status_code == 200
+    with app.app_context():
+        row = get_db().execute('SELECT username, email FROM account WHERE id = 1').fetchone()
+    assert tuple(row) == ('chef', 'chef@test.com')
+    assert get_writer(app).stats()['committed'] == before + 2
+
+    db_client.post('/update_security_key', data={'security_key': 'admin'})
+    metrics = db_client.get('/metrics').get_data(as_text=True)
+    assert 'tastely_db_writer{stat="depth"} 0' in metrics
+    assert 'tastely_db_writer{stat="batches_le_1"}' in metrics
@@ -0,0 +1,214 @@
+"""One writer thread that groups the app's small writes into shared transactions.
+
+SQLite lets one connection write at a time. When each request thread ran
+its own write transaction, concurrent ratings and cookbook toggles waited on
+each other's locks, and once busy_timeout ran out they failed with
+"database is locked", which the routes answered with a 500. Routes now pass
+a write to submit_write() as a function of a connection. The function must
+not commit, and it may run twice, as explained below. A single writer thread
+takes whatever writes are queued, up to WRITE_BATCH_MAX of them, and runs
+them in one BEGIN IMMEDIATE transaction with a single commit. Each write runs under a SAVEPOINT, so one that raises
+is rolled back alone and its caller gets the exception. If the commit itself
+fails, the batch is run again with one write per transaction, so only the
+write at fault reports the error.
+
+The caller blocks until its batch has committed, so a response still means
+the write is on disk. Reads keep using their own pool connections and see
+the last commit through WAL without waiting for the writer. The writer never
+holds a batch open waiting for it to fill: it takes what queued up during
+the previous commit, plus whatever arrives within WRITE_BATCH_WAIT seconds.
+Light load therefore commits each write at once, and under heavy load the
+batches grow by themselves. At most WRITE_QUEUE_MAX writes may wait. Past
+that, submit_write() waits WRITE_QUEUE_WAIT seconds for room and then raises
+WriteQueueFull, which is answered with a 503. stats() reports queue depth and
+batch sizes, and /metrics exports them.
+"""
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+from db import get_pool
+from passwords import busy_response
+
+# Upper bounds of the batch size histogram in stats()
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class WriteQueueFull(Exception):
+    """Raised when the write queue stays full for WRITE_QUEUE_WAIT seconds."""
+
+
+class _Write:
+    __slots__ = ('function', 'args', 'context', 'done', 'result', 'error')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        # The caller's request context, so its statements are profiled as part of that request
+        self.context = contextvars.copy_context()
+        self.done = threading.Event()
+        self.result = self.error = None
+
+
+class Writer:
+    def __init__(self, app):
+        self.app = app
+        self._queue = queue.Queue(maxsize=app.config['WRITE_QUEUE_MAX'])
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'committed': 0, 'failed': 0, 'rejected': 0, 'batches': 0,
+                       'largest_batch': 0, 'peak_depth': 0, 'split_batches': 0}
+        self._batch_sizes = [0] * (len(BATCH_BUCKETS) + 1)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            sizes = list(self._batch_sizes)
+        stats['depth'] = self._queue.qsize()
+        done = stats['committed'] + stats['failed']
+        stats['mean_batch'] = round(done / stats['batches'], 2) if stats['batches'] else 0
+        for bound, count in zip(BATCH_BUCKETS, sizes):
+            stats[f'batches_le_{bound}'] = count
+        stats['batches_le_inf'] = sizes[-1]
+        return stats
+
+    def _bump(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _ensure_thread(self):
+        # A worker forked from a process that had the thread starts its own
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, function, *args):
+        """Run ``function(conn, *args)`` on the writer thread and return its result once committed."""
+        write = _Write(function, args)
+        self._ensure_thread()
+        try:
+            self._queue.put(write, timeout=self.app.config['WRITE_QUEUE_WAIT'])
+        except queue.Full:
+            self._bump('rejected')
+            raise WriteQueueFull('Too many writes queued; try again shortly') from None
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['peak_depth'] = max(self._stats['peak_depth'], self._queue.qsize())
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _take_batch(self, first):
+        batch = [first]
+        limit = self.app.config['WRITE_BATCH_MAX']
+        deadline = time.monotonic() + self.app.config['WRITE_BATCH_WAIT']
+        while len(batch) < limit:
+            try:
+                remaining = deadline - time.monotonic()
+                write = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if write is None:
+                self._queue.put(None)  # seen again by _run once this batch is done
+                break
+            batch.append(write)
+        return batch
+
+    def _run(self):
+        conn = database = None
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._take_batch(first)
+            try:
+                pool = get_pool(self.app)
+                if conn is None or database != pool.database:
+                    if conn is not None:
+                        conn.close()
+                    # Its own connection, so it never waits on a request for one from the pool
+                    conn, database = pool.connect(), pool.database
+                if not self._commit(conn, batch):
+                    self._bump('split_batches')
+                    for write in batch:
+                        self._commit(conn, [write])
+            except Exception as e:  # keep the thread alive; the batch's callers get the error
+                if conn is not None:
+                    # Drop the connection without leaving a transaction open on it
+                    try:
+                        if conn.in_transaction:
+                            conn.rollback()
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                conn = None
+                for write in batch:
+                    write.error = write.error or e
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+                self._batch_sizes[next((i for i, bound in enumerate(BATCH_BUCKETS) if len(batch) <= bound),
+                                       len(BATCH_BUCKETS))] += 1
+            for write in batch:
+                self._bump('failed' if write.error is not None else 'committed')
+                write.done.set()
+        if conn is not None:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        """Run ``batch`` in one transaction; False when it could not commit and was rolled back."""
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for write in batch:
+                conn.execute('SAVEPOINT write')
+                try:
+                    write.result, write.error = write.context.run(write.function, conn, *write.args), None
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write')
+                    write.error = e
+                conn.execute('RELEASE write')
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if len(batch) > 1:
+                return False
+            batch[0].error = e
+            return True
+
+    def shutdown(self):
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(None)
+            thread.join()
+        self._thread = None
+
+
+def get_writer(app=None):
+    return (app or current_app).extensions['db_writer']
+
+
+def submit_write(function, *args):
+    """Run ``function(conn, *args)`` in the app's next write batch; returns its result after the commit."""
+    return get_writer().submit(function, *args)
+
+
+def init_app(app):
+    app.config.setdefault('WRITE_BATCH_MAX', 64)
+    app.config.setdefault('WRITE_BATCH_WAIT', 0.0)
+    app.config.setdefault('WRITE_QUEUE_MAX', 1024)
+    app.config.setdefault('WRITE_QUEUE_WAIT', 1.0)
+    app.extensions['db_writer'] = Writer(app)
+    app.register_error_handler(WriteQueueFull, busy_response)